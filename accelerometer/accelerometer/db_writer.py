@@ -4,7 +4,8 @@ from threading import Thread, Event
 from accelerometer.accel import SMBusAccelerometer
 from accelerometer.constants import GRAVITY_UPDATE_FREQUENCY
 from accelerometer.models import AccelerometerData
-from utilities.db_utilities import session_scope
+from utilities import common_constants
+from utilities.db_utilities import session_scope, SensorHeartbeat
 
 
 class AccelDbWriter(Thread):
@@ -33,6 +34,11 @@ class AccelDbWriter(Thread):
                 try:
                     records = self._queue.get(timeout=1)
                     session.bulk_insert_mappings(AccelerometerData, records)
+                    SensorHeartbeat.record(
+                        session,
+                        common_constants.ACCELEROMETER_DATA_TABLE,
+                        (record["timestamp"] for record in records),
+                    )
 
                     # Every now and then recalculate gravity.
                     gravity_update_counter += 1
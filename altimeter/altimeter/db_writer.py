@@ -1,7 +1,8 @@
 from queue import Queue, Empty
 from threading import Thread, Event
 
-from utilities.db_utilities import session_scope
+from utilities import common_constants
+from utilities.db_utilities import session_scope, AltimeterMinute, SensorHeartbeat
 
 
 class AltimDbWriter(Thread):
@@ -27,6 +28,10 @@ class AltimDbWriter(Thread):
                 try:
                     record = self._queue.get(timeout=1)
                     session.add(record)
+                    SensorHeartbeat.record(
+                        session, common_constants.ALTIMETER_DATA_TABLE, [record.timestamp]
+                    )
+                    AltimeterMinute.record(session, [record])
                     session.commit()
                 except Empty:
                     pass
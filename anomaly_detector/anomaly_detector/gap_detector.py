@@ -14,6 +14,18 @@ from utilities.db_utilities import engine
 from utilities.misc_utilities import MiscUtilities
 
 
+# Seconds with data are read from sensor_heartbeats rather than the sensor table.  Only the first and
+# last sample of each second matter: any two samples in between are less than a second apart, which is
+# less than MIN_GAP_SIZE.  Samples outside the interval are clipped to its ends.
+heartbeats_in_interval = """
+  FROM sensor_heartbeats
+  WHERE sensor = :sensor
+    AND second >= date_trunc('second', CAST(:start_of_interval AS TIMESTAMP))
+    AND second < :end_of_interval
+    AND last_sample > :start_of_interval
+    AND first_sample < :end_of_interval
+"""
+
 find_gaps_in_data = """
 WITH data_with_sentinels AS
 (                                                -- We include an N second overlap with the previous time interval
@@ -26,11 +38,14 @@ WITH data_with_sentinels AS
     TRUE as sentinel
   UNION
   SELECT
-    timestamp,                                   -- Accelerometer (or altimeter) data during that interval
+    GREATEST(first_sample, :start_of_interval) as timestamp,     -- Accelerometer (or altimeter) data during that interval
+    FALSE as sentinel
+  {0}
+  UNION
+  SELECT
+    LEAST(last_sample, :end_of_interval) as timestamp,
     FALSE as sentinel
-  FROM {0}
-  WHERE timestamp > :start_of_interval
-    AND timestamp < :end_of_interval
+  {0}
 ),
 lag_data AS
 (
@@ -41,7 +56,15 @@ lag_data AS
   FROM data_with_sentinels
 )
 SELECT * FROM lag_data WHERE gap >= INTERVAL :min_gap_size ORDER BY timestamp ASC LIMIT 1;  -- Find all N+ second gaps
-"""
+""".format(heartbeats_in_interval)
+
+find_end_of_gap = """
+SELECT second, first_sample, last_sample
+{0}
+ORDER BY second ASC
+LIMIT 1
+""".format(heartbeats_in_interval)
+
 # TODO: An improvement would be to go back to the most recent timestamp before :start_of_interval to be more accurate.
 
 
@@ -88,9 +111,8 @@ class GapProcessor:
             if self.is_sensor_running[sensor_table]:
                 with engine.connect() as con:
                     row = con.execute(
-                        text(
-                            find_gaps_in_data.format(sensor_table)
-                        ),  # Can't use table name in text param
+                        text(find_gaps_in_data),
+                        sensor=sensor_table,
                         start_of_interval=next_start_timestamp,
                         end_of_interval=end_of_window,
                         min_gap_size="{0} seconds".format(constants.MIN_GAP_SIZE),
@@ -114,34 +136,55 @@ class GapProcessor:
             if not self.is_sensor_running[
                 sensor_table
             ]:  # The above code will fall through here if it finds a gap.
-                with engine.connect() as con:
-                    query_string = (
-                        "SELECT COUNT(*) as samples_after_gap, MIN(timestamp) as recovery_time "
-                        + "FROM {0} ".format(sensor_table)
-                        + "WHERE timestamp > :start_of_interval "
-                        + "AND timestamp < :end_of_interval  -- stop at end of window for testing purposes"
-                    )
-                    row = con.execute(
-                        text(query_string),
-                        start_of_interval=next_start_timestamp,
-                        end_of_interval=end_of_window,
-                    ).fetchone()
-                    if row["samples_after_gap"] > 0:
-                        logger.debug(
-                            "Detected end of gap in {0} starting at {1}".format(
-                                sensor_table, row["recovery_time"]
-                            )
-                        )
-                        self._create_event(
-                            GapProcessor.get_event_type(sensor_table),
-                            common_constants.EVENT_SUBTYPE_GAP_END,
-                            row["recovery_time"],
+                recovery_time = self._find_first_sample(
+                    sensor_table, next_start_timestamp, end_of_window
+                )
+                if recovery_time is not None:
+                    logger.debug(
+                        "Detected end of gap in {0} starting at {1}".format(
+                            sensor_table, recovery_time
                         )
-                        self.is_sensor_running[sensor_table] = True
-                        next_start_timestamp = row["recovery_time"]
-                    else:
-                        # We've scanned the entire window and found no data, so quit.
-                        next_start_timestamp = end_of_window
+                    )
+                    self._create_event(
+                        GapProcessor.get_event_type(sensor_table),
+                        common_constants.EVENT_SUBTYPE_GAP_END,
+                        recovery_time,
+                    )
+                    self.is_sensor_running[sensor_table] = True
+                    next_start_timestamp = recovery_time
+                else:
+                    # We've scanned the entire window and found no data, so quit.
+                    next_start_timestamp = end_of_window
+
+    def _find_first_sample(self, sensor_table, start_of_interval, end_of_interval):
+        """
+        Returns the timestamp of the first sample after start_of_interval and before end_of_interval,
+        None if there isn't one.
+        """
+        with engine.connect() as con:
+            heartbeat = con.execute(
+                text(find_end_of_gap),
+                sensor=sensor_table,
+                start_of_interval=start_of_interval,
+                end_of_interval=end_of_interval,
+            ).fetchone()
+            if heartbeat is None:
+                return None
+            if heartbeat["first_sample"] > start_of_interval:
+                return heartbeat["first_sample"]
+            # The interval starts in the middle of this second, only the sensor table knows which of
+            # its samples comes next.  That's at most one second of data.
+            return con.execute(
+                text(
+                    "SELECT MIN(timestamp) FROM {0} "
+                    "WHERE timestamp > :start_of_interval "
+                    "AND timestamp < :end_of_interval "
+                    "AND timestamp < :end_of_second".format(sensor_table)
+                ),
+                start_of_interval=start_of_interval,
+                end_of_interval=end_of_interval,
+                end_of_second=heartbeat["second"] + timedelta(seconds=1),
+            ).scalar()
 
     def _update_gap_status(self):
         (
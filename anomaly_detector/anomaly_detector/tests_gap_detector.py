@@ -10,7 +10,7 @@ from freezegun import freeze_time
 import anomaly_detector.constants as constants
 from anomaly_detector.gap_detector import GapProcessor
 from utilities import common_constants
-from utilities.db_utilities import engine
+from utilities.db_utilities import engine, session_scope, SensorHeartbeat
 from utilities.test_utilities import TestUtilities
 
 
@@ -24,6 +24,7 @@ class TestGapDetector(unittest.TestCase):
         with engine.connect() as con:
             con.execute("DELETE FROM accelerometer_data;")
             con.execute("DELETE FROM altimeter_data;")
+            con.execute("DELETE FROM sensor_heartbeats;")
             con.execute("DELETE FROM trips;")  # We need to delete ALL trips
             con.execute("DELETE FROM events;")
 
@@ -88,6 +89,11 @@ class TestGapDetector(unittest.TestCase):
                 )
                 t = t + interval
             trans.commit()
+        self.update_heartbeats(table)
+
+    def update_heartbeats(self, table):
+        with session_scope() as session:
+            SensorHeartbeat.rebuild(session, table)
 
     def create_gap(self, table, start_time, end_time):
         with engine.connect() as con:
@@ -97,6 +103,7 @@ class TestGapDetector(unittest.TestCase):
                 )
             )
             con.execute(query, start_time=start_time, end_time=end_time)
+        self.update_heartbeats(table)
 
     def test_update_gap_status_no_events(self):
         gd = GapProcessor()
@@ -541,6 +548,94 @@ class TestGapDetector(unittest.TestCase):
             gd._check_for_gaps(sensor_table, start_of_window)
             self.assertGreater(self.get_event_count(), 10)
 
+    def test_heartbeats_match_sensor_data(self):
+        end_time = datetime.now()
+        start_time = end_time - timedelta(seconds=10)
+        timestamps = [start_time + timedelta(seconds=0.3 * i) for i in range(30)]
+        with session_scope() as session:
+            # Out of order and in two batches, like two writes landing in the same second.
+            SensorHeartbeat.record(session, constants.ALTIMETER_TABLE, timestamps[15:])
+            SensorHeartbeat.record(session, constants.ALTIMETER_TABLE, reversed(timestamps[:15]))
+        with engine.connect() as con:
+            rows = con.execute(
+                "SELECT second, first_sample, last_sample FROM sensor_heartbeats ORDER BY second"
+            ).fetchall()
+        expected = {}
+        for t in timestamps:
+            second = t.replace(microsecond=0)
+            first, last = expected.get(second, (t, t))
+            expected[second] = (min(first, t), max(last, t))
+        self.assertEqual(
+            [(r["second"], r["first_sample"], r["last_sample"]) for r in rows],
+            [(second,) + expected[second] for second in sorted(expected)],
+        )
+
+    def test_gaps_come_from_heartbeats(self):
+        sensor_table = constants.ACCELEROMETER_TABLE
+        end_time = datetime.now()
+        start_time = end_time - timedelta(seconds=30)
+        self.create_sensor_data(
+            sensor_table,
+            start_time - timedelta(seconds=4),
+            end_time,
+            timedelta(seconds=0.01),
+        )
+        gap_start = start_time + timedelta(seconds=10)
+        gap_end = gap_start + timedelta(seconds=5)
+        self.create_gap(sensor_table, gap_start, gap_end)
+        with engine.connect() as con:
+            heartbeats = con.execute(
+                "SELECT COUNT(*) FROM sensor_heartbeats WHERE sensor = %s", sensor_table
+            ).scalar()
+            # The sensor table only needs to be read for the second the gap ends in.
+            con.execute(
+                text(
+                    "DELETE FROM accelerometer_data "
+                    "WHERE timestamp < :gap_end OR timestamp > :gap_end + INTERVAL '1 second'"
+                ),
+                gap_end=gap_end,
+            )
+        # 100 samples a second, but only one heartbeat per second.
+        self.assertLessEqual(heartbeats, 36)
+        gd = GapProcessor()
+        gd._check_for_gaps(sensor_table, start_time)
+        self.assertEqual(self.get_event_count(), 2)
+        self.verify_event(
+            GapProcessor.get_event_type(sensor_table),
+            common_constants.EVENT_SUBTYPE_GAP_START,
+            gap_start,
+        )
+        self.verify_event(
+            GapProcessor.get_event_type(sensor_table),
+            common_constants.EVENT_SUBTYPE_GAP_END,
+            gap_end,
+        )
+
+    def test_end_of_gap_in_the_middle_of_a_second(self):
+        sensor_table = constants.ALTIMETER_TABLE
+        gap_end = datetime.now().replace(microsecond=0) - timedelta(seconds=5)
+        samples = [
+            gap_end - timedelta(seconds=10),
+            gap_end + timedelta(seconds=0.2),
+            gap_end + timedelta(seconds=0.6),
+            gap_end + timedelta(seconds=0.9),
+        ]
+        with session_scope() as session:
+            SensorHeartbeat.record(session, sensor_table, samples)
+            session.execute(
+                text("INSERT INTO altimeter_data (timestamp) VALUES (:t)"),
+                [{"t": t} for t in samples],
+            )
+        gd = GapProcessor()
+        # Same as the old scan of the sensor table: the first sample after the start, not the first in its second.
+        self.assertEqual(
+            gd._find_first_sample(sensor_table, samples[1], datetime.now()), samples[2]
+        )
+        self.assertEqual(
+            gd._find_first_sample(sensor_table, samples[0], datetime.now()), samples[1]
+        )
+        self.assertIsNone(gd._find_first_sample(sensor_table, samples[3], datetime.now()))
+
 
 if __name__ == "__main__":
     unittest.main()
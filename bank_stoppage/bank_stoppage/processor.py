@@ -24,9 +24,8 @@ WITH trip_info AS (SELECT
   (SELECT COALESCE(MAX(bank_elevators), 8)
      FROM bank_trips
     WHERE timestamp > ({last_trip_time_plus_delay_sql})) AS bank_elevators_count,
-  (SELECT COUNT(*)
-     FROM trips
-    WHERE start_time > {two_weeks_ago_sql}) AS our_trips_2weeks_count
+  (SELECT count_trips(CAST({two_weeks_ago_sql} AS TIMESTAMP) + INTERVAL '1 microsecond', 'infinity')
+  ) AS our_trips_2weeks_count
 )
   SELECT bank_trips_since_last_trip,
          bank_trips_2weeks_count,
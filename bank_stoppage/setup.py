@@ -7,15 +7,10 @@ with open('requirements.txt') as f:
 
 setup(name='liftai-bankstoppage',
       version='0.0.1',
-      description=("LiftAi bank based stoppage application",
+      description=("LiftAi bank based stoppage detector, run by stoppagerunner",
                    "do the processing for detecting if a elevator has stopped"
                    "working within a bank of elevators")[0],
       packages=find_packages(),
-      entry_points={
-          'console_scripts': [
-              'bankstoppage = bank_stoppage.main:main',
-          ]
-      },
       install_requires=requirements,
       classifiers=(
           'Intended Audience :: Other Audience',
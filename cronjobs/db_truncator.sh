@@ -3,10 +3,13 @@
 dbname=liftaidb
 accel_table=accelerometer_data
 altim_table=altimeter_data
+heartbeats_table=sensor_heartbeats
+altim_minutes_table=altimeter_minutes
 audio_table=audio
 accelerations_table=accelerations
 data_to_send_table=data_to_send
 trips_table=trips
+trips_in_progress_table=trips_in_progress
 bank_trips_table=bank_trips
 events_table=events
 problems_table=problems
@@ -15,10 +18,13 @@ roa_watch_table=roa_watch_requests
 escalator_table=escalator_vibration
 interval_to_del_accel='1 hour'
 interval_to_del_altime='4 hours'
+interval_to_del_heartbeats='4 hours'
+interval_to_del_altim_minutes='6 weeks'
 interval_to_del_audio='2 hours'
 interval_to_del_accelerations='1 year'
 interval_to_del_data_to_send='12 hours'
 interval_to_del_trips='1 year'
+interval_to_del_trips_in_progress='1 day'
 interval_to_del_bank_trips='3 months'
 interval_to_del_escalator='3 months'
 
@@ -29,8 +35,8 @@ print_number_of_rows () {
 
 delete_outdated_rows () {
     print_number_of_rows $1
-    echo "$(date) exec sql: DELETE FROM $1 WHERE $3 < NOW() - INTERVAL '$2';"
-    sudo -u postgres psql -qtAX -d $dbname -c "DELETE FROM $1 WHERE $3 < NOW() - INTERVAL '$2';"
+    echo "$(date) exec sql: DELETE FROM $1 WHERE $3 < NOW() - INTERVAL '$2' $4;"
+    sudo -u postgres psql -qtAX -d $dbname -c "DELETE FROM $1 WHERE $3 < NOW() - INTERVAL '$2' $4;"
     print_number_of_rows $1
 }
 
@@ -41,9 +47,13 @@ keep_10000_rows () {
 
 delete_outdated_rows $accel_table "${interval_to_del_accel}" "timestamp"
 delete_outdated_rows $altim_table "${interval_to_del_altime}" "timestamp"
+delete_outdated_rows $heartbeats_table "${interval_to_del_heartbeats}" "second"
+delete_outdated_rows $altim_minutes_table "${interval_to_del_altim_minutes}" "minute"
 delete_outdated_rows $audio_table "${interval_to_del_audio}" "timestamp"
-delete_outdated_rows $data_to_send_table "${interval_to_del_data_to_send}" "timestamp"
+# Messages that must be sent stay until they are, the data sender keeps the unsent ones within a byte budget.
+delete_outdated_rows $data_to_send_table "${interval_to_del_data_to_send}" "timestamp" "AND (flag OR resend IS NOT TRUE)"
 delete_outdated_rows $trips_table "${interval_to_del_trips}" "start_time"
+delete_outdated_rows $trips_in_progress_table "${interval_to_del_trips_in_progress}" "updated_at"
 delete_outdated_rows $accelerations_table "${interval_to_del_accelerations}" "start_time"
 delete_outdated_rows $bank_trips_table "${interval_to_del_bank_trips}" "timestamp"
 delete_outdated_rows $escalator_table "${interval_to_del_escalator}" "timestamp"
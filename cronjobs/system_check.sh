@@ -9,7 +9,7 @@ notify () {
   when=$(date --iso-8601=seconds)
   priority=$2
   payload="'{\"id\": \"$id\", \"type\": \"system_notification\", \"text\": \"$1\", \"priority\": $priority, \"date\": \"$when\"}'"
-  sudo -u postgres psql -qtAX -d liftaidb -c "INSERT INTO data_to_send (timestamp, endpoint, payload, flag, resend) VALUES ('$when', 'devices/track', $payload, False, True)"
+  sudo -u postgres psql -qtAX -d liftaidb -c "INSERT INTO data_to_send (timestamp, endpoint, payload, flag, resend, priority) VALUES ('$when', 'devices/track', $payload, False, True, 0)"
 }
 
 today=`date +%Y-%m-%d`
@@ -20,17 +20,15 @@ declare -a services=(
 "altimeter"
 "anomalydetector"
 "audiorecorder"
-"bankstoppage"
 "datasender"
 "elevation"
 "elisha"
 "floordetector"
 "gpio"
-"lowusestoppage"
 "reportgenerator"
 "pingcloud"
 "roawatch"
-"standalonestoppage"
+"stoppagerunner"
 "trips"
 "vibration"
 )
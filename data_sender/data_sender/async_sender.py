@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import time
+import urllib.parse
+
+import aiohttp
+
+from data_sender import constants
+from data_sender.datasender import LiftAIDataSender
+from data_sender.uplink import CONNECTION_FAILURE, SERVER_FAILURE, TIMEOUT_FAILURE, Uplink
+from utilities import common_constants
+from utilities.db_listener import DatabaseListener
+from utilities.db_utilities import session_scope, DataToSend
+
+logger = logging.getLogger("data_sender")
+
+
+class Post:
+    """
+    One post in flight, either a single message or a batch of them.
+    """
+
+    def __init__(self, url, payload, row_ids, batch):
+        self.url = url
+        self.payload = payload
+        self.row_ids = row_ids
+        self.batch = batch
+        self.started_at = time.monotonic()
+
+
+class AsyncDataSender(LiftAIDataSender):
+    """
+    Sends with asyncio, up to MAX_IN_FLIGHT posts at once, so a slow post doesn't hold up the messages behind it.
+
+    Failures don't put the whole sender to sleep, the Uplink decides when posts can go out again.  Whatever
+    is in flight when we're told to stop gets up to DRAIN_SECONDS to finish.  The rows of a post that didn't
+    finish stay unsent and go out after the restart.
+
+    With nothing left to send it doesn't look at data_to_send again until the insert trigger notifies it,
+    a post finishes or IDLE_POLL_SECONDS go by.
+    """
+
+    def __init__(self, dsn, loop=None):
+        super().__init__(dsn)
+        self.loop = loop or asyncio.get_event_loop()
+        self.uplink = Uplink()
+        self.window = constants.MAX_IN_FLIGHT
+        self.in_flight = {}     # asyncio task: Post
+        self.held_rows = {}     # row id: (when it can go again, how many times it was rejected)
+        self.client = None
+        self.listener = None
+        self._listener_fd = None
+        self._wakeup = None
+
+    def _open_client(self):
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_new_connection)
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.window),
+            timeout=aiohttp.ClientTimeout(
+                connect=constants.CONNECT_TIMEOUT_SECONDS, sock_read=constants.READ_TIMEOUT_SECONDS
+            ),
+            trace_configs=[trace_config],
+        )
+
+    async def _on_new_connection(self, client, trace_config_ctx, params):
+        self.http_stats.connections += 1
+
+    async def _post(self, post):
+        data, headers = self.wire_format.encode(post.payload)
+        start = time.monotonic()
+        try:
+            async with self.client.post(post.url, data=data, headers=headers) as response:
+                if not self.wire_format.answered(headers, response.status, response.headers):
+                    return response.status, await response.text()
+        finally:
+            self._record_post(time.monotonic() - start, 0, len(data))
+        # The server couldn't read it, it goes again as JSON.
+        return await self._post(post)
+
+    def _start_posts(self, session, url_base):
+        slots = self.uplink.allowed_in_flight(self.window) - len(self.in_flight)
+        if slots <= 0:
+            return
+        batch_available = self._is_batch_available()
+        now = time.monotonic()
+        busy_ids = [row_id for post in self.in_flight.values() for row_id in post.row_ids] + [
+            row_id for row_id, (retry_at, _) in self.held_rows.items() if retry_at > now
+        ]
+        rows = self.scheduler.next_rows(
+            session, slots * (constants.BATCH_MAX_MESSAGES if batch_available else 1), busy_ids
+        )
+        while rows and slots > 0:
+            # A single message goes out on its own endpoint, like it always has.
+            if batch_available and len(rows) > 1:
+                batch, messages = self._pack_batch(rows)
+                post = Post(
+                    urllib.parse.urljoin(url_base, constants.BATCH_URL),
+                    {"messages": messages},
+                    [row.id for row in batch],
+                    True,
+                )
+            else:
+                batch = rows[:1]
+                post = Post(urllib.parse.urljoin(url_base, rows[0].endpoint), rows[0].payload, [rows[0].id], False)
+            rows = rows[len(batch):]
+            self.scheduler.take(batch)
+            self.in_flight[asyncio.ensure_future(self._post(post))] = post
+            slots -= 1
+
+    def _finish_posts(self, tasks):
+        with session_scope() as session:
+            for task in tasks:
+                self._finish_post(session, self.in_flight.pop(task), task)
+
+    def _finish_post(self, session, post, task):
+        # The rows were read in an earlier session, read them again to update them.
+        rows = {row.id: row for row in session.query(DataToSend).filter(DataToSend.id.in_(post.row_ids))}
+        rows = [rows[row_id] for row_id in post.row_ids if row_id in rows]
+        try:
+            status, response_text = task.result()
+        except asyncio.CancelledError:
+            return
+        except asyncio.TimeoutError:
+            return self._post_failed(session, post, rows, TIMEOUT_FAILURE)
+        except (aiohttp.ClientError, OSError) as e:
+            logger.info("Post to {0} failed: {1}".format(post.url, repr(e)))
+            return self._post_failed(session, post, rows, CONNECTION_FAILURE)
+
+        batch_refused = post.batch and status in constants.BATCH_UNSUPPORTED_STATUS_CODES
+        if not batch_refused and (status >= 500 or status == 429):
+            return self._post_failed(session, post, rows, SERVER_FAILURE)
+        # The server answered, the uplink works even if it didn't take the messages.
+        self.uplink.success()
+        if batch_refused:
+            # Nothing was sent, the rows go out one at a time next.
+            self._batch_not_supported(status)
+            return
+        if not 200 <= status < 300:
+            # The server didn't like these messages.
+            for row in rows:
+                self._handle_rejected_row(session, row)
+            return
+
+        for row_id in post.row_ids:
+            self.held_rows.pop(row_id, None)
+        if not post.batch:
+            for row in rows:
+                self._handle_sent_row(session, row, status, response_text)
+            return
+        try:
+            results = self._parse_batch_results(response_text)
+        except (ValueError, KeyError, TypeError) as e:
+            self._batch_not_supported(e)
+            return
+        self._handle_batch_results(session, rows, results)
+
+    def _handle_rejected_row(self, session, row):
+        """
+        A message that must be sent waits before it goes again, longer each time it's turned down, so one
+        message the server doesn't take doesn't go around as fast as the loop turns.
+        """
+        self._handle_failed_row(session, row)
+        if not row.resend:
+            return
+        _, rejections = self.held_rows.get(row.id, (0, 0))
+        seconds = min(constants.BACKOFF_MAX_SECONDS, constants.FAILURE_EXTRA_SLEEP_SECONDS * 2 ** rejections)
+        self.held_rows[row.id] = (time.monotonic() + seconds, rejections + 1)
+        logger.info("The server turned down message {0}, trying it again in {1} seconds".format(row.id, seconds))
+
+    def _post_failed(self, session, post, rows, kind):
+        self.uplink.failure(kind, post.started_at)
+        for row in rows:
+            self._handle_failed_row(session, row)
+
+    def _pause_after_bad_response(self):
+        # Don't hold up the posts in flight, back off from the server instead.
+        self.uplink.failure(SERVER_FAILURE, time.monotonic())
+
+    def _listen(self):
+        self._listener_fd = self.listener.connection.fileno()
+        self.loop.add_reader(self._listener_fd, self._on_notification)
+
+    def _on_notification(self):
+        connection = self.listener.connection
+        if self.listener.wait(0):
+            self._wakeup.set()
+        if self.listener.connection is not connection:
+            # It lost the connection and made a new one.
+            self.loop.remove_reader(self._listener_fd)
+            self._listen()
+
+    def _seconds_to_wait(self):
+        retry_seconds = self.uplink.seconds_until_retry()
+        if retry_seconds > 0:
+            return retry_seconds
+        if self.scheduler.more_waiting:
+            return constants.SLEEP_BETWEEN_LOOP_SECONDS
+        now = time.monotonic()
+        held_seconds = [retry_at - now for retry_at, _ in self.held_rows.values() if retry_at > now]
+        return min([constants.IDLE_POLL_SECONDS] + held_seconds)
+
+    async def _wait(self, timeout):
+        """
+        Wait until a post finishes, a notification comes in, we're told to stop or the timeout expires.
+        """
+        wakeup = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            done, _ = await asyncio.wait(
+                list(self.in_flight) + [wakeup], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            wakeup.cancel()
+        self._wakeup.clear()
+        finished = [task for task in done if task is not wakeup]
+        if finished:
+            self._finish_posts(finished)
+
+    async def _drain(self):
+        if not self.in_flight:
+            return
+        logger.info("Waiting for {0} posts in flight before stopping".format(len(self.in_flight)))
+        done, pending = await asyncio.wait(list(self.in_flight), timeout=constants.DRAIN_SECONDS)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.info("Gave up on {0} posts, they will be sent again after the restart".format(len(pending)))
+            await asyncio.wait(pending)
+        self._finish_posts(list(self.in_flight))
+
+    async def _send_forever(self, url_base):
+        self._wakeup = asyncio.Event()
+        self.listener = DatabaseListener(common_constants.DATA_TO_SEND_CHANNEL)
+        self._listen()
+        try:
+            async with self._open_client() as client:
+                self.client = client
+                while self.bRunning:
+                    with session_scope() as session:
+                        self._start_posts(session, url_base)
+                    await self._wait(self._seconds_to_wait())
+                await self._drain()
+        finally:
+            self.loop.remove_reader(self._listener_fd)
+            self.listener.close()
+
+    def run_forever(self):
+        url_base = self._get_url_base()
+
+        try:
+            self.loop.run_until_complete(self._send_forever(url_base))
+            self._graceful_shutdown()
+
+        except Exception as e:
+            logger.exception("Exception data_sender loop: {0}".format(e))
+            self._graceful_shutdown()
+            raise e
+
+    # OS Sends us a signal to terminate.
+    def stop(self, signum, frame):
+        super().stop(signum, frame)
+        if self._wakeup is not None:
+            # The signal handler runs outside the event loop, this wakes it up.
+            self.loop.call_soon_threadsafe(self._wakeup.set)
@@ -1,12 +1,67 @@
+import os
+
+from utilities import common_constants
 
 URL_ENV_VAR_NAME = 'LIFTAI_URL'
 DEFAULT_UPLOAD_URL_BASE = 'http://prod.liftai.com'
 API_VERSION = '/api/v1/'
 NOTIFICATIONS_URL = 'devices/notification'
 REPORTS_URL = 'devices/report'
+BATCH_URL = 'devices/batch'
 
 REBOOT_INFO = '/home/pi/reboot_info'
 
 SLEEP_BETWEEN_LOOP_SECONDS = 1
+IDLE_POLL_SECONDS = 60                # With nothing to send we wait for a notification, but look anyway this often.
 SLEEP_BETWEEN_POST_SECONDS = 0.25
 FAILURE_EXTRA_SLEEP_SECONDS = 30      # If we get connectivity problems, slow down to attempts.
+
+# The connection to the cloud is kept open between posts, over cellular the handshakes are slow.
+CONNECT_TIMEOUT_SECONDS = 30
+READ_TIMEOUT_SECONDS = 90
+CONNECT_RETRIES = 1                   # A connection that was never made can be retried, the post wasn't sent.
+HTTP_STATS_LOG_INTERVAL = 100         # Log the connection stats every this many posts.
+
+# With msgpack and zstandard installed, payloads go as MessagePack compressed with zstd once the server asks for
+# it, see wire_format.py.  The dictionary is trained on our own payloads with wire_format_benchmark.py.
+BINARY_WIRE_FORMAT = True
+ZSTD_DICTIONARY_FILE = os.environ.get('LIFTAI_ZSTD_DICTIONARY_FILE', '/etc/liftai/payloads.zstd-dict')
+ZSTD_DICTIONARY_BYTES = 16 * 1024
+ZSTD_LEVEL = 9
+BINARY_FALLBACK_SECONDS = 3600        # How long to send JSON after the server couldn't read a binary payload.
+
+# Messages that are waiting go up together in one post to BATCH_URL.
+BATCH_UPLOADS = True
+BATCH_MAX_MESSAGES = 50
+BATCH_MAX_BYTES = 256 * 1024          # Uncompressed JSON, a single larger message still goes on its own.
+BATCH_UNSUPPORTED_STATUS_CODES = (404, 405, 501)
+BATCH_RETRY_SECONDS = 3600            # How long to send one message at a time after the server turned down a batch.
+
+# How many messages of each priority go out per minute at most, so a backlog of reports or pings doesn't
+# hog a slow link.  Notifications aren't limited.
+MESSAGES_PER_MINUTE = {
+    common_constants.DATA_PRIORITY_REPORT: 60,
+    common_constants.DATA_PRIORITY_PING: 10,
+}
+
+# Every SPOOL_COMPACT_SECONDS the messages waiting to be sent are compacted, see Spool.  Past SPOOL_MAX_BYTES
+# of payloads the least important ones are dropped.
+SPOOL_COMPACT_SECONDS = 60
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+
+# The asyncio sender keeps up to MAX_IN_FLIGHT posts going at once, so one slow post doesn't hold up the rest.
+MAX_IN_FLIGHT = 4
+DRAIN_SECONDS = 30                    # On SIGTERM, how long to wait for the posts in flight before giving up on them.
+
+# After a failure no new posts start for a while.  The wait doubles with each failure of the same kind, starting
+# from BACKOFF_FIRST_SECONDS for that kind, up to BACKOFF_MAX_SECONDS.  Half of it is random, so devices that lost
+# the uplink together don't all come back at the same moment.
+BACKOFF_FIRST_SECONDS = {
+    "connection": 5,                  # Couldn't connect or the connection dropped, e.g. the PPP link is down.
+    "timeout": 15,                    # Connected but no answer in time, a slow link or a busy server.
+    "server": 30,                     # The server answered with a 5xx or 429, or with something that isn't JSON.
+}
+BACKOFF_MAX_SECONDS = 600
+# After this many failures in a row the uplink circuit opens: after the backoff only one post goes out to test
+# the uplink, and the others wait until that one works.
+FAILURES_TO_OPEN_CIRCUIT = 3
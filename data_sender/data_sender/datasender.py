@@ -2,17 +2,20 @@ import json
 import os
 import logging
 import subprocess
-import zlib
 import time
 import urllib.parse
 from datetime import datetime
 from subprocess import PIPE, Popen
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from data_sender import constants
+from data_sender.scheduler import SendScheduler
+from data_sender.wire_format import WireFormat
 from utilities import common_constants, device_configuration
-from utilities.db_utilities import session_scope, BankTrip, DataToSend, RoaWatchRequest
+from utilities.db_utilities import session_scope, BankTrip, RoaWatchRequest
 from utilities.wpa_supplicant_manager import WPASupplicantManager
 
 
@@ -21,6 +24,36 @@ datasent_logger = logging.getLogger("datasent")
 datareceived_logger = logging.getLogger("datareceived")
 
 
+class HttpStats:
+    """
+    How many posts went out, how many new connections (TCP and TLS handshakes) they took, how long they took
+    and how many bytes of payloads they carried.
+    """
+
+    def __init__(self):
+        self.posts = 0
+        self.connections = 0
+        self.total_seconds = 0.0
+        self.total_bytes = 0
+
+    def add(self, seconds, new_connections, body_bytes=0):
+        self.posts += 1
+        self.connections += new_connections
+        self.total_seconds += seconds
+        self.total_bytes += body_bytes
+
+    def average_milliseconds(self):
+        return 1000 * self.total_seconds / self.posts if self.posts else 0
+
+    def average_bytes(self):
+        return self.total_bytes / self.posts if self.posts else 0
+
+    def __str__(self):
+        return "{0} posts over {1} connections, {2:.0f} ms and {3:.0f} bytes per post".format(
+            self.posts, self.connections, self.average_milliseconds(), self.average_bytes()
+        )
+
+
 class LiftAIDataSender:
     @staticmethod
     def is_running_zerotier():
@@ -42,96 +75,245 @@ class LiftAIDataSender:
     def __init__(self, dsn):
         self.dsn = dsn
         self.bRunning = True
+        self.http_stats = HttpStats()
+        self.http_session = None
+        self._seen_pool = None
+        self._seen_connections = 0
+        self.batch_retry_at = 0
+        self.scheduler = SendScheduler()
+        self.wire_format = WireFormat()
+        self._open_http_session()
+
+    def _open_http_session(self):
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=1,
+            max_retries=Retry(
+                total=constants.CONNECT_RETRIES,
+                connect=constants.CONNECT_RETRIES,
+                read=0,
+                status=0,
+                redirect=0,
+            ),
+        )
+        self.http_session = requests.Session()
+        self.http_session.mount("http://", adapter)
+        self.http_session.mount("https://", adapter)
+
+    def _reset_http_session(self):
+        # After a network problem start over, the pooled connection may be dead (e.g. the PPP link came back up).
+        self.http_session.close()
+        self._open_http_session()
+
+    def _count_new_connections(self, response):
+        # urllib3 counts the connections each pool opened, so compare with what the pool had last time.
+        pool = getattr(getattr(response, "raw", None), "_pool", None)
+        if pool is None:
+            return 0
+        seen = self._seen_connections if pool is self._seen_pool else 0
+        self._seen_pool, self._seen_connections = pool, pool.num_connections
+        return pool.num_connections - seen
+
+    def _record_post(self, seconds, new_connections, body_bytes):
+        self.http_stats.add(seconds, new_connections, body_bytes)
+        if self.http_stats.posts % constants.HTTP_STATS_LOG_INTERVAL == 0:
+            logger.info("HTTP stats: {0}".format(self.http_stats))
 
     def post_data(self, url, payload):
-        with requests.Session() as s:
-            data = json.dumps(payload).encode()
-            headers = {
-                "Content-Type": "application/json",
-                "Content-Encoding": "gzip",
-                "Content-Length": str(len(data)),
-            }
-            gzip_data = zlib.compress(data)
-            req = requests.Request(
-                method="POST", url=url, headers=headers, data=gzip_data
+        data, headers = self.wire_format.encode(payload)
+        req = requests.Request(
+            method="POST", url=url, headers=headers, data=data
+        )
+        prepped = self.http_session.prepare_request(req)
+        response = None
+        start = time.monotonic()
+        try:
+            response = self.http_session.send(
+                prepped,
+                timeout=(constants.CONNECT_TIMEOUT_SECONDS, constants.READ_TIMEOUT_SECONDS),
             )
-            prepped = req.prepare()
-            response = s.send(prepped, timeout=180)
-            response.raise_for_status()  # Raise HTTPError for anything other than a 200 response
-            return response
+        finally:
+            self._record_post(time.monotonic() - start, self._count_new_connections(response), len(data))
+        if self.wire_format.answered(headers, response.status_code, response.headers):
+            return self.post_data(url, payload)
+        response.raise_for_status()  # Raise HTTPError for anything other than a 200 response
+        return response
+
+    def _is_batch_available(self):
+        return constants.BATCH_UPLOADS and time.monotonic() >= self.batch_retry_at
 
     def send_data(self, session, url_base):
-        rows = (
-            session.query(DataToSend)
-            .filter(DataToSend.flag == False)
-            .order_by(DataToSend.timestamp.asc())
-            .limit(4)
-        )
+        batch_available = self._is_batch_available()
+        rows = self.scheduler.next_rows(session, constants.BATCH_MAX_MESSAGES if batch_available else 4)
+        # A single message goes out on its own endpoint, like it always has.
+        if batch_available and len(rows) > 1 and self._send_batch(session, url_base, rows):
+            return
+        rows = rows[:4]
+        self.scheduler.take(rows)
         for row in rows:
 
             try:  # send HTTP POST
                 url = urllib.parse.urljoin(url_base, row.endpoint)
                 response = self.post_data(url, row.payload)
             except Exception as e:
-                if (
-                    "ConnectionError" not in str(e)
-                    and "HTTPError" not in str(e)
-                    and "Failed to establish a new connection" not in str(e)
-                ):
-                    logger.error(
-                        "HTTP post got an unexpected exception, raising it... {0}".format(
-                            e
-                        )
-                    )
-                    raise e
-
-                # Network connection problem of some sort.
-                if not row.resend:
-                    logger.debug("Failed to send non-essential message")
-                    datasent_logger.debug(
-                        "Failed to send non-essential payload: {0}".format(
-                            json.dumps(row.payload)
-                        )
-                    )
-                    self._mark_as_done(session, row, False)
-                else:
-                    logger.info("Failed to send msg which must be sent later.")
-
+                self._check_network_problem(e)
+                self._handle_failed_row(session, row)
                 time.sleep(constants.FAILURE_EXTRA_SLEEP_SECONDS)
                 continue
 
             # 200 response here
-            payload_string = json.dumps(row.payload)
-            datasent_log_text = "endpoint: {0},  status: {1},   payload {2}".format(
-                row.endpoint, response.status_code, payload_string
+            self._handle_sent_row(session, row, response.status_code, response.text)
+            time.sleep(constants.SLEEP_BETWEEN_POST_SECONDS)
+
+    def _send_batch(self, session, url_base, rows):
+        """
+        Post the oldest messages together to the batch endpoint, up to BATCH_MAX_MESSAGES or about
+        BATCH_MAX_BYTES of JSON.  The server answers with a result for each message.
+        Returns False if the server doesn't take batches, then the messages are sent one at a time.
+        """
+        batch, messages = self._pack_batch(rows)
+        try:
+            response = self.post_data(
+                urllib.parse.urljoin(url_base, constants.BATCH_URL),
+                {"messages": messages},
             )
+            results = self._parse_batch_results(response.text)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in constants.BATCH_UNSUPPORTED_STATUS_CODES:
+                return self._batch_not_supported(e.response.status_code)
+            results = None
+        except (ValueError, KeyError, TypeError) as e:
+            return self._batch_not_supported(e)
+        except Exception as e:
+            self._check_network_problem(e)
+            results = None
+
+        # Charged whatever the answer, like the posts one at a time.  Without batches they're charged there.
+        self.scheduler.take(batch)
+        if results is None:
+            # The whole batch failed, the same as each message failing.
+            for row in batch:
+                self._handle_failed_row(session, row)
+            time.sleep(constants.FAILURE_EXTRA_SLEEP_SECONDS)
+            return True
+
+        self._handle_batch_results(session, batch, results)
+        time.sleep(constants.SLEEP_BETWEEN_POST_SECONDS)
+        return True
+
+    @staticmethod
+    def _pack_batch(rows):
+        """
+        Returns the first rows that fit in one batch and the messages to post for them.
+        """
+        batch = []
+        messages = []
+        batch_bytes = 0
+        for row in rows:
+            message = {"id": row.id, "endpoint": row.endpoint, "payload": row.payload}
+            message_bytes = len(json.dumps(message))
+            if batch and batch_bytes + message_bytes > constants.BATCH_MAX_BYTES:
+                break
+            batch.append(row)
+            messages.append(message)
+            batch_bytes += message_bytes
+        return batch, messages
 
-            # Notifications are higher importance than everything else.
-            if row.endpoint == common_constants.NOTIFICATION_ENDPOINT:
-                datasent_logger.info(datasent_log_text)
+    @staticmethod
+    def _parse_batch_results(response_text):
+        # Raises ValueError, KeyError or TypeError if this isn't an answer from a server that takes batches.
+        results = json.loads(response_text)["results"]
+        return {result["id"]: result for result in results}
+
+    def _handle_batch_results(self, session, batch, results):
+        for row in batch:
+            result = results.get(row.id)
+            if result is None:
+                logger.info("No result for message {0} in the batch, it will be sent again".format(row.id))
+            elif 200 <= result.get("status", 0) < 300:
+                self._handle_sent_row(session, row, result["status"], json.dumps(result.get("response", {})))
+            elif self._is_rejected(result.get("status", 0)):
+                self._handle_rejected_row(session, row)
             else:
-                datasent_logger.debug(datasent_log_text)
-            datareceived_log_text = "endpoint - {0}, response {1}".format(
-                row.endpoint, response.text
+                self._handle_failed_row(session, row)
+
+    @staticmethod
+    def _is_rejected(status):
+        # The server didn't like the message itself, sending it again right away won't help.
+        return 400 <= status < 500 and status != 429
+
+    def _handle_rejected_row(self, session, row):
+        self._handle_failed_row(session, row)
+
+    def _batch_not_supported(self, reason):
+        logger.info(
+            "The server doesn't take batches ({0}), sending one message at a time for {1} seconds".format(
+                reason, constants.BATCH_RETRY_SECONDS
+            )
+        )
+        self.batch_retry_at = time.monotonic() + constants.BATCH_RETRY_SECONDS
+        return False
+
+    def _check_network_problem(self, e):
+        """
+        Raise e again unless it's a network connection problem of some sort.
+        """
+        if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+            self._reset_http_session()
+        elif not isinstance(e, requests.HTTPError) and (
+            "ConnectionError" not in str(e)
+            and "HTTPError" not in str(e)
+            and "Failed to establish a new connection" not in str(e)
+        ):
+            logger.error(
+                "HTTP post got an unexpected exception, raising it... {0}".format(
+                    e
+                )
             )
-            datareceived_logger.debug(datareceived_log_text)
+            raise e
 
-            try:
-                response_text = (
-                    response.text
-                    if not (response.text is "" or response.text is None)
-                    else "{}"
+    def _handle_failed_row(self, session, row):
+        if not row.resend:
+            logger.debug("Failed to send non-essential message")
+            datasent_logger.debug(
+                "Failed to send non-essential payload: {0}".format(
+                    json.dumps(row.payload)
                 )
-                response_data = json.loads(response_text)
-                self._process_response_commands(session, response_data, row.timestamp)
-            except:
-                logger.error("Bad json received from cloud: ", response.text)
-                time.sleep(constants.FAILURE_EXTRA_SLEEP_SECONDS)
+            )
+            self._mark_as_done(session, row, False)
+        else:
+            logger.info("Failed to send msg which must be sent later.")
 
-            self._mark_as_done(session, row, True)
-            time.sleep(constants.SLEEP_BETWEEN_POST_SECONDS)
+    def _handle_sent_row(self, session, row, status_code, response_text):
+        payload_string = json.dumps(row.payload)
+        datasent_log_text = "endpoint: {0},  status: {1},   payload {2}".format(
+            row.endpoint, status_code, payload_string
+        )
 
-    def run_forever(self):
+        # Notifications are higher importance than everything else.
+        if row.endpoint == common_constants.NOTIFICATION_ENDPOINT:
+            datasent_logger.info(datasent_log_text)
+        else:
+            datasent_logger.debug(datasent_log_text)
+        datareceived_log_text = "endpoint - {0}, response {1}".format(
+            row.endpoint, response_text
+        )
+        datareceived_logger.debug(datareceived_log_text)
+
+        try:
+            response_data = json.loads(response_text or "{}")
+            self._process_response_commands(session, response_data, row.timestamp)
+        except:
+            logger.error("Bad json received from cloud: {0}".format(response_text))
+            self._pause_after_bad_response()
+
+        self._mark_as_done(session, row, True)
+
+    def _pause_after_bad_response(self):
+        time.sleep(constants.FAILURE_EXTRA_SLEEP_SECONDS)
+
+    @staticmethod
+    def _get_url_base():
         upload_url = (
             os.environ[constants.URL_ENV_VAR_NAME]
             if constants.URL_ENV_VAR_NAME in os.environ
@@ -139,6 +321,10 @@ class LiftAIDataSender:
         )
         url_base = urllib.parse.urljoin(upload_url, constants.API_VERSION)
         logger.debug("Using URL: {0}".format(url_base))
+        return url_base
+
+    def run_forever(self):
+        url_base = self._get_url_base()
 
         try:
             while self.bRunning:
@@ -162,6 +348,8 @@ class LiftAIDataSender:
         self.bRunning = False
 
     def _graceful_shutdown(self):
+        self.http_session.close()
+        logger.info("HTTP stats: {0}".format(self.http_stats))
         # When stopping, always make it clear this was not a power failure in the elevator.
         reboot_info_file = open(constants.REBOOT_INFO, "w")
         reboot_info_file.write("exception in data_sender main")
@@ -4,7 +4,7 @@ import signal
 import time
 
 import data_sender.constants as constants
-from data_sender.datasender import LiftAIDataSender
+from data_sender.async_sender import AsyncDataSender
 from notifications.notifications import Notification, NotificationTopic
 import utilities.common_constants as common_constants
 from utilities.logging import create_rotating_log
@@ -34,7 +34,7 @@ def main():
         create_rotating_log("datasent")
         create_rotating_log("datareceived")
         check_uncontrolled_restart()
-        datasender = LiftAIDataSender(common_constants.DSN)
+        datasender = AsyncDataSender(common_constants.DSN)
 
         signal.signal(signal.SIGINT, datasender.stop)
         signal.signal(signal.SIGTERM, datasender.stop)
@@ -0,0 +1,93 @@
+import logging
+import time
+
+from data_sender import constants
+from data_sender.spool import Spool, unsent_rows
+from utilities import common_constants
+from utilities.db_utilities import DataToSend
+
+logger = logging.getLogger("data_sender")
+
+PRIORITIES = (
+    common_constants.DATA_PRIORITY_NOTIFICATION,
+    common_constants.DATA_PRIORITY_REPORT,
+    common_constants.DATA_PRIORITY_PING,
+)
+
+
+class RateLimit:
+    """
+    Allows messages_per_minute messages a minute, with up to a minute's worth in a burst.
+    """
+
+    def __init__(self, messages_per_minute, clock):
+        self.messages_per_minute = messages_per_minute
+        self.clock = clock
+        self.allowance = messages_per_minute
+        self.last_update = clock()
+
+    def available(self):
+        now = self.clock()
+        self.allowance = min(
+            self.messages_per_minute,
+            self.allowance + (now - self.last_update) * self.messages_per_minute / 60,
+        )
+        self.last_update = now
+        return int(self.allowance)
+
+    def take(self, count):
+        self.allowance -= count
+
+
+class SendScheduler:
+    """
+    Picks the messages to send next: notifications before reports before pings, oldest first within each
+    priority, and no more reports or pings than their rate limits allow.  Only the rows passed to take()
+    count against the rate limits, the caller may not post everything it was given.
+
+    Every SPOOL_COMPACT_SECONDS the Spool compacts what's waiting first.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.spool = Spool(clock)
+        self.rate_limits = {
+            priority: RateLimit(messages_per_minute, clock)
+            for priority, messages_per_minute in constants.MESSAGES_PER_MINUTE.items()
+        }
+        # Whether the last next_rows() may have left rows behind, because of the limit or a rate limit.
+        self.more_waiting = False
+
+    def next_rows(self, session, limit, busy_ids=()):
+        """
+        The next rows to send, leaving out busy_ids, the rows that are being sent already.
+        """
+        self.spool.compact_if_due(session, busy_ids)
+        rows = []
+        self.more_waiting = False
+        for priority in PRIORITIES:
+            count = limit - len(rows)
+            rate_limit = self.rate_limits.get(priority)
+            if rate_limit is not None:
+                count = min(count, rate_limit.available())
+            if count <= 0:
+                self.more_waiting = True
+                continue
+            # An index scan on data_to_send_flag_priority_timestamp_idx.
+            picked = (
+                unsent_rows(session, priority, busy_ids)
+                .order_by(DataToSend.timestamp.asc())
+                .limit(count)
+                .all()
+            )
+            self.more_waiting = self.more_waiting or len(picked) == count
+            rows.extend(picked)
+        return rows
+
+    def take(self, rows):
+        """
+        Charge the rate limits for the rows that are going out.
+        """
+        for row in rows:
+            rate_limit = self.rate_limits.get(row.priority)
+            if rate_limit is not None:
+                rate_limit.take(1)
@@ -0,0 +1,140 @@
+import json
+import logging
+import time
+
+from sqlalchemy import Text, cast, func
+
+from data_sender import constants
+from utilities import common_constants
+from utilities.db_utilities import DataToSend
+
+logger = logging.getLogger("data_sender")
+
+
+def unsent_rows(session, priority, busy_ids=()):
+    """
+    The rows of a priority that weren't sent yet, leaving out busy_ids.
+    """
+    query = session.query(DataToSend).filter(DataToSend.flag == False, DataToSend.priority == priority)
+    if busy_ids:
+        query = query.filter(~DataToSend.id.in_(busy_ids))
+    return query
+
+
+class Spool:
+    """
+    Keeps the messages waiting in data_to_send small while the device is offline, so the backlog goes out
+    quickly when the link comes back.
+
+    - Pings that weren't sent yet are superseded by the newest one, which takes over their trip and door counts.
+    - Reports that are the same as one already waiting are only sent once.
+    - Past SPOOL_MAX_BYTES of payloads the least important messages are dropped: pings first, then reports,
+      notifications last, and within a priority the messages that don't need to be sent (resend is false)
+      before the ones that do, oldest first.
+
+    Dropped messages are marked as done without success, the same as a non-essential message that failed.
+    Messages that are being sent (busy_ids) are left alone.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.next_compaction = None
+
+    def compact_if_due(self, session, busy_ids=()):
+        now = self.clock()
+        if self.next_compaction is not None and now < self.next_compaction:
+            return
+        self.next_compaction = now + constants.SPOOL_COMPACT_SECONDS
+        self.compact(session, busy_ids)
+
+    def compact(self, session, busy_ids=()):
+        """
+        Returns how many messages were dropped, they're committed right away.
+        """
+        busy_ids = set(busy_ids)
+        dropped = (
+            self._collapse_pings(session, busy_ids)
+            + self._dedupe_reports(session, busy_ids)
+            + self._enforce_byte_budget(session, busy_ids)
+        )
+        if dropped:
+            session.commit()
+        return dropped
+
+    @staticmethod
+    def _drop(row):
+        row.flag = True
+        row.success = False
+
+    def _collapse_pings(self, session, busy_ids):
+        # A ping that's on its way to the cloud already can't be folded into another one.
+        pings = (
+            unsent_rows(session, common_constants.DATA_PRIORITY_PING, busy_ids)
+            .order_by(DataToSend.timestamp.asc(), DataToSend.id.asc())
+            .all()
+        )
+        if len(pings) < 2:
+            return 0
+        newest = pings[-1]
+        payload = dict(newest.payload)
+        for ping in pings[:-1]:
+            for key in ("ping_trips", "ping_doors"):
+                if key in ping.payload and key in payload:
+                    payload[key] += ping.payload[key]
+            self._drop(ping)
+        newest.payload = payload
+        logger.debug("Collapsed {0} pings that weren't sent into the newest one".format(len(pings) - 1))
+        return len(pings) - 1
+
+    def _dedupe_reports(self, session, busy_ids):
+        seen = set()
+        duplicates = 0
+        reports = unsent_rows(session, common_constants.DATA_PRIORITY_REPORT).order_by(
+            DataToSend.timestamp.asc(), DataToSend.id.asc()
+        )
+        # The oldest of the same reports is kept.
+        for report in reports:
+            key = (report.endpoint, json.dumps(report.payload, sort_keys=True))
+            if key not in seen:
+                seen.add(key)
+            elif report.id not in busy_ids:
+                self._drop(report)
+                duplicates += 1
+        if duplicates:
+            logger.debug("Dropped {0} reports that were the same as one already waiting".format(duplicates))
+        return duplicates
+
+    def _enforce_byte_budget(self, session, busy_ids):
+        session.flush()
+        # Most important first, whatever doesn't fit after that is dropped.
+        waiting = (
+            session.query(DataToSend.id, func.octet_length(cast(DataToSend.payload, Text)))
+            .filter(DataToSend.flag == False)
+            .order_by(
+                DataToSend.priority.asc(),
+                DataToSend.resend.desc().nullslast(),
+                DataToSend.timestamp.desc(),
+                DataToSend.id.desc(),
+            )
+            .all()
+        )
+        total_bytes = 0
+        kept_bytes = 0
+        over_budget = []
+        for row_id, size in waiting:
+            total_bytes += size or 0
+            if total_bytes > constants.SPOOL_MAX_BYTES and row_id not in busy_ids:
+                over_budget.append(row_id)
+            else:
+                kept_bytes += size or 0
+        if not over_budget:
+            return 0
+        dropped = {}
+        for row in session.query(DataToSend).filter(DataToSend.id.in_(over_budget)):
+            self._drop(row)
+            dropped[(row.priority, bool(row.resend))] = dropped.get((row.priority, bool(row.resend)), 0) + 1
+        logger.warning(
+            "{0} bytes of messages waiting, over the {1} byte budget. Kept {2} bytes, dropped (priority, resend): "
+            "{3}".format(total_bytes, constants.SPOOL_MAX_BYTES, kept_bytes, dropped)
+        )
+        return len(over_budget)
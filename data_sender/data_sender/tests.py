@@ -1,12 +1,26 @@
+import asyncio
 import json
 import os
+import socketserver
+import threading
+import time
 import unittest
+import zlib
 from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest.mock import patch
 
 import pytz
+import requests
+from sqlalchemy.dialects import postgresql
 
+from data_sender import constants, uplink, wire_format
+from data_sender.async_sender import AsyncDataSender
 from data_sender.datasender import LiftAIDataSender
+from data_sender.scheduler import SendScheduler
+from data_sender.spool import Spool
+from data_sender.uplink import Uplink
+from data_sender.wire_format import WireFormat
 from utilities import common_constants
 from utilities.db_utilities import BankTrip, DataToSend, Session
 
@@ -21,6 +35,7 @@ class MockResponse:
         self.status_code = status_code
         self.response_text = response_text
         self.raise_generic = raise_generic_exception
+        self.headers = {}
 
     def raise_for_status(self):
         if self.raise_generic:
@@ -186,5 +201,616 @@ class TestDataSender(unittest.TestCase):
         self.assertEqual(bank_trip.timestamp, expected_timestamp)
 
 
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the cloud
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        data = json.loads(zlib.decompress(self.rfile.read(int(self.headers["Content-Length"]))).decode())
+        with self.server.lock:
+            self.server.posts.append((self.path, data))
+            self.server.post_times.append(time.monotonic())
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.active -= 1
+        status = self.server.status
+        body = b"{}"
+        if self.path.endswith(constants.BATCH_URL):
+            status = self.server.batch_status
+            results = [
+                {
+                    "id": message["id"],
+                    "status": self.server.item_status.get(message["id"], 200),
+                    "response": self.server.item_response.get(message["id"], {}),
+                }
+                for message in data["messages"]
+            ]
+            body = json.dumps({"results": results}).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            pass    # The sender gave up on this post.
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.connections = 0
+        self.posts = []
+        self.post_times = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.delay = 0
+        self.status = 200
+        self.batch_status = 200
+        self.item_status = {}
+        self.item_response = {}
+
+
+class StandInServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = "http://127.0.0.1:{0}/api/v1/devices/notification".format(self.server.server_port)
+        self.data_sender = LiftAIDataSender({})
+        self.addCleanup(lambda: self.data_sender.http_session.close())
+
+
+class TestDataSenderConnections(StandInServerTestCase):
+    posts = 5
+
+    def test_posts_share_one_connection(self):
+        for _ in range(self.posts):
+            self.data_sender.post_data(self.url, {"test": "payload"})
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.data_sender.http_stats.posts, self.posts)
+        self.assertEqual(self.data_sender.http_stats.connections, 1)
+
+        # What a new session for every post, the way it used to be, costs.
+        for _ in range(self.posts):
+            with requests.Session() as s:
+                s.post(self.url, data=zlib.compress(b'{"test": "payload"}')).raise_for_status()
+        self.assertEqual(self.server.connections, 1 + self.posts)
+
+    @patch("data_sender.constants.FAILURE_EXTRA_SLEEP_SECONDS", 0)
+    def test_starts_over_after_a_connection_error(self):
+        self.data_sender.post_data(self.url, {"test": "payload"})
+        http_session = self.data_sender.http_session
+        session = Session()
+        self.addCleanup(session.close)
+        self.addCleanup(session.rollback)
+        session.query(DataToSend).delete()
+        data = DataToSend(
+            timestamp=datetime.now(), endpoint="devices/notification", payload={}, flag=False, resend=True
+        )
+        session.add(data)
+        session.flush()
+        # Find a port that nothing listens on.
+        with socketserver.TCPServer(("127.0.0.1", 0), StandInHandler) as unused:
+            port = unused.server_address[1]
+        self.data_sender.send_data(session, "http://127.0.0.1:{0}/".format(port))
+        self.assertFalse(data.flag)
+        self.assertIsNot(self.data_sender.http_session, http_session)
+
+        self.data_sender.post_data(self.url, {"test": "payload"})
+        self.assertEqual(self.server.connections, 2)
+
+
+class DataToSendTestCase(StandInServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url_base = "http://127.0.0.1:{0}/api/v1/".format(self.server.server_port)
+        self.session = Session()
+        self.session.query(DataToSend).delete()
+        self.session.query(BankTrip).delete()
+        self.session.commit()
+
+    def tearDown(self):
+        try:
+            # The data sender commits what it sent.
+            self.session.rollback()
+            self.session.query(DataToSend).delete()
+            self.session.query(BankTrip).delete()
+            self.session.commit()
+        finally:
+            self.session.close()
+        super().tearDown()
+
+    def _insert_rows(self, count, resend=True):
+        rows = []
+        for i in range(count):
+            row = DataToSend(
+                timestamp=datetime.now() - timedelta(minutes=count - i),
+                endpoint=common_constants.NOTIFICATION_ENDPOINT,
+                payload={"notification": {"type": "car", "text": "message {0}".format(i)}},
+                flag=False,
+                resend=resend,
+                priority=common_constants.DATA_PRIORITY_NOTIFICATION,
+            )
+            self.session.add(row)
+            rows.append(row)
+        self.session.flush()
+        return rows
+
+
+@patch("data_sender.constants.SLEEP_BETWEEN_POST_SECONDS", 0)
+@patch("data_sender.constants.FAILURE_EXTRA_SLEEP_SECONDS", 0)
+class TestBatchUploads(DataToSendTestCase):
+    def test_one_post_for_a_batch(self):
+        rows = self._insert_rows(3) + self._insert_rows(1, resend=False)
+        self.server.item_status = {rows[1].id: 500, rows[3].id: 500}
+        self.server.item_response = {rows[0].id: {"bankTrips": 100, "bankElevators": 2}}
+        self.data_sender.send_data(self.session, self.url_base)
+
+        self.assertEqual([path for path, _ in self.server.posts], ["/api/v1/" + constants.BATCH_URL])
+        messages = self.server.posts[0][1]["messages"]
+        self.assertEqual([m["id"] for m in messages], [row.id for row in rows])
+        self.assertEqual(messages[0]["payload"], rows[0].payload)
+        self.assertEqual(messages[0]["endpoint"], rows[0].endpoint)
+        self.assertEqual([(row.flag, row.success) for row in rows], [
+            (True, True), (False, None), (True, True), (True, False)
+        ])
+        # The response to each message still gets processed.
+        self.assertEqual(self.session.query(BankTrip).one().timestamp, rows[0].timestamp)
+
+    @patch("data_sender.constants.BATCH_MAX_BYTES", 300)
+    def test_batch_size_limit(self):
+        rows = self._insert_rows(5)
+        self.data_sender.send_data(self.session, self.url_base)
+        self.assertEqual(len(self.server.posts), 1)
+        sent = len(self.server.posts[0][1]["messages"])
+        self.assertGreater(sent, 1)
+        self.assertLess(sent, 5)
+        self.assertEqual([row.flag for row in rows], [True] * sent + [False] * (5 - sent))
+
+    def test_falls_back_to_single_posts(self):
+        self.server.batch_status = 404
+        rows = self._insert_rows(3)
+        self.data_sender.send_data(self.session, self.url_base)
+        self.assertEqual(
+            [path for path, _ in self.server.posts],
+            ["/api/v1/" + constants.BATCH_URL] + ["/api/v1/" + common_constants.NOTIFICATION_ENDPOINT] * 3,
+        )
+        self.assertEqual([row.flag for row in rows], [True] * 3)
+
+        # No more batches for a while.
+        self._insert_rows(2)
+        self.data_sender.send_data(self.session, self.url_base)
+        self.assertEqual(len(self.server.posts), 6)
+        self.assertNotIn(constants.BATCH_URL, self.server.posts[-1][0])
+
+
+class TestAsyncDataSender(DataToSendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.async_sender = AsyncDataSender({}, loop=self.loop)
+        self.addCleanup(self.async_sender.http_session.close)
+
+    def _run_for(self, seconds):
+        # Like a SIGTERM after the given time.
+        self.loop.call_later(seconds, self.async_sender.stop, None, None)
+        start = time.monotonic()
+        self.loop.run_until_complete(self.async_sender._send_forever(self.url_base))
+        self.session.expire_all()
+        return time.monotonic() - start
+
+    @patch("data_sender.constants.BATCH_UPLOADS", False)
+    def test_posts_in_parallel_and_drains_on_stop(self):
+        self.server.delay = 0.5
+        rows = self._insert_rows(constants.MAX_IN_FLIGHT + 2)
+        self.session.commit()
+        seconds = self._run_for(0.2)
+
+        # Stopped while the first posts were in flight, they were waited for but nothing new started.
+        self.assertEqual(self.server.max_active, constants.MAX_IN_FLIGHT)
+        self.assertLess(seconds, 2 * self.server.delay)
+        self.assertEqual(len(self.server.posts), constants.MAX_IN_FLIGHT)
+        self.assertEqual(
+            [row.flag for row in rows], [True] * constants.MAX_IN_FLIGHT + [False, False]
+        )
+        self.assertEqual(self.async_sender.in_flight, {})
+
+    @patch("data_sender.constants.BATCH_UPLOADS", False)
+    @patch("data_sender.constants.DRAIN_SECONDS", 0.1)
+    def test_gives_up_on_slow_posts_when_stopping(self):
+        self.server.delay = 1
+        rows = self._insert_rows(2)
+        self.session.commit()
+        self.assertLess(self._run_for(0.1), self.server.delay)
+        self.assertEqual([row.flag for row in rows], [False, False])
+
+    @patch("data_sender.constants.BATCH_UPLOADS", False)
+    def test_backs_off_after_server_errors(self):
+        self.server.status = 503
+        must_send = self._insert_rows(1)[0]
+        non_essential = self._insert_rows(1, resend=False)[0]
+        self.session.commit()
+        self._run_for(0.5)
+
+        # Both went out together and failed together, nothing more until the backoff is over.
+        self.assertEqual(len(self.server.posts), 2)
+        self.assertEqual((must_send.flag, must_send.success), (False, None))
+        self.assertEqual((non_essential.flag, non_essential.success), (True, False))
+        self.assertEqual(self.async_sender.uplink.failures, {uplink.SERVER_FAILURE: 1})
+        self.assertGreater(self.async_sender.uplink.seconds_until_retry(), 0)
+
+    @patch("data_sender.constants.BATCH_UPLOADS", False)
+    def test_waits_before_sending_a_rejected_row_again(self):
+        self.server.status = 400
+        must_send = self._insert_rows(1)[0]
+        self.session.commit()
+        self._run_for(0.5)
+
+        # It went out once and waits, the uplink is fine.
+        self.assertEqual(len(self.server.posts), 1)
+        self.assertEqual((must_send.flag, must_send.success), (False, None))
+        self.assertEqual(self.async_sender.uplink.failures, {})
+        retry_at, rejections = self.async_sender.held_rows[must_send.id]
+        self.assertEqual(rejections, 1)
+        self.assertGreater(retry_at - time.monotonic(), constants.FAILURE_EXTRA_SLEEP_SECONDS - 1)
+
+        # Turned down again, it waits twice as long.
+        self.async_sender.held_rows[must_send.id] = (0, rejections)
+        self.async_sender.bRunning = True
+        self._run_for(0.5)
+        self.assertEqual(len(self.server.posts), 2)
+        retry_at, rejections = self.async_sender.held_rows[must_send.id]
+        self.assertEqual(rejections, 2)
+        self.assertGreater(retry_at - time.monotonic(), 2 * constants.FAILURE_EXTRA_SLEEP_SECONDS - 1)
+
+    @patch("data_sender.constants.BATCH_UPLOADS", False)
+    def test_rejected_test_post_closes_the_circuit(self):
+        self.server.status = 400
+        self._insert_rows(2)
+        self.session.commit()
+        self.async_sender.uplink.state = uplink.OPEN
+        self._run_for(0.5)
+
+        # The post testing the uplink was turned down, but it got an answer.
+        self.assertEqual(self.async_sender.uplink.state, uplink.CLOSED)
+        self.assertEqual(self.async_sender.uplink.allowed_in_flight(4), 4)
+
+    def test_wakes_up_for_new_rows(self):
+        inserted_at = []
+
+        def insert_row():
+            self._insert_rows(1)
+            self.session.commit()
+            inserted_at.append(time.monotonic())
+
+        self.loop.call_later(0.5, insert_row)
+        with patch.object(
+            self.async_sender.scheduler, "next_rows", wraps=self.async_sender.scheduler.next_rows
+        ) as next_rows:
+            self._run_for(1.5)
+
+        self.assertEqual(len(self.server.posts), 1)
+        self.assertLess(self.server.post_times[0] - inserted_at[0], 0.5)
+        # When it started, after the notification and after the post finished, not every second.
+        self.assertEqual(next_rows.call_count, 3)
+
+    def test_batch(self):
+        rows = self._insert_rows(3)
+        self.server.item_status = {rows[1].id: 500}
+        self.session.commit()
+        self._run_for(0.3)
+        # The message that failed in the batch went out again on its own.
+        self.assertEqual(
+            [(path, data.get("messages", [data])) for path, data in self.server.posts],
+            [
+                ("/api/v1/" + constants.BATCH_URL, [
+                    {"id": row.id, "endpoint": row.endpoint, "payload": row.payload} for row in rows
+                ]),
+                ("/api/v1/" + common_constants.NOTIFICATION_ENDPOINT, [rows[1].payload]),
+            ],
+        )
+        self.assertEqual([row.flag for row in rows], [True, True, True])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestUplink(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.random = 1.0
+        self.uplink = Uplink(clock=self.clock, random=lambda: self.random)
+
+    def _fail(self, kind):
+        self.uplink.failure(kind, self.clock.now)
+        return self.uplink.seconds_until_retry()
+
+    @patch.dict(constants.BACKOFF_FIRST_SECONDS, {uplink.CONNECTION_FAILURE: 5, uplink.TIMEOUT_FAILURE: 15})
+    @patch("data_sender.constants.BACKOFF_MAX_SECONDS", 30)
+    @patch("data_sender.constants.FAILURES_TO_OPEN_CIRCUIT", 100)
+    def test_backoff_for_each_kind_of_failure(self):
+        self.assertEqual(self._fail(uplink.CONNECTION_FAILURE), 5)
+        self.clock.now += 1
+        self.assertEqual(self._fail(uplink.CONNECTION_FAILURE), 10)
+        self.clock.now += 1
+        self.assertEqual(self._fail(uplink.TIMEOUT_FAILURE), 15)
+        self.clock.now += 1
+        self.assertEqual(self._fail(uplink.CONNECTION_FAILURE), 20)
+        self.clock.now += 1
+        self.assertEqual(self._fail(uplink.CONNECTION_FAILURE), 30)
+        # Half of it is random.
+        self.clock.now += 1
+        self.random = 0.0
+        self.assertEqual(self._fail(uplink.TIMEOUT_FAILURE), 15)
+
+        self.uplink.success()
+        self.assertEqual(self.uplink.allowed_in_flight(4), 4)
+        self.assertEqual(self._fail(uplink.CONNECTION_FAILURE), 2.5)
+
+    @patch("data_sender.constants.FAILURES_TO_OPEN_CIRCUIT", 2)
+    def test_circuit_breaker(self):
+        self.assertEqual(self.uplink.allowed_in_flight(4), 4)
+        backoff = self._fail(uplink.SERVER_FAILURE)
+        self.assertEqual(self.uplink.allowed_in_flight(4), 0)
+        self.clock.now += backoff
+        self.assertEqual(self.uplink.allowed_in_flight(4), 4)
+
+        self.clock.now += 1
+        backoff = self._fail(uplink.SERVER_FAILURE)
+        self.assertEqual(self.uplink.state, uplink.OPEN)
+        self.clock.now += backoff
+        self.assertEqual(self.uplink.allowed_in_flight(4), 1)
+        self.assertEqual(self.uplink.state, uplink.HALF_OPEN)
+
+        # The test post failed too.
+        self.clock.now += 1
+        backoff = self._fail(uplink.SERVER_FAILURE)
+        self.assertEqual(self.uplink.state, uplink.OPEN)
+        self.clock.now += backoff
+        self.assertEqual(self.uplink.allowed_in_flight(4), 1)
+        self.uplink.success()
+        self.assertEqual(self.uplink.state, uplink.CLOSED)
+        self.assertEqual(self.uplink.allowed_in_flight(4), 4)
+
+    def test_posts_that_failed_together_count_once(self):
+        started_at = self.clock.now
+        self.clock.now += 10
+        for _ in range(constants.MAX_IN_FLIGHT):
+            self.uplink.failure(uplink.CONNECTION_FAILURE, started_at)
+        self.assertEqual(self.uplink.failures_in_a_row, 1)
+        self.assertEqual(self.uplink.state, uplink.CLOSED)
+
+
+class WaitingRowsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.session = Session()
+        self.session.query(DataToSend).delete()
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        try:
+            # Collapsing the pings commits.
+            self.session.rollback()
+            self.session.query(DataToSend).delete()
+            self.session.commit()
+            # Row counts from the ANALYZE in a test aren't rolled back.
+            self.session.execute("ANALYZE data_to_send")
+        finally:
+            self.session.close()
+
+    def _insert(self, priority, minutes_ago, payload=None, resend=None):
+        row = DataToSend(
+            timestamp=datetime.now() - timedelta(minutes=minutes_ago),
+            endpoint=common_constants.PING_ENDPOINT
+            if priority == common_constants.DATA_PRIORITY_PING
+            else common_constants.REPORT_ENDPOINT,
+            payload=payload or {"minutes_ago": minutes_ago},
+            flag=False,
+            resend=priority != common_constants.DATA_PRIORITY_PING if resend is None else resend,
+            priority=priority,
+        )
+        self.session.add(row)
+        self.session.flush()
+        return row
+
+
+class TestSendScheduler(WaitingRowsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.scheduler = SendScheduler(clock=self.clock)
+
+    def test_notifications_go_first(self):
+        ping = self._insert(common_constants.DATA_PRIORITY_PING, 60)
+        old_report = self._insert(common_constants.DATA_PRIORITY_REPORT, 50)
+        report = self._insert(common_constants.DATA_PRIORITY_REPORT, 20)
+        notification = self._insert(common_constants.DATA_PRIORITY_NOTIFICATION, 1)
+        self.assertEqual(self.scheduler.next_rows(self.session, 4), [notification, old_report, report, ping])
+        self.assertEqual(self.scheduler.next_rows(self.session, 2), [notification, old_report])
+
+    @patch.dict(constants.MESSAGES_PER_MINUTE, {common_constants.DATA_PRIORITY_REPORT: 2})
+    def test_rate_limits(self):
+        scheduler = SendScheduler(clock=self.clock)
+        reports = [self._insert(common_constants.DATA_PRIORITY_REPORT, 10 - i) for i in range(5)]
+        notifications = [self._insert(common_constants.DATA_PRIORITY_NOTIFICATION, 5 - i) for i in range(3)]
+        self.assertEqual(scheduler.next_rows(self.session, 10), notifications + reports[:2])
+        scheduler.take(notifications + reports[:2])
+        for row in notifications + reports[:2]:
+            row.flag = True
+        self.assertEqual(scheduler.next_rows(self.session, 10), [])
+        self.clock.now = 30
+        self.assertEqual(scheduler.next_rows(self.session, 10), reports[2:3])
+        self.clock.now = 3600
+        self.assertEqual(scheduler.next_rows(self.session, 10), reports[2:4])
+
+    @patch.dict(constants.MESSAGES_PER_MINUTE, {common_constants.DATA_PRIORITY_REPORT: 2})
+    def test_rows_not_sent_dont_use_the_rate_limit(self):
+        scheduler = SendScheduler(clock=self.clock)
+        reports = [self._insert(common_constants.DATA_PRIORITY_REPORT, 10 - i) for i in range(3)]
+        self.assertEqual(scheduler.next_rows(self.session, 10), reports[:2])
+        # Only the first one fit in the post.
+        scheduler.take(reports[:1])
+        reports[0].flag = True
+        self.assertEqual(scheduler.next_rows(self.session, 10), reports[1:2])
+
+    def test_more_waiting(self):
+        reports = [self._insert(common_constants.DATA_PRIORITY_REPORT, 10 - i) for i in range(2)]
+        self.assertEqual(self.scheduler.next_rows(self.session, 1), reports[:1])
+        self.assertTrue(self.scheduler.more_waiting)
+        self.assertEqual(self.scheduler.next_rows(self.session, 10), reports)
+        self.assertFalse(self.scheduler.more_waiting)
+
+    def test_pings_that_werent_sent_collapse_into_the_newest(self):
+        pings = [
+            self._insert(common_constants.DATA_PRIORITY_PING, 30 - i, {"ping_trips": i, "ping_doors": 2 * i})
+            for i in range(1, 4)
+        ]
+        self.assertEqual(self.scheduler.next_rows(self.session, 4), [pings[2]])
+        self.assertEqual([(p.flag, p.success) for p in pings[:2]], [(True, False), (True, False)])
+        self.assertEqual(pings[2].payload, {"ping_trips": 6, "ping_doors": 12})
+
+    def test_picking_rows_uses_the_index(self):
+        self.session.execute(
+            "INSERT INTO data_to_send (timestamp, endpoint, payload, flag, resend, priority) "
+            "SELECT NOW() - i * INTERVAL '1 minute', 'devices/track', '{}', TRUE, TRUE, i % 3 "
+            "FROM generate_series(1, 50000) i"
+        )
+        self.session.execute("ANALYZE data_to_send")
+        query = (
+            self.session.query(DataToSend)
+            .filter(DataToSend.flag == False, DataToSend.priority == common_constants.DATA_PRIORITY_REPORT)
+            .order_by(DataToSend.timestamp.asc())
+            .limit(50)
+        )
+        compiled = query.statement.compile(dialect=postgresql.dialect())
+        plan = "\n".join(
+            row[0] for row in self.session.connection().execute("EXPLAIN " + str(compiled), compiled.params)
+        )
+        self.assertIn("data_to_send_flag_priority_timestamp_idx", plan)
+        self.assertNotIn("Sort", plan)
+
+
+class TestSpool(WaitingRowsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.spool = Spool(clock=self.clock)
+
+    def _states(self, rows):
+        return [(row.flag, row.success) for row in rows]
+
+    def test_identical_reports_are_sent_once(self):
+        reports = [
+            self._insert(common_constants.DATA_PRIORITY_REPORT, 30 - i, payload)
+            for i, payload in enumerate([{"a": 1, "b": 2}, {"a": 2}, {"b": 2, "a": 1}, {"a": 1, "b": 2}])
+        ]
+        busy = self._insert(common_constants.DATA_PRIORITY_REPORT, 5, {"a": 2})
+        self.assertEqual(self.spool.compact(self.session, [busy.id]), 2)
+        self.assertEqual(self._states(reports + [busy]), [
+            (False, None), (False, None), (True, False), (True, False), (False, None)
+        ])
+
+    def test_pings_in_flight_are_left_alone(self):
+        pings = [
+            self._insert(common_constants.DATA_PRIORITY_PING, 30 - i, {"ping_trips": i, "ping_doors": 0})
+            for i in range(1, 4)
+        ]
+        self.assertEqual(self.spool.compact(self.session, [pings[2].id]), 1)
+        self.assertEqual(self._states(pings), [(True, False), (False, None), (False, None)])
+        self.assertEqual(pings[1].payload, {"ping_trips": 3, "ping_doors": 0})
+
+    def test_least_important_are_dropped_over_the_byte_budget(self):
+        def payload(n):
+            return {"text": "x" * 90, "n": n}
+
+        notification = self._insert(common_constants.DATA_PRIORITY_NOTIFICATION, 60, payload(0))
+        essential = [self._insert(common_constants.DATA_PRIORITY_REPORT, 50 - i, payload(1 + i)) for i in range(2)]
+        non_essential = self._insert(common_constants.DATA_PRIORITY_REPORT, 10, payload(3), resend=False)
+        ping = self._insert(common_constants.DATA_PRIORITY_PING, 1, payload(4))
+        rows = [notification] + essential + [non_essential, ping]
+        # They're all the same size.
+        size = self.session.execute("SELECT MAX(octet_length(payload::text)) FROM data_to_send").scalar()
+
+        with patch("data_sender.constants.SPOOL_MAX_BYTES", 5 * size):
+            self.assertEqual(self.spool.compact(self.session), 0)
+        with patch("data_sender.constants.SPOOL_MAX_BYTES", 3 * size), patch("data_sender.spool.logger") as logger:
+            self.assertEqual(self.spool.compact(self.session), 2)
+        warning = logger.warning.call_args[0][0]
+        self.assertIn("{0} bytes of messages waiting".format(5 * size), warning)
+        self.assertIn("Kept {0} bytes".format(3 * size), warning)
+        self.assertEqual([row.flag for row in rows], [False, False, False, True, True])
+        # The oldest of the messages that must be sent goes before a notification.
+        with patch("data_sender.constants.SPOOL_MAX_BYTES", 1.5 * size):
+            self.assertEqual(self.spool.compact(self.session, [essential[0].id]), 1)
+        self.assertEqual([row.flag for row in rows], [False, False, True, True, True])
+
+    def test_compacts_at_an_interval(self):
+        with patch.object(self.spool, "compact") as compact:
+            self.spool.compact_if_due(self.session)
+            self.clock.now = constants.SPOOL_COMPACT_SECONDS - 1
+            self.spool.compact_if_due(self.session)
+            self.assertEqual(compact.call_count, 1)
+            self.clock.now = constants.SPOOL_COMPACT_SECONDS
+            self.spool.compact_if_due(self.session)
+            self.assertEqual(compact.call_count, 2)
+
+
+class TestWireFormat(unittest.TestCase):
+    payload = {"ping_trips": 3, "ping_doors": 1}
+
+    @patch("data_sender.constants.BINARY_WIRE_FORMAT", False)
+    def test_json_unless_binary_is_available(self):
+        wf = WireFormat()
+        data, headers = wf.encode(self.payload)
+        self.assertEqual(json.loads(zlib.decompress(data).decode()), self.payload)
+        self.assertEqual(headers, {"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        # Even if the server asks for it.
+        self.assertFalse(wf.answered(headers, 200, {wire_format.FORMAT_HEADER: wire_format.MSGPACK_ZSTD}))
+        self.assertEqual(wf.encode(self.payload), (data, headers))
+
+    @unittest.skipIf(not wire_format.binary_available(), "needs msgpack and zstandard")
+    @patch("data_sender.constants.ZSTD_DICTIONARY_FILE", "/nonexistent/payloads.zstd-dict")
+    def test_binary_when_the_server_asks_for_it(self):
+        clock = FakeClock()
+        wf = WireFormat(clock)
+        binary = {wire_format.FORMAT_HEADER: wire_format.MSGPACK_ZSTD}
+        _, headers = wf.encode(self.payload)
+        self.assertEqual(headers[wire_format.OFFER_HEADER], wire_format.MSGPACK_ZSTD)
+        self.assertFalse(wf.answered(headers, 200, binary))
+
+        data, headers = wf.encode(self.payload)
+        self.assertEqual(headers["Content-Encoding"], "zstd")
+        self.assertEqual(headers[wire_format.DICTIONARY_HEADER], "0")
+        unpacked = wire_format.msgpack.unpackb(wire_format.zstandard.ZstdDecompressor().decompress(data), raw=False)
+        self.assertEqual(unpacked, self.payload)
+
+        # The server couldn't read it after all, JSON for a while.
+        self.assertTrue(wf.answered(headers, 415, {}))
+        _, headers = wf.encode(self.payload)
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        wf.answered(headers, 200, binary)
+        self.assertEqual(wf.encode(self.payload)[1]["Content-Encoding"], "gzip")
+        clock.now = constants.BINARY_FALLBACK_SECONDS
+        wf.answered(headers, 200, binary)
+        self.assertEqual(wf.encode(self.payload)[1]["Content-Encoding"], "zstd")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,83 @@
+import logging
+import random
+import time
+
+from data_sender import constants
+
+logger = logging.getLogger("data_sender")
+
+CONNECTION_FAILURE = "connection"
+TIMEOUT_FAILURE = "timeout"
+SERVER_FAILURE = "server"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class Uplink:
+    """
+    Circuit breaker for the link to the cloud, with a jittered exponential backoff for each kind of failure.
+
+    Closed: posts go out, up to the window.  After a failure nothing new starts until the backoff is over.
+    Open: FAILURES_TO_OPEN_CIRCUIT failures in a row.  Once the backoff is over it's half-open and one post
+    goes out to test the uplink.  If that works it closes again, if not it opens for a longer backoff.
+
+    The posts that were in flight together when the uplink went down all fail, but only count as one failure.
+    """
+
+    def __init__(self, clock=time.monotonic, random=random.random):
+        self.clock = clock
+        self.random = random
+        self.state = CLOSED
+        self.failures = {}
+        self.failures_in_a_row = 0
+        self.last_failure_at = None
+        self.retry_at = 0
+
+    def _backoff_seconds(self, kind):
+        count = self.failures.get(kind, 0)
+        seconds = min(constants.BACKOFF_MAX_SECONDS, constants.BACKOFF_FIRST_SECONDS[kind] * 2 ** (count - 1))
+        return seconds / 2 + self.random() * seconds / 2
+
+    def seconds_until_retry(self):
+        return max(0, self.retry_at - self.clock())
+
+    def allowed_in_flight(self, window):
+        """
+        How many posts can be in flight right now.
+        """
+        if self.seconds_until_retry() > 0:
+            return 0
+        if self.state == OPEN:
+            logger.info("Testing the uplink with one post")
+            self.state = HALF_OPEN
+        return 1 if self.state == HALF_OPEN else window
+
+    def success(self):
+        if self.state != CLOSED:
+            logger.info("The uplink works again, the circuit is closed")
+        self.state = CLOSED
+        self.failures = {}
+        self.failures_in_a_row = 0
+        self.retry_at = 0
+
+    def failure(self, kind, started_at):
+        """
+        A post that started at started_at (by the same clock) failed with the given kind of failure.
+        """
+        if self.last_failure_at is not None and started_at < self.last_failure_at:
+            return
+        now = self.clock()
+        self.last_failure_at = now
+        self.failures[kind] = self.failures.get(kind, 0) + 1
+        self.failures_in_a_row += 1
+        backoff = self._backoff_seconds(kind)
+        self.retry_at = now + backoff
+        if self.state == HALF_OPEN or self.failures_in_a_row >= constants.FAILURES_TO_OPEN_CIRCUIT:
+            self.state = OPEN
+        logger.info(
+            "Uplink {0} failure, {1} in a row, the circuit is {2}, next post in {3:.0f} seconds".format(
+                kind, self.failures_in_a_row, self.state, backoff
+            )
+        )
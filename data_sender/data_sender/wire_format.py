@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import time
+import zlib
+
+from data_sender import constants
+
+# Both are optional, without them payloads always go as JSON.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger("data_sender")
+
+JSON_GZIP = "json+gzip"
+MSGPACK_ZSTD = "msgpack+zstd"
+
+# JSON posts offer the binary format and the id of our zstd dictionary (0 for none) when we can send it.
+# A server that can read it names it in FORMAT_HEADER of its answer and from then on payloads go binary.
+OFFER_HEADER = "X-LiftAI-Wire-Formats"
+DICTIONARY_HEADER = "X-LiftAI-Zstd-Dictionary"
+FORMAT_HEADER = "X-LiftAI-Wire-Format"
+
+UNSUPPORTED_MEDIA_TYPE = 415
+
+
+def binary_available():
+    return msgpack is not None and zstandard is not None
+
+
+def pack(payload):
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def encode_json(payload):
+    # zlib, not gzip, but the cloud has always been told gzip.
+    return zlib.compress(json.dumps(payload).encode())
+
+
+def load_dictionary(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return zstandard.ZstdCompressionDict(f.read())
+
+
+def train_dictionary(payloads, size=None):
+    """
+    A zstd dictionary trained on the MessagePack of the given payloads.
+    """
+    return zstandard.train_dictionary(size or constants.ZSTD_DICTIONARY_BYTES, [pack(p) for p in payloads])
+
+
+def make_compressor(dictionary=None):
+    return zstandard.ZstdCompressor(level=constants.ZSTD_LEVEL, dict_data=dictionary)
+
+
+class WireFormat:
+    """
+    The format payloads go to the cloud in.
+
+    JSON compressed with zlib always works.  With msgpack and zstandard installed, and a server that asks for
+    it, payloads go as MessagePack compressed with zstd, with a dictionary trained on our own payloads
+    (ZSTD_DICTIONARY_FILE) if there is one.  Pings, reports and notifications are small and use the same
+    keys every time, the dictionary already has most of them.
+
+    If the server answers a binary post with 415, payloads go as JSON again for BINARY_FALLBACK_SECONDS.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.format = JSON_GZIP
+        self.binary_retry_at = 0
+        self.compressor = None
+        self.dictionary_id = 0
+        if constants.BINARY_WIRE_FORMAT and binary_available():
+            dictionary = load_dictionary(constants.ZSTD_DICTIONARY_FILE)
+            self.compressor = make_compressor(dictionary)
+            self.dictionary_id = dictionary.dict_id() if dictionary is not None else 0
+
+    def encode(self, payload):
+        """
+        Returns the body and the headers to post payload with.
+        """
+        if self.format == MSGPACK_ZSTD:
+            headers = {
+                "Content-Type": "application/msgpack",
+                "Content-Encoding": "zstd",
+                DICTIONARY_HEADER: str(self.dictionary_id),
+            }
+            return self.compressor.compress(pack(payload)), headers
+        headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        if self.compressor is not None:
+            headers.update({OFFER_HEADER: MSGPACK_ZSTD, DICTIONARY_HEADER: str(self.dictionary_id)})
+        return encode_json(payload), headers
+
+    def answered(self, sent_headers, status, headers):
+        """
+        Look at the answer to a post that went with sent_headers.
+        Returns True if the server couldn't read it, then it has to go again, as JSON.
+        """
+        if status == UNSUPPORTED_MEDIA_TYPE and sent_headers.get("Content-Encoding") == "zstd":
+            logger.info(
+                "The server turned down {0}, sending JSON for {1} seconds".format(
+                    MSGPACK_ZSTD, constants.BINARY_FALLBACK_SECONDS
+                )
+            )
+            self.format = JSON_GZIP
+            self.binary_retry_at = self.clock() + constants.BINARY_FALLBACK_SECONDS
+            return True
+
+        wanted = headers.get(FORMAT_HEADER)
+        if wanted == MSGPACK_ZSTD and self.compressor is not None and self.clock() >= self.binary_retry_at:
+            if self.format != MSGPACK_ZSTD:
+                logger.info("Sending {0} with zstd dictionary {1}".format(MSGPACK_ZSTD, self.dictionary_id))
+            self.format = MSGPACK_ZSTD
+        elif wanted == JSON_GZIP:
+            self.format = JSON_GZIP
+        return False
@@ -0,0 +1,295 @@
+"""
+Load test of the data sender against a local stand-in for the cloud.
+
+    python load_test.py --messages 5000 --mix notification=1,report=5,ping=20 --latency-ms 300 --reset-rate 0.02
+
+It empties data_to_send, fills it with a backlog (see test_filldb.py), starts the stand-in server (see
+test_server.py for the faults it can inject) and the data sender, and watches them every --interval seconds
+until the backlog is sent or --duration runs out.  With --trickle new notifications keep coming in while it
+drains, and their time from insert to server is measured too.
+
+Reports and pings only go out as fast as MESSAGES_PER_MINUTE allows, a backlog of them takes a while on
+purpose.  --no-rate-limits measures how fast the rest of the pipeline can go.
+
+Every interval it prints how many messages are waiting, how many reached the server, the CPU the sender
+used and the load on the whole database, our own sampling queries included.  At the end it prints the
+drain throughput and latency percentiles.
+
+This empties data_to_send in the local database, don't run it on a device in service.
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+from sqlalchemy import func, text
+
+import test_filldb
+import test_server
+from utilities.db_utilities import session_scope, DataToSend
+
+DB_COUNTERS = ("xact_commit", "xact_rollback", "tup_returned", "tup_fetched", "tup_inserted", "tup_updated")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+SERVER_START_SECONDS = 10
+
+
+def percentile(values, percent):
+    """
+    Nearest rank, None without values.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(round(percent / 100 * len(values))) - 1))]
+
+
+def format_seconds(seconds):
+    return "-" if seconds is None else "{0:.0f} ms".format(1000 * seconds)
+
+
+def run_sender(kind, url, rate_limits, results):
+    """
+    The data sender in its own process, sends back the time each post took when it stops.
+    """
+    from data_sender import constants
+    from data_sender.async_sender import AsyncDataSender
+    from data_sender.datasender import LiftAIDataSender
+    from utilities import common_constants
+
+    logging.basicConfig(level=logging.WARNING)
+    os.environ[constants.URL_ENV_VAR_NAME] = url
+    constants.REBOOT_INFO = os.path.join(tempfile.mkdtemp(), "reboot_info")
+    if not rate_limits:
+        constants.MESSAGES_PER_MINUTE = {}
+
+    sender = (AsyncDataSender if kind == "async" else LiftAIDataSender)(common_constants.DSN)
+    post_seconds = []
+    record_post = sender._record_post
+
+    def _record_post(seconds, new_connections, body_bytes):
+        post_seconds.append(seconds)
+        record_post(seconds, new_connections, body_bytes)
+
+    sender._record_post = _record_post
+    signal.signal(signal.SIGTERM, sender.stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        sender.run_forever()
+    finally:
+        results.put({"post_seconds": post_seconds, "http_stats": str(sender.http_stats)})
+
+
+def wait_for_server(url):
+    deadline = time.monotonic() + SERVER_START_SECONDS
+    while True:
+        try:
+            return server_stats(url)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def server_stats(url):
+    with urllib.request.urlopen(url + "/stats", timeout=5) as response:
+        return json.loads(response.read().decode())
+
+
+def process_cpu_seconds(pid):
+    """
+    User and system CPU time of a process, from /proc.
+    """
+    with open("/proc/{0}/stat".format(pid)) as f:
+        # The name in parentheses can have spaces, the fields after it can't.
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def db_counters(session):
+    row = session.execute(
+        text("SELECT {0} FROM pg_stat_database WHERE datname = current_database()".format(", ".join(DB_COUNTERS)))
+    ).fetchone()
+    return dict(zip(DB_COUNTERS, row))
+
+
+def trickle(session, rng, first_number, count):
+    for n in range(count):
+        session.add(
+            test_filldb.make_row("notification", first_number + n, datetime.utcnow(), rng, time.time())
+        )
+
+
+class Timeline:
+    COLUMNS = (
+        "seconds", "waiting", "received", "received_per_second", "sender_cpu_percent", "db_transactions_per_second",
+        "db_tuples_read_per_second", "db_tuples_written_per_second",
+    )
+
+    def __init__(self):
+        self.samples = []
+        self.last = None
+
+    def add(self, seconds, waiting, received, cpu_seconds, counters):
+        sample = {"seconds": seconds, "waiting": waiting, "received": received}
+        if self.last is not None:
+            last_seconds, last_received, last_cpu_seconds, last_counters = self.last
+            elapsed = seconds - last_seconds
+
+            def rate(key):
+                return (counters[key] - last_counters[key]) / elapsed
+
+            sample.update({
+                "received_per_second": (received - last_received) / elapsed,
+                "sender_cpu_percent": 100 * (cpu_seconds - last_cpu_seconds) / elapsed,
+                "db_transactions_per_second": rate("xact_commit") + rate("xact_rollback"),
+                "db_tuples_read_per_second": rate("tup_returned") + rate("tup_fetched"),
+                "db_tuples_written_per_second": rate("tup_inserted") + rate("tup_updated"),
+            })
+        self.last = (seconds, received, cpu_seconds, counters)
+        self.samples.append(sample)
+        return sample
+
+    @staticmethod
+    def format(sample):
+        rates = [
+            "-" if sample.get(key) is None else "{0:.1f}{1}".format(sample[key], "%" if key.endswith("percent") else "")
+            for key in Timeline.COLUMNS[3:]
+        ]
+        return "{0:>7.1f} s {1:>7} waiting {2:>7} received {3:>8} msg/s {4:>6} CPU {5:>8} xact/s {6:>9} rd/s {7:>8} wr/s".format(
+            sample["seconds"], sample["waiting"], sample["received"], *rates
+        )
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="backlog to start with")
+    parser.add_argument("--mix", default=test_filldb.DEFAULT_MIX, help="relative weight of each kind of message")
+    parser.add_argument("--hours", type=float, default=24, help="spread the backlog over this many hours")
+    parser.add_argument("--trickle", type=float, default=0, help="new notifications per second while it drains")
+    parser.add_argument("--sender", choices=("async", "sync"), default="async", help="which data sender to run")
+    parser.add_argument("--no-rate-limits", action="store_true", help="send reports and pings as fast as it can")
+    parser.add_argument("--duration", type=float, default=600, help="give up after this many seconds")
+    parser.add_argument("--interval", type=float, default=1, help="seconds between samples")
+    parser.add_argument("--port", type=int, default=8089, help="port for the stand-in server")
+    parser.add_argument("--csv", help="save the timeline to this file")
+    test_server.add_arguments(parser)
+    args = parser.parse_args()
+
+    counts = test_filldb.fill_db(args.messages, args.mix, args.hours, clear=True, seed=args.seed)
+    print("Backlog: {0}".format(", ".join("{0} {1}s".format(c, k) for k, c in sorted(counts.items()))))
+    with session_scope() as session:
+        # The trickled notifications come after it.
+        last_backlog_id = session.query(func.max(DataToSend.id)).scalar() or 0
+
+    # Spawned, not forked, so neither of them shares our database connections.
+    context = multiprocessing.get_context("spawn")
+    url = "http://localhost:{0}".format(args.port)
+    server = context.Process(target=test_server.run, args=("localhost", args.port, test_server.Faults.from_args(args)))
+    server.start()
+    wait_for_server(url)
+    results = context.Queue()
+    sender = context.Process(target=run_sender, args=(args.sender, url, not args.no_rate_limits, results))
+
+    timeline = Timeline()
+    rng = random.Random(args.seed)
+    trickled = 0.0
+    next_number = args.messages
+    drained_at = None
+    start = time.monotonic()
+    sender.start()
+    try:
+        while sender.is_alive():
+            seconds = time.monotonic() - start
+            with session_scope() as session:
+                if args.trickle:
+                    trickled += args.trickle * args.interval
+                    trickle(session, rng, next_number, int(trickled))
+                    next_number += int(trickled)
+                    trickled -= int(trickled)
+            with session_scope() as session:
+                waiting = session.query(DataToSend).filter(DataToSend.flag == False).count()
+                backlog = (
+                    session.query(DataToSend).filter(DataToSend.flag == False, DataToSend.id <= last_backlog_id).count()
+                )
+                counters = db_counters(session)
+            stats = server_stats(url)
+            print(Timeline.format(
+                timeline.add(seconds, waiting, stats["received"], process_cpu_seconds(sender.pid), counters)
+            ))
+            if backlog == 0 and drained_at is None:
+                drained_at = seconds
+            if drained_at is not None or seconds >= args.duration:
+                break
+            time.sleep(max(0, start + seconds + args.interval - time.monotonic()))
+    finally:
+        os.kill(sender.pid, signal.SIGTERM)
+        try:
+            sender_results = results.get(timeout=60)
+        except queue.Empty:
+            sender_results = {"post_seconds": [], "http_stats": "the sender didn't stop"}
+        sender.join()
+        stats = server_stats(url)
+        server.terminate()
+        server.join()
+
+    with session_scope() as session:
+        dropped = (
+            session.query(DataToSend)
+            .filter(DataToSend.id <= last_backlog_id, DataToSend.flag == True, DataToSend.success == False)
+            .count()
+        )
+    if args.csv:
+        timeline.write_csv(args.csv)
+    print_summary(args, timeline, drained_at, dropped, stats, sender_results)
+    return 0 if drained_at is not None else 1
+
+
+def print_summary(args, timeline, drained_at, dropped, stats, sender_results):
+    print()
+    if drained_at is None:
+        print("The backlog of {0} messages wasn't sent in {1:.0f} s".format(args.messages, args.duration))
+    else:
+        # The spool folds pings together and drops duplicates, what reached the server is what counts.
+        received = next(s["received"] for s in timeline.samples if s["seconds"] == drained_at)
+        print("Drained {0} messages in {1:.1f} s, {2} reached the server, {3:.1f} messages/s".format(
+            args.messages, drained_at, received, received / drained_at if drained_at else 0
+        ))
+    print("{0} messages of the backlog were dropped by the spool or failed".format(dropped))
+    post_seconds = sender_results["post_seconds"]
+    print("Posts: {0}, {1} of them batches. Time per post p50 {2}, p90 {3}, p99 {4}".format(
+        len(post_seconds), stats["batches"], *[format_seconds(percentile(post_seconds, p)) for p in (50, 90, 99)]
+    ))
+    if stats["latencies"]:
+        print("Notifications from insert to server: p50 {0}, p90 {1}, p99 {2}".format(
+            *[format_seconds(percentile(stats["latencies"], p)) for p in (50, 90, 99)]
+        ))
+    print("Faults injected: {0}, messages received twice: {1}".format(
+        ", ".join("{0} {1}".format(n, fault) for fault, n in sorted(stats["faults"].items())), stats["duplicates"]
+    ))
+    cpu = [s["sender_cpu_percent"] for s in timeline.samples if s.get("sender_cpu_percent") is not None]
+    transactions = [s["db_transactions_per_second"] for s in timeline.samples if "db_transactions_per_second" in s]
+    if cpu:
+        print("Sender CPU: {0:.1f}% on average, {1:.1f}% at most. Database: {2:.1f} transactions/s on average".format(
+            sum(cpu) / len(cpu), max(cpu), sum(transactions) / len(transactions)
+        ))
+    print("Sender HTTP stats: {0}".format(sender_results["http_stats"]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
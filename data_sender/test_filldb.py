@@ -0,0 +1,135 @@
+"""
+Fill data_to_send with a backlog of messages like the apps make, for load testing the data sender.
+
+    python test_filldb.py --messages 2000 --mix notification=1,report=5,ping=20 --hours 48 --clear
+
+The messages are spread evenly over the last --hours, the way they pile up while a device is offline.
+This writes to the local database, don't run it on a device in service.
+"""
+import argparse
+import bisect
+import itertools
+import random
+from datetime import datetime, timedelta
+
+import pytz
+
+from test_server import ID_KEY, INSERTED_AT_KEY
+from utilities import common_constants
+from utilities.db_utilities import session_scope, DataToSend
+
+DEFAULT_MIX = "notification=1,report=5,ping=20"
+SERIAL_NUMBER = "load_test_device"
+
+
+def parse_mix(mix):
+    """
+    "notification=1,report=5" -> {"notification": 1, "report": 5}
+    """
+    weights = {}
+    for part in mix.split(","):
+        kind, weight = part.split("=")
+        if kind not in MESSAGES:
+            raise ValueError("Unknown kind of message {0}, use {1}".format(kind, ", ".join(MESSAGES)))
+        weights[kind] = float(weight)
+    return weights
+
+
+def _notification(rng, date):
+    return {
+        "id": SERIAL_NUMBER,
+        "type": rng.choice(["shutdown", "car", "power"]),
+        "date": date.isoformat(),
+        "text": "This elevator is now moving again",
+        "last_trip_start": date.isoformat(),
+        "last_trip_is_up": rng.random() < 0.5,
+    }
+
+
+def _report(rng, date):
+    speeds = sorted(round(rng.uniform(0.5, 3.5), 2) for _ in range(3))
+    return {
+        "type": common_constants.MESSAGE_TYPE_HOURLY_REPORT,
+        "id": SERIAL_NUMBER,
+        "date": date.replace(minute=0, second=0).isoformat(),
+        "min_speed": speeds[0],
+        "avg_speed": speeds[1],
+        "max_speed": speeds[2],
+        "duty_cycle": round(rng.uniform(0, 40), 2),
+        "system": {"cpu_temp": round(rng.uniform(40, 70), 1), "disk_free": rng.randint(10 ** 9, 4 * 10 ** 9)},
+        "uptime": round(rng.uniform(90, 100), 2),
+        "max_trip_duration": round(rng.uniform(10, 40), 1),
+        "min_trip_duration": round(rng.uniform(2, 10), 1),
+    }
+
+
+def _ping(rng, date):
+    trips = rng.randint(0, 30)
+    return {
+        "id": SERIAL_NUMBER,
+        "type": common_constants.MESSAGE_TYPE_PING,
+        "date": date.isoformat(),
+        "ping_trips": trips,
+        "ping_doors": 2 * trips,
+    }
+
+
+# kind: (make payload, endpoint, priority, resend), like the apps that make them.
+MESSAGES = {
+    "notification": (_notification, common_constants.REPORT_ENDPOINT, common_constants.DATA_PRIORITY_NOTIFICATION, True),
+    "report": (_report, common_constants.REPORT_ENDPOINT, common_constants.DATA_PRIORITY_REPORT, True),
+    "ping": (_ping, common_constants.PING_ENDPOINT, common_constants.DATA_PRIORITY_PING, False),
+}
+
+
+def make_row(kind, number, timestamp, rng, inserted_at=None):
+    make_payload, endpoint, priority, resend = MESSAGES[kind]
+    payload = make_payload(rng, pytz.utc.localize(timestamp))
+    payload[ID_KEY] = number
+    if inserted_at is not None:
+        payload[INSERTED_AT_KEY] = inserted_at
+    return DataToSend(
+        timestamp=timestamp,
+        endpoint=endpoint,
+        payload=payload,
+        flag=False,
+        resend=resend,
+        priority=priority,
+    )
+
+
+def fill_db(messages, mix=DEFAULT_MIX, hours=24, clear=False, seed=0):
+    """
+    Insert a backlog of messages, returns how many of each kind.
+    """
+    rng = random.Random(seed)
+    weights = parse_mix(mix)
+    kinds = sorted(weights)
+    cumulative = list(itertools.accumulate(weights[k] for k in kinds))
+    now = datetime.utcnow().replace(microsecond=0)
+    step = timedelta(hours=hours) / max(messages, 1)
+    counts = dict.fromkeys(kinds, 0)
+    with session_scope() as session:
+        if clear:
+            session.query(DataToSend).delete()
+        for n in range(messages):
+            kind = kinds[bisect.bisect(cumulative, rng.random() * cumulative[-1])]
+            session.add(make_row(kind, n, now - (messages - n) * step, rng))
+            counts[kind] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000, help="how many messages to add")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="relative weight of each kind of message")
+    parser.add_argument("--hours", type=float, default=24, help="spread the messages over this many hours")
+    parser.add_argument("--clear", action="store_true", help="delete everything in data_to_send first")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed makes the same backlog")
+    args = parser.parse_args()
+    counts = fill_db(args.messages, args.mix, args.hours, args.clear, args.seed)
+    print("Added {0}".format(", ".join("{0} {1}s".format(c, k) for k, c in sorted(counts.items()))))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,204 @@
-from aiohttp import web
+"""
+A stand-in for the cloud that the data sender can post to, with faults like a bad cellular link.
 
+    python test_server.py --port 8080 --latency-ms 300 --jitter-ms 200 --reset-rate 0.02 --error-rate 0.05
 
-async def data_handler(request):
-    resp = web.StreamResponse(status=200,
-                              reason='OK',
-                              headers={'Content-Type': 'text/html'})
+Then run the data sender with LIFTAI_URL=http://localhost:8080.  It takes single messages on /api/v1/... and
+batches on the batch endpoint.  GET /stats answers with what it received so far.
 
-    await resp.prepare(request)
-    return resp
+Each post independently gets:
+- a delay of --latency-ms, give or take --jitter-ms,
+- the connection closed without an answer, --reset-rate of the time,
+- 503, --error-rate of the time,
+- otherwise the message is taken and, --slow-rate of the time, the answer trickles out over --slow-seconds.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import random
+import time
+import urllib.parse
+import zlib
 
+from aiohttp import web, web_protocol
 
-def init():
+from data_sender import constants
+
+# test_filldb.py marks the messages, so they can be told apart and timed.
+ID_KEY = "load_test_id"
+INSERTED_AT_KEY = "load_test_inserted_at"
+
+
+class Faults:
+    def __init__(self, latency_ms=0, jitter_ms=0, reset_rate=0, error_rate=0, slow_rate=0, slow_seconds=5, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.reset_rate = reset_rate
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(
+            args.latency_ms, args.jitter_ms, args.reset_rate, args.error_rate, args.slow_rate, args.slow_seconds,
+            args.seed,
+        )
+
+    def delay(self):
+        return max(0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+    def pick(self):
+        """
+        What goes wrong with the next post: "reset", "error", "slow" or None.
+        """
+        roll = self.random.random()
+        for fault, rate in (("reset", self.reset_rate), ("error", self.error_rate), ("slow", self.slow_rate)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=0, help="average delay before answering a post")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="standard deviation of the delay")
+    parser.add_argument("--reset-rate", type=float, default=0, help="share of posts that get the connection closed")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of posts that get 503")
+    parser.add_argument("--slow-rate", type=float, default=0, help="share of answers that trickle out slowly")
+    parser.add_argument("--slow-seconds", type=float, default=5, help="how long a slow answer takes")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the faults")
+
+
+class StandInCloud:
+    def __init__(self, faults):
+        self.faults = faults
+        self.started_at = time.time()
+        self.posts = 0
+        self.batches = 0
+        self.body_bytes = 0
+        self.faults_injected = {"reset": 0, "error": 0, "slow": 0}
+        self.received = {}          # endpoint: how many messages
+        self.seen_ids = set()
+        self.duplicates = 0
+        self.latencies = []         # Seconds from the insert to the server, for messages that say when.
+
+    def stats(self):
+        return {
+            "seconds": time.time() - self.started_at,
+            "posts": self.posts,
+            "batches": self.batches,
+            "body_bytes": self.body_bytes,
+            "faults": self.faults_injected,
+            "received": sum(self.received.values()),
+            "received_by_endpoint": self.received,
+            "duplicates": self.duplicates,
+            "latencies": self.latencies,
+        }
+
+    def _take(self, endpoint, payload):
+        self.received[endpoint] = self.received.get(endpoint, 0) + 1
+        if not isinstance(payload, dict):
+            return
+        if ID_KEY in payload:
+            if payload[ID_KEY] in self.seen_ids:
+                self.duplicates += 1
+            self.seen_ids.add(payload[ID_KEY])
+        if INSERTED_AT_KEY in payload:
+            self.latencies.append(time.time() - payload[INSERTED_AT_KEY])
+
+    async def _answer(self, request, body, slow):
+        if not slow:
+            return web.json_response(body)
+        text = json.dumps(body).encode()
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        response.content_length = len(text)
+        await response.prepare(request)
+        pieces = 5
+        step = max(1, len(text) // pieces)
+        for start in range(0, len(text), step):
+            await asyncio.sleep(self.faults.slow_seconds / pieces)
+            await response.write(text[start:start + step])
+        await response.write_eof()
+        return response
+
+    async def _read(self, request):
+        body = await request.read()
+        self.body_bytes += len(body)
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = zlib.decompress(body)
+        return json.loads(body.decode())
+
+    async def _handle(self, request, endpoint, batch):
+        self.posts += 1
+        if request.headers.get("Content-Encoding") not in (None, "gzip"):
+            # The stand-in never asks for MessagePack, it shouldn't get it.
+            return web.Response(status=415)
+        payload = await self._read(request)
+        await asyncio.sleep(self.faults.delay())
+        fault = self.faults.pick()
+        if fault is not None:
+            self.faults_injected[fault] += 1
+        if fault == "reset":
+            request.transport.close()
+            return web.Response(status=503)
+        if fault == "error":
+            return web.Response(status=503, text="Injected failure")
+
+        if not batch:
+            self._take(endpoint, payload)
+            return await self._answer(request, {}, fault == "slow")
+        self.batches += 1
+        results = []
+        for message in payload["messages"]:
+            self._take(message["endpoint"], message["payload"])
+            results.append({"id": message["id"], "status": 200, "response": {}})
+        return await self._answer(request, {"results": results}, fault == "slow")
+
+    async def message_handler(self, request):
+        endpoint = request.match_info["endpoint"]
+        return await self._handle(request, endpoint, endpoint == constants.BATCH_URL)
+
+    async def stats_handler(self, request):
+        return web.json_response(self.stats())
+
+
+def make_app(faults):
+    cloud = StandInCloud(faults)
     app = web.Application()
-    app.router.add_post("/data", data_handler)
+    app.router.add_get("/stats", cloud.stats_handler)
+    app.router.add_post(urllib.parse.urljoin(constants.API_VERSION, "{endpoint:.+}"), cloud.message_handler)
     return app
 
 
-if __name__ == "__main__":
-    web.run_app(init())
+def run(host, port, faults):
+    # The data sender says gzip but sends zlib, aiohttp would fail to decompress it before we see it.
+    if "auto_decompress" not in inspect.signature(web_protocol.RequestHandler.__init__).parameters:
+        raise SystemExit("The stand-in server needs aiohttp 3.8 or newer to read the bodies itself")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    runner = web.AppRunner(make_app(faults), auto_decompress=False)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, host, port).start())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(runner.cleanup())
 
 
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print("Listening on http://{0}:{1}".format(args.host, args.port))
+    run(args.host, args.port, Faults.from_args(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Bytes of payload on the wire and CPU time per message for each payload format, measured on real payloads.
+
+    python wire_format_benchmark.py [--samples payloads.jsonl] [--limit 5000] [--train-dictionary FILE]
+
+The payloads come from the data_to_send table on this device, or from a file with one JSON payload per line.
+Half of them train the zstd dictionary and the other half are measured, so the dictionary isn't measured on
+the payloads it learned from.  --train-dictionary trains on all of them and saves the dictionary for
+ZSTD_DICTIONARY_FILE.
+
+The MessagePack and zstd formats need msgpack and zstandard installed, without them only JSON is measured.
+"""
+import argparse
+import json
+import time
+
+from data_sender import wire_format
+
+
+def read_samples(path, limit):
+    if path:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()][:limit]
+
+    from utilities.db_utilities import session_scope, DataToSend
+
+    with session_scope() as session:
+        rows = session.query(DataToSend.payload).order_by(DataToSend.id.desc()).limit(limit).all()
+        return [payload for payload, in rows]
+
+
+def encoders(training):
+    yield "json", lambda p: json.dumps(p).encode()
+    yield "json+zlib (now)", wire_format.encode_json
+    if not wire_format.binary_available():
+        return
+    yield "msgpack", wire_format.pack
+    compressor = wire_format.make_compressor()
+    yield "msgpack+zstd", lambda p: compressor.compress(wire_format.pack(p))
+    if training:
+        trained = wire_format.make_compressor(wire_format.train_dictionary(training))
+        yield "msgpack+zstd+dictionary", lambda p: trained.compress(wire_format.pack(p))
+
+
+def measure(encode, payloads):
+    start = time.process_time()
+    total_bytes = sum(len(encode(p)) for p in payloads)
+    cpu_seconds = time.process_time() - start
+    return total_bytes / len(payloads), 1e6 * cpu_seconds / len(payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", help="file with one JSON payload per line, instead of data_to_send")
+    parser.add_argument("--limit", type=int, default=5000, help="how many payloads to read at most")
+    parser.add_argument("--train-dictionary", metavar="FILE", help="save a dictionary trained on all the payloads")
+    args = parser.parse_args()
+
+    payloads = read_samples(args.samples, args.limit)
+    if len(payloads) < 2:
+        parser.error("Need at least 2 payloads, found {0}".format(len(payloads)))
+    training, measured = payloads[::2], payloads[1::2]
+    print("{0} payloads, {1} to train the dictionary and {2} measured".format(
+        len(payloads), len(training), len(measured)
+    ))
+    if not wire_format.binary_available():
+        print("msgpack or zstandard isn't installed, only measuring JSON")
+
+    results = [(name,) + measure(encode, measured) for name, encode in encoders(training)]
+    baseline = next(average_bytes for name, average_bytes, _ in results if name.endswith("(now)"))
+    print("{0:<26} {1:>14} {2:>10} {3:>14}".format("format", "bytes/message", "vs now", "CPU us/message"))
+    for name, average_bytes, cpu_microseconds in results:
+        print("{0:<26} {1:>14.1f} {2:>10.0%} {3:>14.1f}".format(
+            name, average_bytes, average_bytes / baseline, cpu_microseconds
+        ))
+
+    if args.train_dictionary:
+        dictionary = wire_format.train_dictionary(payloads)
+        with open(args.train_dictionary, "wb") as f:
+            f.write(dictionary.as_bytes())
+        print("Saved dictionary {0} to {1}".format(dictionary.dict_id(), args.train_dictionary))
+
+
+if __name__ == "__main__":
+    main()
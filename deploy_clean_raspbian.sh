@@ -133,17 +133,14 @@ sudo systemctl stop elisha.service
 sudo systemctl stop accelerometer.service
 sudo systemctl stop altimeter.service
 sudo systemctl stop audiorecorder.service
-sudo systemctl stop bankstoppage.service
-sudo systemctl stop lowusestoppage.service
+sudo systemctl stop stoppagerunner.service
 sudo systemctl stop reportgenerator.service
-sudo systemctl stop standalonestoppage.service
 sudo systemctl stop trips.service
 sudo systemctl stop vibration.service
 sudo systemctl stop elevation.service
 sudo systemctl stop doors.service
 sudo systemctl stop roawatch.service
 sudo systemctl stop datasender.service
-sudo systemctl stop escalatorstoppage.service
 sudo systemctl stop problemdetection.service
 
 echo "setting up pgbouncer which could cause exceptions in our services running"
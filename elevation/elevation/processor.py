@@ -8,7 +8,7 @@ from sqlalchemy import text
 
 import elevation.constants as constants
 import utilities.common_constants as common_constants
-from utilities.db_utilities import engine
+from utilities.db_utilities import engine, session_scope, AltimeterMinute
 from utilities.misc_utilities import MiscUtilities
 
 
@@ -26,26 +26,6 @@ WHERE event_type IN (:altimeter_gap, :accelerometer_gap)
 ORDER BY id ASC;      -- Two events can have the same occurred at, so we need to sort by id.
 """
 
-sql_estimate_gap_elevation_change = """
-WITH gap_start AS
-(
-    SELECT altitude_x16
-    FROM altimeter_data
-    WHERE timestamp < :gap_start
-    ORDER BY id DESC
-    LIMIT 1
-),
-gap_end AS
-(
-    SELECT altitude_x16
-    FROM altimeter_data
-    WHERE timestamp > :gap_end
-    ORDER BY id ASC
-    LIMIT 1
-)
-SELECT COALESCE(e.altitude_x16 - s.altitude_x16, 0) FROM gap_end e, gap_start s;
-"""
-
 logger = logging.getLogger(__name__)
 
 
@@ -138,12 +118,13 @@ class ElevationProcessor:
             # It's normal to have other gap event subtypes that we don't care about or recognize.
 
     def _get_elevation_change(self, gap_start, gap_end):
-        with engine.connect() as con:
-            query_str = text(sql_estimate_gap_elevation_change)
-            elev_change = con.execute(
-                query_str, gap_start=gap_start, gap_end=gap_end
-            ).first()
-            return 0 if elev_change is None else elev_change[0]
+        # The minute rollups find the samples around the gap without scanning altimeter_data.
+        with session_scope() as session:
+            altitude_before = AltimeterMinute.altitude_before(session, gap_start)
+            altitude_after = AltimeterMinute.altitude_after(session, gap_end)
+        if altitude_before is None or altitude_after is None:
+            return 0
+        return altitude_after - altitude_before
 
     def _processed_gaps(self, end_of_gap):
         # We're done processing all gaps up to the point of end_of_gap
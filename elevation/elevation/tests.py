@@ -10,7 +10,7 @@ import elevation.constants as constants
 import utilities.common_constants as common_constants
 from utilities.test_utilities import TestUtilities
 from elevation.processor import ElevationProcessor
-from utilities.db_utilities import engine
+from utilities.db_utilities import engine, session_scope, AltimeterMinute
 from utilities.misc_utilities import MiscUtilities
 
 
@@ -26,6 +26,7 @@ class ElevationTesting(unittest.TestCase):
         with engine.connect() as con:
             con.execute("DELETE FROM trips")
             con.execute("DELETE FROM altimeter_data")
+            con.execute("DELETE FROM altimeter_minutes")
             con.execute("DELETE FROM events")
 
     def setUp(self):
@@ -65,6 +66,8 @@ class ElevationTesting(unittest.TestCase):
                     in_trip = False
                 con.execute(text(query), timestamp=t, altitude=alt)
                 t = t + timedelta(seconds=ALTIMETER_DATA_SPACING)
+        with session_scope() as session:
+            AltimeterMinute.rebuild(session)
 
     def create_some_trips(self, initial_trip_count, trip_info):
         # Add some initial trips to get past the number of skipped trips.
@@ -145,6 +148,21 @@ class ElevationTesting(unittest.TestCase):
         elevation_change = ep._get_elevation_change(trip_start, trip_end)
         self.assertEqual(elevation_change, FLOOR_DISTANCE)
 
+    def test_get_elevation_change_without_raw_data(self):
+        trip_start = datetime.now() - timedelta(minutes=5)
+        trip_end = trip_start + timedelta(seconds=10)
+        trip_info = ((trip_start, trip_end),)
+        self.create_some_trips(0, trip_info)
+        self.create_trip_based_altimeter_data(
+            trip_start - timedelta(seconds=5), trip_end + timedelta(seconds=5)
+        )
+        with engine.connect() as con:
+            # Like the truncator, the raw samples are gone but the minute rollups aren't.
+            con.execute("DELETE FROM altimeter_data")
+        ep = ElevationProcessor()
+        elevation_change = ep._get_elevation_change(trip_start, trip_end)
+        self.assertEqual(elevation_change, FLOOR_DISTANCE)
+
     def test_handle_any_gaps_no_gaps(self):
         ep = ElevationProcessor()
         ep.handle_any_gaps()
@@ -1,6 +1,7 @@
 #! /usr/bin/python3
 
 import os
+import copy
 import pickle
 import logging
 
@@ -15,9 +16,15 @@ logger = logging.getLogger(__name__)
 
 
 class ElishaProcessor:
+    """
+    Turns events into problems.  Events are applied a batch at a time and the state and the
+    last event id are checkpointed together, once per batch.  After a crash the whole batch
+    is processed again.
+    """
     test_tool_no_more_events = None        # Allows test methods to know when all events are definitely processed.
     last_event_id = None
     state_info = None
+    skipped_event_ids = None
 
     def __init__(self):
         self.shutdown = shutdown.Shutdown()
@@ -27,17 +34,23 @@ class ElishaProcessor:
     def setup(self, session):
         self._setup_switch_dictionary()
         self.last_event_id = -1
+        self.skipped_event_ids = set()
         self.test_tool_no_more_events = False
 
         # Start out with default values and overwrite them with whatever is in storage.
+        self.storage_checkpoint = os.path.join(
+            common_constants.STORAGE_FOLDER, "elisha_checkpoint.pkl"
+        )
+        # Where older versions kept the last event id and the state, only read when there's no checkpoint.
         self.storage_last_event = os.path.join(
             common_constants.STORAGE_FOLDER, "elisha_last_event.pkl"
         )
         self.storage_state_info = os.path.join(
             common_constants.STORAGE_FOLDER, "elisha_state_info.pkl"
         )
-        self._restore_last_event_id(session)
-        self._restore_state_info()
+        checkpoint = self._load_checkpoint()
+        self._restore_last_event_id(session, checkpoint)
+        self._restore_state_info(checkpoint)
 
     def _setup_switch_dictionary(self):
         self.switch = {
@@ -48,14 +61,18 @@ class ElishaProcessor:
 
     def process_data(self, session):
         events = self._get_batch_of_data(session)
+        self.test_tool_no_more_events = True
+        if not events:
+            return
+        # The event processors change the state in place, keep what we had in case the batch fails.
+        state_info = copy.deepcopy(self.state_info)
         last_event_id = self.last_event_id
         try:
-            self.test_tool_no_more_events = True
             for event in events:
                 last_event_id = (
                     event.id
                 )  # Keep track of the last id we tried to process.
-                self._process_next_event(session, event)
+                state_info = self._process_next_event(session, event, state_info)
                 self.test_tool_no_more_events = False
         except Exception as ex:
             logger.error(
@@ -65,31 +82,35 @@ class ElishaProcessor:
             )
             self._log_state_info()
             self.test_tool_no_more_events = False
+            # The caller rolls back the database changes of the whole batch, so the state stays where it
+            # was and the batch gets processed again, without the event that failed.
+            self.skipped_event_ids.add(last_event_id)
+            self.shutdown.forget_latest_confidence()
+            self._save_checkpoint()
             raise
-        finally:
-            # Don't process this event again if this causes an exception (but do process it if we had a power failure).
-            self._save_last_event_id(last_event_id)
 
-    def _get_batch_of_data(self, session):
-        return (
-            session.query(Event)
-            .filter(Event.id > self.last_event_id)
-            .order_by(Event.id.asc())
-            .limit(constants.PROCESS_BATCH_SIZE)
-            .all()
-        )
+        self.state_info = state_info
+        self.last_event_id = last_event_id
+        self.skipped_event_ids = set(i for i in self.skipped_event_ids if i > last_event_id)
+        self._log_state_info()
+        self._save_checkpoint()
 
-    def _process_next_event(self, session, event):
-        state_info = self.switch.get(event.event_type, self._unknown_event_type)(
-            session, event, self.state_info
+    def _get_batch_of_data(self, session):
+        query = session.query(Event).filter(Event.id > self.last_event_id)
+        if self.skipped_event_ids:
+            query = query.filter(Event.id.notin_(self.skipped_event_ids))
+        return query.order_by(Event.id.asc()).limit(constants.PROCESS_BATCH_SIZE).all()
+
+    def _process_next_event(self, session, event, state_info):
+        new_state_info = self.switch.get(event.event_type, self._unknown_event_type)(
+            session, event, state_info
         )
-        if state_info is not None:
-            self._log_state_info()
-            self._save_state_info(state_info)
-        else:
+        if new_state_info is None:
             logger.error(
                 "All event processors need to return the updated state_info value, got nothing back"
             )
+            return state_info
+        return new_state_info
 
     def _unknown_event_type(self, session, event, state_info):
         logger.debug(
@@ -104,15 +125,56 @@ class ElishaProcessor:
 
     def _save_last_event_id(self, id):
         self.last_event_id = id
-        with open(self.storage_last_event, "wb") as f:
-            pickle.dump(id, f)
+        self._save_checkpoint()
 
     def _save_state_info(self, state_info):
         self.state_info = state_info
-        with open(self.storage_state_info, "wb") as f:
-            pickle.dump(state_info, f)
+        self._save_checkpoint()
+
+    def _save_checkpoint(self):
+        """
+        Write the last event id and the state to one file, replacing the old checkpoint in a single
+        rename so a power failure leaves either the old one or the new one.
+        """
+        checkpoint = {
+            "last_event_id": self.last_event_id,
+            "state_info": self.state_info,
+            "skipped_event_ids": self.skipped_event_ids,
+        }
+        temporary_file = self.storage_checkpoint + ".tmp"
+        with open(temporary_file, "wb") as f:
+            pickle.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_file, self.storage_checkpoint)
+
+    def _load_checkpoint(self):
+        if (
+            os.path.isfile(self.storage_checkpoint)
+            and os.stat(self.storage_checkpoint).st_size != 0
+        ):
+            for i in range(0, 3):  # EN-680 fix
+                try:
+                    with open(self.storage_checkpoint, "rb") as f:
+                        checkpoint = pickle.load(f)
+                    logger.debug("restoring checkpoint: {0}".format(checkpoint))
+                    return checkpoint
+                except Exception as ex:
+                    logger.error(
+                        "Exception getting pickle checkpoint from storage on pass {0}: {1}".format(
+                            i, str(ex)
+                        )
+                    )
+        return None
+
+    def _restore_last_event_id(self, session, checkpoint=None):
+        if checkpoint is None:
+            checkpoint = self._load_checkpoint()
+        if checkpoint is not None:
+            self.last_event_id = checkpoint["last_event_id"]
+            self.skipped_event_ids = checkpoint["skipped_event_ids"]
+            return
 
-    def _restore_last_event_id(self, session):
         success = False
         if (
             os.path.isfile(self.storage_last_event)
@@ -141,7 +203,13 @@ class ElishaProcessor:
             last_event = session.query(Event.id).order_by(Event.id.desc()).first()
             self.last_event_id = last_event.id if last_event else -1
 
-    def _restore_state_info(self):
+    def _restore_state_info(self, checkpoint=None):
+        if checkpoint is None:
+            checkpoint = self._load_checkpoint()
+        if checkpoint is not None:
+            self.state_info = checkpoint["state_info"]
+            return
+
         success = False
         if (
             os.path.isfile(self.storage_state_info)
@@ -173,8 +241,7 @@ class ElishaProcessor:
                     self.state_info
                 )
             )
-            with open(self.storage_state_info, "wb") as f:
-                pickle.dump(self.state_info, f)
-                success = True
+            self._save_checkpoint()
+            success = True
         if success == False:
             raise Exception("Failed to load state_info from file")
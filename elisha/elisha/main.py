@@ -1,8 +1,9 @@
 import logging
-import time
 
 import elisha.constants as constants
 import elisha.elisha_processor as elisha_processor
+from utilities import common_constants
+from utilities.db_listener import DatabaseListener
 from utilities.logging import create_rotating_log
 from utilities.db_utilities import session_scope
 
@@ -17,10 +18,11 @@ def main():
         with session_scope() as session:
             elisha.setup(session)
 
+        listener = DatabaseListener(common_constants.EVENTS_CHANNEL)
         while True:
             with session_scope() as session:
                 elisha.process_data(session)
-            time.sleep(constants.PROCESSING_SLEEP_INTERVAL)
+            listener.wait(constants.PROCESSING_SLEEP_INTERVAL)
     except Exception as e:
         logger.exception("Exception caught in elisha main()" + str(e))
 
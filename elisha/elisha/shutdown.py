@@ -3,18 +3,42 @@
 import logging
 from decimal import Decimal
 
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 import elisha.constants as constants
 from notifications.notifications import Notification, NotificationTopic
 import utilities.common_constants as common_constants
 from utilities.db_utilities import Problem
 
+# Skips through events_type_subtype_id_idx from one subtype to the next and takes the latest event of each,
+# a DISTINCT ON would read every shutdown event.
+sql_latest_of_each_subtype = """
+WITH RECURSIVE subtypes AS (
+    (SELECT event_subtype FROM events WHERE event_type = :event_type ORDER BY event_subtype LIMIT 1)
+    UNION ALL
+    SELECT (
+        SELECT event_subtype FROM events
+        WHERE event_type = :event_type AND event_subtype > s.event_subtype
+        ORDER BY event_subtype LIMIT 1
+    )
+    FROM subtypes s
+    WHERE s.event_subtype IS NOT NULL
+)
+SELECT s.event_subtype, latest.confidence
+FROM subtypes s,
+LATERAL (
+    SELECT confidence FROM events
+    WHERE event_type = :event_type AND event_subtype = s.event_subtype
+    ORDER BY id DESC LIMIT 1
+) latest
+"""
+
 logger = logging.getLogger(__name__)
 
 
 class Shutdown:
     notif = None
+    latest_confidence = None  # Latest confidence of each shutdown subtype, None until it's read from the events.
 
     def __init__(self):
         self.notif = Notification()
@@ -28,6 +52,9 @@ class Shutdown:
                 event.event_subtype, event.confidence, event.source
             )
         )
+        self._get_latest_confidence_of_each_subtype(session)[
+            event.event_subtype
+        ] = event.confidence
 
         notification_confidence = (
             round(float(event.confidence), 2)
@@ -42,6 +69,8 @@ class Shutdown:
                 "confidence": notification_confidence,
             },
             include_last_trip=True if notification_confidence > 0 else False,
+            # Only sent if the batch is committed, a batch that fails is processed again.
+            session=session,
         )
 
         open_problem_id = shutdown_state[common_constants.PROB_OPEN_PROBLEM_ID]
@@ -109,7 +138,7 @@ class Shutdown:
             shutdown_state[common_constants.PROB_OPEN_PROBLEM_ID] = -1
         else:
             combined_confidence = self._compute_shutdown_confidence_combination(
-                session, open_problem_id
+                session
             )
             new_status = Shutdown._convert_confidence_to_shutdown_level(
                 combined_confidence
@@ -141,45 +170,40 @@ class Shutdown:
 
         return state_info
 
-    def _compute_shutdown_confidence_combination(self, session, problem_id):
-        events = self._get_latest_event_of_each_type(session, problem_id)
+    def _compute_shutdown_confidence_combination(self, session):
         confidence = 0
-        for event in events:
+        for event_subtype, event_confidence in self._get_latest_confidence_of_each_subtype(session).items():
             logger.debug(
                 "Computing combined confidence for {0} and {1} with subtype {2}".format(
-                    confidence, event["confidence"], event["event_subtype"]
+                    confidence, event_confidence, event_subtype
                 )
             )
             confidence = self._compute_combined_confidence(
-                confidence, event["confidence"]
+                confidence, event_confidence
             )
         logger.debug("combined confidence is {0}".format(confidence))
         return confidence
 
-    def _get_latest_event_of_each_type(self, session, problem_id):
-        latest_of_each_subtype_query = """
-        -- Select the most recent event of each subtype after the start of the first shutdown event, if any. Return the
-        -- subtype and confidence level.
-        WITH problem AS (
-            SELECT started_at FROM problems WHERE id = %s
-        )
-        SELECT event_subtype, confidence
-        FROM (
-            SELECT
-              ROW_NUMBER() OVER (PARTITION BY event_subtype ORDER BY id DESC) AS r,
-              e.*
-            FROM
-              events e, problem
-            WHERE e.event_type = '%s'
-        ) grouped_events
-        WHERE grouped_events.r < 2;
+    def _get_latest_confidence_of_each_subtype(self, session):
+        if self.latest_confidence is None:
+            self.latest_confidence = {
+                row["event_subtype"]: row["confidence"]
+                for row in self._get_latest_event_of_each_type(session)
+            }
+        return self.latest_confidence
+
+    def forget_latest_confidence(self):
+        """
+        Read the latest confidences from the events again next time, e.g. after a batch of events was rolled back.
         """
+        self.latest_confidence = None
 
+    def _get_latest_event_of_each_type(self, session):
         try:
             return session.execute(
-                latest_of_each_subtype_query
-                % (problem_id, common_constants.EVENT_TYPE_SHUTDOWN)
-            )
+                text(sql_latest_of_each_subtype),
+                {"event_type": common_constants.EVENT_TYPE_SHUTDOWN},
+            ).fetchall()
         except Exception as ex:
             logger.error(
                 "Exception in _get_latest_event_of_each_type(): {0}".format(str(ex))
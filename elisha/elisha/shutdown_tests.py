@@ -179,6 +179,7 @@ class ShutdownIntegration(unittest.TestCase):
 
         notif.send.assert_called_once_with(
             NotificationTopic.SHUTDOWN_CONFIDENCE,
+            session=self.session,
             include_last_trip=True,
             notif_data={
                 "shutdown_subtype": common_constants.EVENT_SUBTYPE_BANK,
@@ -197,6 +198,7 @@ class ShutdownIntegration(unittest.TestCase):
 
         notif.send.assert_called_once_with(
             NotificationTopic.SHUTDOWN_CONFIDENCE,
+            session=self.session,
             include_last_trip=True,
             notif_data=ANY
         )
@@ -212,6 +214,7 @@ class ShutdownIntegration(unittest.TestCase):
 
         notif.send.assert_called_once_with(
             NotificationTopic.SHUTDOWN_CONFIDENCE,
+            session=self.session,
             include_last_trip=False,
             notif_data=ANY
         )
@@ -233,6 +236,7 @@ class ShutdownIntegration(unittest.TestCase):
 
             notif.send.assert_called_once_with(
                 NotificationTopic.SHUTDOWN_CONFIDENCE,
+                session=self.session,
                 include_last_trip=True,
                 notif_data={
                     "shutdown_subtype": common_constants.EVENT_SUBTYPE_BANK,
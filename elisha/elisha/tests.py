@@ -2,13 +2,13 @@ import os
 import unittest
 from datetime import datetime, timedelta
 from time import sleep
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from elisha.elisha_processor import ElishaProcessor
 from elisha.shutdown import Shutdown
 import utilities.common_constants as common_constants
 from utilities.test_utilities import TestUtilities
-from utilities.db_utilities import Session, Event
+from utilities.db_utilities import Session, DataToSend, Event
 
 
 UNIT_TEST_SOURCE = 'unit test source'
@@ -94,6 +94,81 @@ class TestShutdownOverall(unittest.TestCase):
         self.ep._restore_state_info()           # Should not raise an exception
         self.assertTrue(True)
 
+    def test_checkpoint_once_per_batch(self):
+        for confidence in (10.0, 20.0, 30.0):
+            self.tu.create_event(
+                event_type=common_constants.EVENT_TYPE_SHUTDOWN,
+                subtype=common_constants.EVENT_SUBTYPE_BANK,
+                occurred_at=datetime.now(),
+                source=UNIT_TEST_SOURCE,
+                confidence=confidence,
+            )
+        last_id = self.session.query(Event.id).order_by(Event.id.desc()).first().id
+        with patch.object(self.ep, '_save_checkpoint', wraps=self.ep._save_checkpoint) as save_checkpoint:
+            self._process_all_events(self.ep)
+        self.assertEqual(save_checkpoint.call_count, 1)
+        self.assertEqual(self.ep.last_event_id, last_id)
+        ep2 = ElishaProcessor()
+        ep2.setup(self.session)
+        self.assertEqual(ep2.last_event_id, last_id)
+        self.assertEqual(ep2.state_info, self.ep.state_info)
+
+    def test_failing_event_is_skipped(self):
+        self.tu.create_event(
+            event_type=common_constants.EVENT_TYPE_SHUTDOWN,
+            subtype=common_constants.EVENT_SUBTYPE_BANK,
+            occurred_at=datetime.now(),
+            source=UNIT_TEST_SOURCE,
+            confidence=10.0,
+        )
+        self.session.flush()
+        failing_id = self.session.query(Event.id).order_by(Event.id.desc()).first().id
+        state_info = self.ep.state_info
+        last_event_id = self.ep.last_event_id
+        with patch.object(self.ep, '_unknown_event_type', side_effect=Exception("broken event")):
+            self.ep.switch[common_constants.EVENT_TYPE_SHUTDOWN] = self.ep._unknown_event_type
+            with self.assertRaises(Exception):
+                self.ep.process_data(self.session)
+        self.ep._setup_switch_dictionary()
+        # Nothing from the failed batch is kept, except that the failing event is skipped.
+        self.assertEqual(self.ep.state_info, state_info)
+        self.assertEqual(self.ep.last_event_id, last_event_id)
+        self.assertEqual(self.ep.skipped_event_ids, {failing_id})
+        self.assertEqual(self.ep._get_batch_of_data(self.session), [])
+
+    def test_failed_batch_sends_no_notification_twice(self):
+        for confidence in (10.0, 20.0, 30.0):
+            self.tu.create_event(
+                event_type=common_constants.EVENT_TYPE_SHUTDOWN,
+                subtype=common_constants.EVENT_SUBTYPE_BANK,
+                occurred_at=datetime.now(),
+                source=UNIT_TEST_SOURCE,
+                confidence=confidence,
+            )
+        failing_id = self.session.query(Event.id).order_by(Event.id.desc()).first().id
+        last_row = self.session.query(DataToSend.id).order_by(DataToSend.id.desc()).first()
+        process_event = self.ep.shutdown.process_event
+
+        def fail_on_last_event(session, event, state_info):
+            if event.id == failing_id:
+                raise Exception("broken event")
+            return process_event(session, event, state_info)
+
+        self.ep.switch[common_constants.EVENT_TYPE_SHUTDOWN] = fail_on_last_event
+        self.session.begin_nested()
+        with self.assertRaises(Exception):
+            self.ep.process_data(self.session)
+        # Like the session_scope() in main, which rolls back the batch.
+        self.session.rollback()
+        self.ep._setup_switch_dictionary()
+        self._process_all_events(self.ep)
+
+        rows = self.session.query(DataToSend).filter(DataToSend.id > (last_row.id if last_row else 0)).all()
+        confidences = [
+            row.payload["confidence"] for row in rows if row.payload.get("type") == "shutdown_confidence"
+        ]
+        self.assertEqual(sorted(confidences), [10, 20])
+
     def test_create_event(self):
         # TODO: Move this to a common test area (create_event was originally part of this file
         detected_at = datetime.now()
@@ -133,10 +208,49 @@ class TestShutdownOverall(unittest.TestCase):
         self.assertTrue(self.ep.shutdown._compute_combined_confidence(67, 70) == 85)
         self.assertTrue(self.ep.shutdown._compute_combined_confidence(70, 67) == 85)
 
+    def test_latest_confidence_of_each_subtype(self):
+        for subtype, confidence in (
+            (common_constants.EVENT_SUBTYPE_BANK, 60.0),
+            (common_constants.EVENT_SUBTYPE_STANDALONE, 40.0),
+            (common_constants.EVENT_SUBTYPE_BANK, 75.0),
+        ):
+            self.tu.create_event(
+                event_type=common_constants.EVENT_TYPE_SHUTDOWN,
+                subtype=subtype,
+                occurred_at=datetime.now(),
+                source=UNIT_TEST_SOURCE,
+                confidence=confidence,
+            )
+        # How the latest of each subtype used to be found.
+        expected = dict(self.session.execute(
+            "SELECT event_subtype, confidence FROM ("
+            "  SELECT ROW_NUMBER() OVER (PARTITION BY event_subtype ORDER BY id DESC) AS r, e.* "
+            "  FROM events e WHERE e.event_type = '{0}') grouped_events "
+            "WHERE grouped_events.r < 2".format(common_constants.EVENT_TYPE_SHUTDOWN)
+        ).fetchall())
+        shutdown = self.ep.shutdown
+        self.assertIsNone(shutdown.latest_confidence)
+        self.assertEqual(shutdown._get_latest_confidence_of_each_subtype(self.session), expected)
+        self.assertEqual(expected[common_constants.EVENT_SUBTYPE_BANK], 75)
+
+        self.tu.create_event(
+            event_type=common_constants.EVENT_TYPE_SHUTDOWN,
+            subtype=common_constants.EVENT_SUBTYPE_STANDALONE,
+            occurred_at=datetime.now(),
+            source=UNIT_TEST_SOURCE,
+            confidence=90.0,
+        )
+        with patch.object(shutdown, '_get_latest_event_of_each_type') as get_latest_event_of_each_type:
+            self._process_all_events(self.ep)
+        get_latest_event_of_each_type.assert_not_called()
+        self.assertEqual(shutdown.latest_confidence[common_constants.EVENT_SUBTYPE_STANDALONE], 90)
+        self.assertEqual(shutdown.latest_confidence[common_constants.EVENT_SUBTYPE_BANK], 75)
+
     def test_startup_condition_with_empty_pickle_file(self):
-        storage_file = self.ep.storage_state_info
+        storage_files = (self.ep.storage_checkpoint, self.ep.storage_state_info)
         del self.ep
-        os.system("sudo rm {0}; touch {0}".format(storage_file))
+        for storage_file in storage_files:
+            os.system("sudo rm -f {0}; touch {0}".format(storage_file))
         ep2 = self._get_ep_instance()
         shutdown_state_info = ep2.state_info[common_constants.PROB_TYPE_SHUTDOWN]
         vibration_state_info = ep2.state_info[common_constants.PROB_TYPE_VIBRATION]
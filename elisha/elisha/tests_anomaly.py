@@ -103,9 +103,9 @@ class TestReleveling(unittest.TestCase):
         ep.setup(self.session)
         rows = ep._get_batch_of_data(self.session)
         for row in rows:
-            self.assertEqual(row['event_type'], common_constants.EVENT_TYPE_ANOMALY,
+            self.assertEqual(row.event_type, common_constants.EVENT_TYPE_ANOMALY,
                             "Oops, something interefered with the test")
-            self.assertEqual(row['event_subtype'], common_constants.EVENT_SUBTYPE_RELEVELING,
+            self.assertEqual(row.event_subtype, common_constants.EVENT_SUBTYPE_RELEVELING,
                             "Yikes, something interfered with the test")
 
     def test_releveling_lookback_threshold(self):
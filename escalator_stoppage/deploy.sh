@@ -1,7 +0,0 @@
-#!/usr/bin/env bash
-
-PATH=$PATH:/usr/local/bin
-parent_path=$( cd "$(dirname "${BASH_SOURCE[0]}")" ; pwd -P )
-cd "$parent_path"
-
-../misc_scripts/deploy_application.sh escalatorstoppage liftai_escalatorstoppage escalator_stoppage
@@ -7,15 +7,10 @@ with open('requirements.txt') as f:
 
 setup(name='liftai-escalatorstoppage',
       version='0.0.1',
-      description=("LiftAi escalator stoppage application",
+      description=("LiftAi escalator stoppage detector, run by stoppagerunner",
                    "do the processing for detecting if an escalator has stopped"
                    "working")[0],
       packages=find_packages(),
-      entry_points={
-          'console_scripts': [
-              'escalatorstoppage = escalator_stoppage.main:main',
-          ]
-      },
       install_requires=requirements,
       classifiers=(
           'Intended Audience :: Other Audience',
@@ -0,0 +1,168 @@
+"""
+Floor labelling throughput on a seeded backlog of trips.
+
+This writes to the configured database, so stop floordetector.service first.
+Everything the benchmark inserts is deleted again when it finishes.
+"""
+import sys
+import time
+import random
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy.sql import text
+
+from floor_detector.floor_processor import FloorProcessor
+from floor_detector.floor_store import PostgresFloorStore
+from utilities.db_utilities import engine
+
+
+FLOOR_ELEVATIONS = [0, 48, 95, 143, 190, 238, 285, 333, 380, 428]
+ELEVATION_NOISE = 4
+DEFAULT_BACKLOG = 1000
+DEFAULT_SEED = 1000
+
+
+class BenchmarkFloorStore(PostgresFloorStore):
+    """
+    Never sends floor map notifications and doesn't need a device configuration.
+    """
+
+    def get_floor_count(self):
+        return len(FLOOR_ELEVATIONS)
+
+    def map_created(self, reason):
+        pass
+
+
+class PerTripFloorStore(BenchmarkFloorStore):
+    """
+    Labels trips the old way, one UPDATE and one map id lookup per trip.
+    """
+
+    def save_trip_floors(self, trip_updates):
+        for trip_id, ending_floor, _, est_error in trip_updates:
+            floor_map_id = self.connection.execute(
+                "SELECT id FROM floor_maps ORDER BY start_time DESC LIMIT 1"
+            ).scalar()
+            self.connection.execute(
+                text(
+                    "UPDATE trips SET ending_floor = :ending_floor, "
+                    "floor_map_id = :floor_map_id, floor_estimated_error = :est_error "
+                    "WHERE id = :trip_id"
+                ),
+                ending_floor=ending_floor,
+                floor_map_id=floor_map_id,
+                est_error=est_error,
+                trip_id=trip_id,
+            )
+
+
+def seed_backlog(con, start_time, trips, seed):
+    """
+    Insert `trips` unlabelled trips that ride randomly between FLOOR_ELEVATIONS.
+    """
+    rnd = random.Random(seed)
+    floor = 0
+    rows = []
+    for i in range(trips):
+        next_floor = (floor + rnd.randint(1, len(FLOOR_ELEVATIONS) - 1)) % len(
+            FLOOR_ELEVATIONS
+        )
+        elevation_change = FLOOR_ELEVATIONS[next_floor] - FLOOR_ELEVATIONS[floor]
+        # The first visit to a floor sets its elevation, so keep the noise small.
+        elevation_change += rnd.randint(-ELEVATION_NOISE, ELEVATION_NOISE)
+        trip_start = start_time + timedelta(seconds=30 * (i + 1))
+        rows.append(
+            {
+                "start_time": trip_start,
+                "end_time": trip_start + timedelta(seconds=10),
+                "is_up": elevation_change > 0,
+                "elevation_change": elevation_change,
+            }
+        )
+        floor = next_floor
+    con.execute(
+        text(
+            "INSERT INTO trips (start_accel, end_accel, start_time, end_time, is_up, "
+            "elevation_change, elevation_processed) "
+            "VALUES (-1, -1, :start_time, :end_time, :is_up, :elevation_change, TRUE)"
+        ),
+        rows,
+    )
+
+
+def run(store_class, trips=DEFAULT_BACKLOG, seed=DEFAULT_SEED):
+    """
+    Label a seeded backlog through the given store class and return the metrics.
+    """
+    with engine.connect() as con:
+        max_trip_id = con.execute("SELECT COALESCE(MAX(id), 0) FROM trips").scalar()
+        max_map_id = con.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM floor_maps"
+        ).scalar()
+
+    # Start after any real map so the benchmark map is the latest one.
+    start_time = datetime.now() + timedelta(days=1)
+    try:
+        fp = FloorProcessor(store_class())
+        fp._create_new_map(start_time, "benchmark")
+        with engine.begin() as con:
+            seed_backlog(con, start_time, trips, seed)
+
+        started = time.perf_counter()
+        fp.process_trips()
+        elapsed = time.perf_counter() - started
+
+        with engine.connect() as con:
+            labelled = con.execute(
+                text(
+                    "SELECT count(*) FROM trips "
+                    "WHERE id > :max_id AND ending_floor IS NOT NULL"
+                ),
+                max_id=max_trip_id,
+            ).scalar()
+    finally:
+        with engine.begin() as con:
+            con.execute(text("DELETE FROM trips WHERE id > :max_id"), max_id=max_trip_id)
+            con.execute(
+                text("DELETE FROM floor_maps WHERE id > :max_id"), max_id=max_map_id
+            )
+
+    return {
+        "store": store_class.__name__,
+        "trips": trips,
+        "labelled": labelled,
+        "seconds": round(elapsed, 3),
+        "trips_per_sec": round(trips / elapsed, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Floor labelling benchmark")
+    parser.add_argument("-n", "--trips", type=int, default=DEFAULT_BACKLOG)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = [
+        run(PerTripFloorStore, args.trips, args.seed),
+        run(BenchmarkFloorStore, args.trips, args.seed),
+    ]
+    for result in results:
+        print(
+            "{store:>20}: labelled {labelled}/{trips} trips in {seconds} s "
+            "= {trips_per_sec} trips/s".format(**result)
+        )
+    print(
+        "speedup {0:.1f}x".format(
+            results[1]["trips_per_sec"] / results[0]["trips_per_sec"]
+        )
+    )
+    return 0 if all(r["labelled"] == r["trips"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,6 +19,8 @@ FLOOR_LEVEL_ADJUST = 1
 
 DELAY_BETWEEN_EXECUTIONS = 15  # Units of seconds
 MAX_TRIPS_TO_PROCESS = 4
+# Trip floor assignments are written with one UPDATE ... FROM (VALUES ...) per this many trips.
+MAX_TRIP_UPDATES_PER_STATEMENT = 500
 
 STORAGE_FILE_NAME = "floor_detector"
 
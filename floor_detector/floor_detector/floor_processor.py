@@ -1,14 +1,11 @@
 import logging
+from contextlib import contextmanager
 from datetime import datetime
-import json
-
-from sqlalchemy.sql import text
 
 import floor_detector.constants as constants
-from notifications.notifications import Notification, NotificationTopic
+from floor_detector.floor_store import PostgresFloorStore
 from utilities import common_constants
-from utilities.db_utilities import engine, session_scope, FloorMap
-from utilities.device_configuration import DeviceConfiguration
+from utilities.floor_index import FloorIndex
 
 FLOOR_SCHEMA = common_constants.FLOORS_JSON_SCHEMA
 FLOOR_LANDING = common_constants.FLOORS_JSON_LANDING_NUM
@@ -18,41 +15,6 @@ FLOOR_LAST_UPDATED = common_constants.FLOORS_JSON_LAST_UPDATED
 ELEVATION_RESET = common_constants.EVENT_SUBTYPE_ELEVATION_RESET
 MISSING_TRIP = common_constants.EVENT_SUBTYPE_MISSING_TRIP
 
-sql_process_trips_and_events = """
-SELECT
-    :missing_trip_subtype as type,
-    occurred_at,
-    id,
-    CAST(details->>'elevation change' AS INTEGER) as elevation_change
-FROM events
-WHERE
-    event_type = :event_type
-    AND event_subtype = :missing_trip_subtype
-    AND occurred_at > :starting_time
-UNION ALL
-SELECT
-    'elevation reset' as type,
-    occurred_at,
-    id,
-    0 as elevation_change
-FROM events
-WHERE
-    event_type = :event_type
-    AND event_subtype = :elevation_reset_subtype
-    AND occurred_at > :starting_time
-UNION ALL
-SELECT
-    'trip' as type,
-    start_time as occurred_at,
-    id,
-    elevation_change as elevation_change
-FROM trips
-WHERE elevation_processed = TRUE
-    AND ending_floor IS NULL
-    AND start_time > :starting_time
-ORDER BY occurred_at ASC
-"""
-
 logger = logging.getLogger(__name__)
 
 
@@ -60,76 +22,156 @@ class FloorProcessor:
     last_update = None
     logger = None
 
-    def __init__(self):
-        self.last_update = self._get_last_update_timestamp()
-        if not self.last_update:
-            self._create_new_map(datetime.now().isoformat(), "initial")
-        self.elevation = self._get_last_elevation()
+    def __init__(self, store=None):
+        """
+        :param store: FloorStore holding the maps, trips and events, Postgres by default.
+        """
+        self.store = store if store is not None else PostgresFloorStore()
+        # In-memory copy of the active (latest) floor map.  Writes go straight through
+        # to the store, except while a batch is open, then they're flushed together.
+        self.map_id = None
+        self.floors = None
+        self.floor_index = None
+        self.elevation = None
+        self.map_dirty = False
+        self.pending_trip_updates = []
+        self.pending_notifications = []
+        self.in_batch = False
+
+        self._load_map()
+        if self.map_id is None:
+            self._create_new_map(datetime.now(), "initial")
 
     def process_trips(self):
         """
         This reads events and trips from the database and assigns a floor to the
-        next trip, if possible.
+        next trip, if possible.  The whole batch is applied against the cached map
+        and written out in a single transaction.
         :return:
         """
         if not self._get_floor_count():
             # If we don't have a count of the number of floors we can't do floor detect.
             return
 
-        for item in self._get_events_and_trips():
+        items = self._get_events_and_trips()
+        if not items:
+            return
 
-            if item["type"] == ELEVATION_RESET:
-                logger.info("Elevation reset at {0}".format(item["occurred_at"]))
-                self._create_new_map(item["occurred_at"], "elevation_reset")
+        with self._batch():
+            for item in items:
+                self._process_item(item)
+
+    def _process_item(self, item):
+        if item["type"] == ELEVATION_RESET:
+            logger.info("Elevation reset at {0}".format(item["occurred_at"]))
+            self._create_new_map(item["occurred_at"], "elevation_reset")
+
+        if item["type"] == MISSING_TRIP:
+            logger.info(
+                "Missed trip elevation change of {0}".format(item["elevation_change"])
+            )
+
+        # A missed trip is where we know the elevation change, but no details to create a trip.
+        if item["type"] in ("trip", MISSING_TRIP) and item["elevation_change"]:
+            # If the elevation change is null, ignore the trip
+            tentative_elevation = self.elevation + item["elevation_change"]
+            closest_floor, floors = self._get_closest_floor(tentative_elevation)
+            est_error = (
+                (tentative_elevation - floors[closest_floor][FLOOR_ELEVATION])
+                if closest_floor is not None
+                else None
+            )
 
-            if item["type"] == MISSING_TRIP:
+            if est_error is not None and abs(est_error) <= constants.MAX_FLOOR_ERROR:
+                if item["type"] == "trip":
+                    self._update_trip(item["id"], closest_floor, est_error)
+                floors[closest_floor][FLOOR_CUMULATIVE_ERR] += est_error
+                self._update_floors_and_map(
+                    floors,
+                    item["occurred_at"],
+                    # Use floor elevation and not tentative elevation here.
+                    floors[closest_floor][FLOOR_ELEVATION],
+                )
+                # Already updated the map's last elevation
+            else:
                 logger.info(
-                    "Missed trip elevation change of {0}".format(
-                        item["elevation_change"]
-                    )
+                    "Found possible new floor at {0}".format(tentative_elevation)
                 )
-
-            # A missed trip is where we know the elevation change, but no details to create a trip.
-            if item["type"] in ("trip", MISSING_TRIP) and item["elevation_change"]:
-                # If the elevation change is null, ignore the trip
-                tentative_elevation = self.elevation + item["elevation_change"]
-                closest_floor, floors = self._get_closest_floor(tentative_elevation)
-                est_error = (
-                    (tentative_elevation - floors[closest_floor][FLOOR_ELEVATION])
-                    if closest_floor is not None
-                    else None
+                new_floor = self._create_new_floor(
+                    tentative_elevation, update_time=item["occurred_at"]
                 )
 
-                if (
-                    est_error is not None
-                    and abs(est_error) <= constants.MAX_FLOOR_ERROR
-                ):
+                if new_floor:
+                    self._add_floor_recompute_landings(new_floor)
+                    # The first trip to a new floor has an error of 0
                     if item["type"] == "trip":
-                        self._update_trip(item["id"], closest_floor, est_error)
-                    floors[closest_floor][FLOOR_CUMULATIVE_ERR] += est_error
-                    self._update_floors_and_map(
-                        floors,
-                        item["occurred_at"],
-                        # Use floor elevation and not tentative elevation here.
-                        floors[closest_floor][FLOOR_ELEVATION],
-                    )
-                    # Already updated the map's last elevation
-                else:
-                    logger.info(
-                        "Found possible new floor at {0}".format(tentative_elevation)
-                    )
-                    new_floor = self._create_new_floor(
-                        tentative_elevation, update_time=item["occurred_at"]
-                    )
-
-                    if new_floor:
-                        self._add_floor_recompute_landings(new_floor)
-                        # The first trip to a new floor has an error of 0
-                        if item["type"] == "trip":
-                            self._update_trip(item["id"], list(new_floor.keys())[0], 0)
-                        self._update_last_elevation(tentative_elevation)
-
-            self._set_last_update_timestamp(item["occurred_at"])
+                        self._update_trip(item["id"], list(new_floor.keys())[0], 0)
+                    self._update_last_elevation(tentative_elevation)
+
+        self._set_last_update_timestamp(item["occurred_at"])
+
+    @contextmanager
+    def _batch(self):
+        """
+        Everything written while the batch is open stays in memory and is flushed
+        in one transaction when it closes.  Notifications go out after the commit.
+        """
+        # Re-read the map once per batch so we never work from a stale copy.
+        self._load_map()
+        try:
+            with self.store.transaction():
+                self.in_batch = True
+                yield
+                self._flush()
+        except Exception:
+            # Nothing was committed, throw away whatever we did in memory.
+            self.in_batch = False
+            self.pending_trip_updates = []
+            self.pending_notifications = []
+            self._load_map()
+            raise
+        finally:
+            self.in_batch = False
+        self._send_pending_notifications()
+
+    def _load_map(self):
+        floor_map = self.store.get_latest_map()
+        if floor_map:
+            self.map_id = floor_map["id"]
+            self.last_update = floor_map["last_update"]
+            self.elevation = floor_map["last_elevation"]
+            self.floors = floor_map["floors"]
+        else:
+            self.map_id = None
+            self.last_update = None
+            self.elevation = None
+            self.floors = {}
+        self.map_dirty = False
+
+    def _map_changed(self):
+        self.map_dirty = True
+        if not self.in_batch:
+            self._flush()
+
+    def _flush(self):
+        """
+        Write the cached map and any pending trip floor assignments.
+        """
+        with self.store.transaction():
+            if self.map_dirty and self.map_id is not None:
+                self.store.save_map(
+                    self.map_id, self.floors, self.elevation, self.last_update
+                )
+            self.map_dirty = False
+
+            if self.pending_trip_updates:
+                self.store.save_trip_floors(self.pending_trip_updates)
+            self.pending_trip_updates = []
+
+    def _send_pending_notifications(self):
+        for reason in self.pending_notifications:
+            self.store.map_created(reason)
+        self.pending_notifications = []
 
     def _get_events_and_trips(self):
         """
@@ -139,134 +181,80 @@ class FloorProcessor:
         in ascending time order.
         :return: The trips and events in asc order
         """
-        with engine.connect() as con:
-            return con.execute(
-                text(sql_process_trips_and_events),
-                event_type=common_constants.EVENT_TYPE_ELEVATION,
-                missing_trip_subtype=MISSING_TRIP,
-                starting_time=self.last_update,
-                elevation_reset_subtype=ELEVATION_RESET,
-            ).fetchall()
+        return self.store.get_events_and_trips(self.last_update)
 
     def _get_last_elevation(self):
-        with session_scope() as session:
-            floor_map = FloorMap.get_lastest_map(
-                session, columns=[FloorMap.last_elevation]
-            )
-            return floor_map.last_elevation if floor_map else None
+        floor_map = self.store.get_latest_map()
+        return floor_map["last_elevation"] if floor_map else None
 
     def _update_last_elevation(self, elevation):
         self.elevation = elevation
-        query = text(
-            "UPDATE floor_maps set last_elevation = :elevation "
-            "WHERE id IN (SELECT max(id) FROM floor_maps)"
-        )
-        with engine.connect() as con:
-            con.execute(query, elevation=self.elevation)
+        self._map_changed()
 
     def _get_last_update_timestamp(self):
-        with session_scope() as session:
-            floor_map = FloorMap.get_lastest_map(
-                session, columns=[FloorMap.last_update]
-            )
-            return floor_map.last_update.replace(tzinfo=None) if floor_map else None
+        floor_map = self.store.get_latest_map()
+        return floor_map["last_update"] if floor_map else None
 
     def _set_last_update_timestamp(self, update_time):
-        query = text(
-            "UPDATE floor_maps SET last_update = :last_update "
-            "WHERE id IN (SELECT max(id) FROM floor_maps)"
-        )
-        with engine.connect() as con:
-            con.execute(query, last_update=update_time)
         self.last_update = update_time
+        self._map_changed()
 
     def _create_new_map(self, start_time, reason):
-        # Might as well start with elevation set to 0, no absolute reference
-        query = text(
-            "INSERT INTO floor_maps (start_time, last_update, last_elevation, floors) "
-            "VALUES (:init_time, :init_time, 0, '{}')"
-        )
-        with engine.connect() as con:
-            con.execute(query, init_time=start_time)
+        # Whatever we did to the old map has to be written before it stops being the latest.
+        self._flush()
+        self.map_id = self.store.create_map(start_time)
+        self.floors = {}
         self.elevation = 0
-        self._set_last_update_timestamp(start_time)
-        Notification.send(NotificationTopic.FLOOR_MAP_CREATED, {"reason": reason})
+        self.last_update = start_time
+        self.map_dirty = False
+        self.pending_notifications.append(reason)
+        if not self.in_batch:
+            self._send_pending_notifications()
 
     def _get_closest_floor(self, tentative_elevation):
         # Return index into closest floor along with the whole set of floors.
-        floors = self._get_floors()
-        if floors == {}:
-            return None, floors
-        closest_floor = min(
-            floors, key=lambda k: abs(floors[k][FLOOR_ELEVATION] - tentative_elevation)
-        )
-        return closest_floor, floors
+        floor_index = self._get_floor_index()
+        return floor_index.closest_floor(tentative_elevation), floor_index.floors
 
     def _update_trip(self, trip_id, ending_floor, est_error):
-        query = text(
-            "UPDATE trips SET ending_floor = :ending_floor, "
-            "floor_map_id = :floor_map_id, floor_estimated_error = :est_error "
-            "WHERE id = :trip_id"
+        self.pending_trip_updates.append(
+            (trip_id, ending_floor, self.map_id, est_error)
         )
-        with session_scope() as session:
-            floor_map = FloorMap.get_lastest_map(session, columns=[FloorMap.id])
-            floor_map_id = floor_map.id if floor_map else None
-
-            session.execute(
-                query,
-                {
-                    "ending_floor": ending_floor,
-                    "floor_map_id": floor_map_id,
-                    "est_error": est_error,
-                    "trip_id": trip_id,
-                },
-            )
+        if not self.in_batch:
+            self._flush()
 
     def _update_floors_and_map(
         self, updated_floors, map_update_time, maps_last_elevation
     ):
         # elevation is a separate arg because we probably don't want to assume
         # that we want to use this floor's elevation as the map's last elevation
-        query = text(
-            "UPDATE floor_maps SET floors = :floors, "
-            "last_elevation = :elevation, last_update = :map_update_time "
-            "WHERE id IN (SELECT max(id) FROM floor_maps)"
-        )
-        with engine.connect() as con:
-            con.execute(
-                query,
-                floors=json.dumps(updated_floors),
-                elevation=maps_last_elevation,
-                map_update_time=map_update_time,
-            )
-        # Always keeping the "cached" version up to date.
+        self.floors = updated_floors
+        self.last_update = map_update_time
         self.elevation = maps_last_elevation
+        self._map_changed()
 
     def _add_floor_recompute_landings(self, floor):
-        floors = self._get_floors()
-        floors.update(floor)
-        elevations_ids = sorted(
-            (floor[FLOOR_ELEVATION], floor_id) for floor_id, floor in floors.items()
-        )
-        landing_number = 0
-        for elev in elevations_ids:
-            floors[elev[1]][FLOOR_LANDING] = landing_number
-            landing_number += 1
-        self._set_floors(floors)
+        floor_index = self._get_floor_index()
+        for floor_id, new_floor in floor.items():
+            floor_index.add_floor(floor_id, new_floor)
+        self._set_floors(floor_index.floors)
 
     def _get_floors(self):
-        with session_scope() as session:
-            floor_map = FloorMap.get_lastest_map(session, columns=[FloorMap.floors])
-            return floor_map.floors if floor_map else {}
+        if self.floors is None:
+            self._load_map()
+        return self.floors
+
+    def _get_floor_index(self):
+        floors = self._get_floors()
+        # Rebuild whenever the floors were replaced, e.g. a new map or a reload.
+        if self.floor_index is None or self.floor_index.floors is not floors:
+            self.floor_index = FloorIndex(floors)
+        return self.floor_index
 
     def _set_floors(self, floors):
         # Don't set last_update on map here.
-        query = text(
-            "UPDATE floor_maps SET floors = :floors "
-            "WHERE id IN (SELECT max(id) FROM floor_maps)"
-        )
-        with engine.connect() as con:
-            con.execute(query, floors=json.dumps(floors))
+        self.floors = floors
+        self._map_changed()
 
     def _create_new_floor(self, elevation, update_time):
         """
@@ -298,4 +286,4 @@ class FloorProcessor:
             return None
 
     def _get_floor_count(self):
-        return DeviceConfiguration.get_floor_count(logger)
+        return self.store.get_floor_count()
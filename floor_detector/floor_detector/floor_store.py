@@ -0,0 +1,389 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from sqlalchemy.sql import text
+
+import floor_detector.constants as constants
+from notifications.notifications import Notification, NotificationTopic
+from utilities import common_constants
+from utilities.db_utilities import engine, session_scope, FloorMap
+from utilities.device_configuration import DeviceConfiguration
+
+FLOOR_SCHEMA = common_constants.FLOORS_JSON_SCHEMA
+FLOOR_LANDING = common_constants.FLOORS_JSON_LANDING_NUM
+FLOOR_ELEVATION = common_constants.FLOORS_JSON_ELEVATION
+FLOOR_CUMULATIVE_ERR = common_constants.FLOORS_JSON_CUMULATIVE_ERR
+FLOOR_LAST_UPDATED = common_constants.FLOORS_JSON_LAST_UPDATED
+ELEVATION_RESET = common_constants.EVENT_SUBTYPE_ELEVATION_RESET
+MISSING_TRIP = common_constants.EVENT_SUBTYPE_MISSING_TRIP
+
+sql_process_trips_and_events = """
+SELECT
+    :missing_trip_subtype as type,
+    occurred_at,
+    id,
+    CAST(details->>'elevation change' AS INTEGER) as elevation_change
+FROM events
+WHERE
+    event_type = :event_type
+    AND event_subtype = :missing_trip_subtype
+    AND occurred_at > :starting_time
+UNION ALL
+SELECT
+    'elevation reset' as type,
+    occurred_at,
+    id,
+    0 as elevation_change
+FROM events
+WHERE
+    event_type = :event_type
+    AND event_subtype = :elevation_reset_subtype
+    AND occurred_at > :starting_time
+UNION ALL
+SELECT
+    'trip' as type,
+    start_time as occurred_at,
+    id,
+    elevation_change as elevation_change
+FROM trips
+WHERE elevation_processed = TRUE
+    AND ending_floor IS NULL
+    AND start_time > :starting_time
+ORDER BY occurred_at ASC
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class FloorStore(ABC):
+    """
+    Where the floor processor reads trips and events from and keeps its floor maps.
+
+    A map is a dict with id, last_update, last_elevation and floors.  Trip floor
+    assignments are (trip_id, ending_floor, floor_map_id, est_error) tuples.
+    """
+
+    @contextmanager
+    def transaction(self):
+        """
+        Everything written inside is committed together.  Nesting is allowed.
+        """
+        yield
+
+    @abstractmethod
+    def get_floor_count(self):
+        pass
+
+    @abstractmethod
+    def get_latest_map(self):
+        pass
+
+    @abstractmethod
+    def get_events_and_trips(self, starting_time):
+        """
+        Trips with an elevation change and no floor yet, missing trip events and
+        elevation reset events after starting_time, in ascending time order.
+        """
+        pass
+
+    @abstractmethod
+    def create_map(self, start_time):
+        """
+        Start a new, empty map and return its id.
+        """
+        pass
+
+    @abstractmethod
+    def save_map(self, map_id, floors, last_elevation, last_update):
+        pass
+
+    @abstractmethod
+    def save_trip_floors(self, trip_updates):
+        pass
+
+    def map_created(self, reason):
+        """
+        Called once the transaction that created a map has been committed.
+        """
+        pass
+
+
+class PostgresFloorStore(FloorStore):
+    """
+    Maps live in floor_maps and their floors in the floors table, one row per floor.
+    Only the floors that changed since they were read or last saved are written.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.saved_map_id = None
+        self.saved_floors = {}
+
+    @contextmanager
+    def transaction(self):
+        if self.connection is not None:
+            yield
+            return
+        try:
+            with engine.begin() as con:
+                self.connection = con
+                yield
+        finally:
+            self.connection = None
+
+    @contextmanager
+    def _connect(self):
+        if self.connection is not None:
+            yield self.connection
+        else:
+            with engine.begin() as con:
+                yield con
+
+    def get_floor_count(self):
+        return DeviceConfiguration.get_floor_count(logger)
+
+    def get_latest_map(self):
+        with session_scope() as session:
+            floor_map = FloorMap.get_lastest_map(
+                session,
+                columns=[
+                    FloorMap.id,
+                    FloorMap.last_update,
+                    FloorMap.last_elevation,
+                    FloorMap.floor_rows,
+                    FloorMap.legacy_floors,
+                ],
+            )
+            if not floor_map:
+                return None
+            if floor_map.floor_rows is not None:
+                floors = floor_map.floor_rows
+                self._saved(floor_map.id, floors)
+            else:
+                # Floors that are still in the old JSON column all get written out as rows.
+                floors = floor_map.legacy_floors or {}
+                self._saved(floor_map.id, {})
+            return {
+                "id": floor_map.id,
+                "last_update": floor_map.last_update.replace(tzinfo=None),
+                "last_elevation": floor_map.last_elevation,
+                "floors": floors,
+            }
+
+    def _saved(self, map_id, floors):
+        self.saved_map_id = map_id
+        self.saved_floors = {
+            floor_id: dict(floor) for floor_id, floor in floors.items()
+        }
+
+    def get_events_and_trips(self, starting_time):
+        with engine.connect() as con:
+            return con.execute(
+                text(sql_process_trips_and_events),
+                event_type=common_constants.EVENT_TYPE_ELEVATION,
+                missing_trip_subtype=MISSING_TRIP,
+                starting_time=starting_time,
+                elevation_reset_subtype=ELEVATION_RESET,
+            ).fetchall()
+
+    def create_map(self, start_time):
+        # Might as well start with elevation set to 0, no absolute reference
+        query = text(
+            "INSERT INTO floor_maps (start_time, last_update, last_elevation, floors) "
+            "VALUES (:init_time, :init_time, 0, '{}') RETURNING id"
+        )
+        with self._connect() as con:
+            map_id = con.execute(query, init_time=start_time).scalar()
+        self._saved(map_id, {})
+        return map_id
+
+    def save_map(self, map_id, floors, last_elevation, last_update):
+        if map_id != self.saved_map_id:
+            self._saved(map_id, {})
+        changed = [
+            {
+                "map_id": map_id,
+                "floor_id": floor_id,
+                "schema_version": floor.get(FLOOR_SCHEMA),
+                "elevation": floor.get(FLOOR_ELEVATION),
+                "landing_num": floor.get(FLOOR_LANDING),
+                "cumulative_err": floor.get(FLOOR_CUMULATIVE_ERR),
+                "last_updated": floor.get(FLOOR_LAST_UPDATED),
+            }
+            for floor_id, floor in floors.items()
+            if self.saved_floors.get(floor_id) != floor
+        ]
+        with self._connect() as con:
+            con.execute(
+                text(
+                    "UPDATE floor_maps SET last_elevation = :elevation, "
+                    "last_update = :last_update WHERE id = :map_id"
+                ),
+                elevation=last_elevation,
+                last_update=last_update,
+                map_id=map_id,
+            )
+            if changed:
+                con.execute(
+                    text(
+                        "INSERT INTO floors (floor_map_id, floor_id, schema_version, "
+                        "elevation, landing_num, cumulative_err, last_updated) "
+                        "VALUES (:map_id, :floor_id, :schema_version, :elevation, "
+                        ":landing_num, :cumulative_err, CAST(:last_updated AS TIMESTAMP)) "
+                        "ON CONFLICT (floor_map_id, floor_id) DO UPDATE SET "
+                        "schema_version = EXCLUDED.schema_version, "
+                        "elevation = EXCLUDED.elevation, "
+                        "landing_num = EXCLUDED.landing_num, "
+                        "cumulative_err = EXCLUDED.cumulative_err, "
+                        "last_updated = EXCLUDED.last_updated"
+                    ),
+                    changed,
+                )
+        for row in changed:
+            self.saved_floors[row["floor_id"]] = dict(floors[row["floor_id"]])
+
+    def save_trip_floors(self, trip_updates):
+        """
+        Label trips with one set based UPDATE per chunk instead of one UPDATE per trip.
+        """
+        chunk_size = constants.MAX_TRIP_UPDATES_PER_STATEMENT
+        with self._connect() as con:
+            for start in range(0, len(trip_updates), chunk_size):
+                chunk = trip_updates[start:start + chunk_size]
+                values = []
+                params = {}
+                for i, (trip_id, ending_floor, floor_map_id, est_error) in enumerate(
+                    chunk
+                ):
+                    values.append(
+                        "(:trip_id_{0}, :ending_floor_{0}, "
+                        ":floor_map_id_{0}, :est_error_{0})".format(i)
+                    )
+                    params["trip_id_{0}".format(i)] = trip_id
+                    params["ending_floor_{0}".format(i)] = ending_floor
+                    params["floor_map_id_{0}".format(i)] = floor_map_id
+                    params["est_error_{0}".format(i)] = est_error
+                con.execute(
+                    text(
+                        "UPDATE trips SET ending_floor = CAST(v.ending_floor AS TEXT), "
+                        "floor_map_id = CAST(v.floor_map_id AS INTEGER), "
+                        "floor_estimated_error = CAST(v.est_error AS INTEGER) "
+                        "FROM (VALUES {0}) AS v "
+                        "(trip_id, ending_floor, floor_map_id, est_error) "
+                        "WHERE trips.id = v.trip_id".format(", ".join(values))
+                    ),
+                    params,
+                )
+
+    def map_created(self, reason):
+        Notification.send(NotificationTopic.FLOOR_MAP_CREATED, {"reason": reason})
+
+
+class InMemoryFloorStore(FloorStore):
+    """
+    Keeps maps, trips and events in plain Python structures, used by the simulator.
+
+    Floors go through a JSON round trip on the way in and out just like the JSONB
+    column, so the processor sees exactly what it would get from Postgres.
+    Transactions aren't rolled back.
+    """
+
+    def __init__(self, floor_count):
+        self.floor_count = floor_count
+        self.maps = []
+        self.trips = {}
+        self.events = []
+        self.created_map_reasons = []
+        self._next_id = 1
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id - 1
+
+    def add_trip(self, start_time, elevation_change):
+        trip_id = self._new_id()
+        self.trips[trip_id] = {
+            "id": trip_id,
+            "start_time": start_time,
+            "elevation_change": elevation_change,
+            "ending_floor": None,
+            "floor_map_id": None,
+            "floor_estimated_error": None,
+        }
+        return trip_id
+
+    def add_event(self, subtype, occurred_at, elevation_change=0):
+        self.events.append(
+            {
+                "type": subtype,
+                "occurred_at": occurred_at,
+                "id": self._new_id(),
+                "elevation_change": elevation_change,
+            }
+        )
+
+    def delete_trips_and_events(self):
+        self.trips = {}
+        self.events = []
+
+    def get_floor_count(self):
+        return self.floor_count
+
+    def get_latest_map(self):
+        if not self.maps:
+            return None
+        # Same as FloorMap.get_lastest_map, the latest start time wins.
+        floor_map = max(self.maps, key=lambda m: m["start_time"])
+        return {
+            "id": floor_map["id"],
+            "last_update": floor_map["last_update"],
+            "last_elevation": floor_map["last_elevation"],
+            "floors": json.loads(floor_map["floors"]),
+        }
+
+    def get_events_and_trips(self, starting_time):
+        items = [e for e in self.events if e["occurred_at"] > starting_time]
+        items.extend(
+            {
+                "type": "trip",
+                "occurred_at": t["start_time"],
+                "id": t["id"],
+                "elevation_change": t["elevation_change"],
+            }
+            for t in self.trips.values()
+            if t["ending_floor"] is None and t["start_time"] > starting_time
+        )
+        return sorted(items, key=lambda i: i["occurred_at"])
+
+    def create_map(self, start_time):
+        map_id = self._new_id()
+        self.maps.append(
+            {
+                "id": map_id,
+                "start_time": start_time,
+                "last_update": start_time,
+                "last_elevation": 0,
+                "floors": "{}",
+            }
+        )
+        return map_id
+
+    def save_map(self, map_id, floors, last_elevation, last_update):
+        for floor_map in self.maps:
+            if floor_map["id"] == map_id:
+                floor_map["floors"] = json.dumps(floors)
+                floor_map["last_elevation"] = last_elevation
+                floor_map["last_update"] = last_update
+
+    def save_trip_floors(self, trip_updates):
+        for trip_id, ending_floor, floor_map_id, est_error in trip_updates:
+            trip = self.trips.get(trip_id)
+            if trip is not None:
+                trip["ending_floor"] = str(ending_floor)
+                trip["floor_map_id"] = floor_map_id
+                trip["floor_estimated_error"] = est_error
+
+    def map_created(self, reason):
+        self.created_map_reasons.append(reason)
@@ -1,9 +1,9 @@
 import logging
-import time
 
 from floor_detector import constants
 from floor_detector.floor_processor import FloorProcessor
-from utilities import device_configuration
+from utilities import common_constants, device_configuration
+from utilities.db_listener import DatabaseListener
 from utilities.logging import create_rotating_log
 
 
@@ -15,10 +15,11 @@ def main():
     elevator = device_configuration.DeviceConfiguration.is_elevator(logger)
     try:
         floor_processor = FloorProcessor()
+        listener = DatabaseListener(common_constants.TRIPS_CHANNEL, common_constants.EVENTS_CHANNEL)
         while True:
             if elevator:
                 floor_processor.process_trips()
-            time.sleep(constants.DELAY_BETWEEN_EXECUTIONS)
+            listener.wait(constants.DELAY_BETWEEN_EXECUTIONS)
     except Exception as e:
         logger.exception("Exception: " + str(e))
 
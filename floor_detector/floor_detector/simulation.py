@@ -0,0 +1,233 @@
+"""
+Monte Carlo simulation of the floor detector against an in-memory store.
+
+Same model as tests_monte_carlo.py (elevation noise, missed trips, map resets, app
+restarts and floor drift) but without a database, so many seeded scenarios can run
+in parallel, one per core.
+"""
+import sys
+import time
+import random
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime, timedelta
+
+import floor_detector.constants as constants
+from floor_detector.floor_processor import FloorProcessor
+from floor_detector.floor_store import InMemoryFloorStore
+from utilities import common_constants
+
+ELEVATION_RESET = common_constants.EVENT_SUBTYPE_ELEVATION_RESET
+MISSING_TRIP = common_constants.EVENT_SUBTYPE_MISSING_TRIP
+
+FLOOR_ELEVATIONS = [-50, 0, 50, 100, 150, 200, 250, 300, 350, 400]
+DEFAULT_ITERATIONS = 10000
+DEFAULT_SCENARIOS = 8
+# Trips and events are cleaned out of the store this often, like the real truncator.
+CLEANUP_INTERVAL = 100
+
+
+class ScenarioParameters:
+    def __init__(
+        self,
+        seed,
+        iterations=DEFAULT_ITERATIONS,
+        floor_elevations=None,
+        elevation_noise=5,
+        trip_probability=0.99,
+        missing_trip_probability=0.007,
+        map_reset_probability=0.005,
+        app_restart_probability=0.002,
+        drift_probability=0.0,
+        drift_increment=0,
+    ):
+        self.seed = seed
+        self.iterations = iterations
+        self.floor_elevations = list(floor_elevations or FLOOR_ELEVATIONS)
+        self.elevation_noise = elevation_noise
+        self.trip_probability = trip_probability
+        self.missing_trip_probability = missing_trip_probability
+        self.map_reset_probability = map_reset_probability
+        self.app_restart_probability = app_restart_probability
+        self.drift_probability = drift_probability
+        self.drift_increment = drift_increment
+
+
+class Simulation:
+    def __init__(self, params):
+        self.params = params
+        self.random = random.Random(params.seed)
+        self.floor_elevations = list(params.floor_elevations)
+        self.store = InMemoryFloorStore(len(self.floor_elevations))
+        # The processor starts its first map now, the simulated trips come after it.
+        self.clock = datetime.now()
+        self.fp = FloorProcessor(self.store)
+
+        self.curr_floor = 1
+        self.map_origin = self.floor_elevations[self.curr_floor]
+        self.floor_visited = [False] * len(self.floor_elevations)
+
+        self.trips = 0
+        self.missed_trips = 0
+        self.map_resets = 0
+        self.app_restarts = 0
+        self.failures = 0
+        self.processing_seconds = 0.0
+
+    def _tick(self):
+        self.clock += timedelta(seconds=1)
+        return self.clock
+
+    def _process(self):
+        started = time.perf_counter()
+        self.fp.process_trips()
+        self.processing_seconds += time.perf_counter() - started
+
+    def run(self):
+        for iteration in range(self.params.iterations):
+            self.run_one_iteration()
+            if iteration % CLEANUP_INTERVAL == 0:
+                self.store.delete_trips_and_events()
+        return self.result()
+
+    def run_one_iteration(self):
+        p = self.params
+        if self.random.uniform(0.0, 1.0) < p.trip_probability:
+            self._move_to(
+                (self.curr_floor + self.random.randint(1, len(self.floor_elevations) - 1))
+                % len(self.floor_elevations)
+            )
+        if self.random.uniform(0.0, 1.0) < p.map_reset_probability:
+            self.map_resets += 1
+            self.store.add_event(ELEVATION_RESET, self._tick())
+            # The new map starts at 0 wherever the car is now.
+            self.map_origin = self.floor_elevations[self.curr_floor]
+            self.floor_visited = [False] * len(self.floor_elevations)
+            self._process()
+        if self.random.uniform(0.0, 1.0) < p.app_restart_probability:
+            self.app_restarts += 1
+            self.fp = FloorProcessor(self.store)
+        if self.random.uniform(0.0, 1.0) < p.drift_probability:
+            self._drift_a_floor()
+
+    def _move_to(self, next_floor):
+        p = self.params
+        new_floor = not self.floor_visited[next_floor]
+        self.floor_visited[next_floor] = True
+        # Don't add noise to the initial visit to a floor
+        noise = (
+            0 if new_floor else self.random.randint(-p.elevation_noise, p.elevation_noise)
+        )
+        elevation_change = (
+            noise
+            + self.floor_elevations[next_floor]
+            - self.floor_elevations[self.curr_floor]
+        )
+        if not new_floor and self.random.uniform(0.0, 1.0) < p.missing_trip_probability:
+            self.missed_trips += 1
+            self.store.add_event(MISSING_TRIP, self._tick(), elevation_change)
+            # When we can't lock into a floor, the passing threshold is much higher.
+            pass_threshold = constants.MIN_FLOOR_SEPARATION - 1
+        else:
+            self.trips += 1
+            self.store.add_trip(self._tick(), elevation_change)
+            pass_threshold = constants.MIN_FLOOR_SEPARATION - 5
+        self._process()
+
+        expected = self.floor_elevations[next_floor] - self.map_origin
+        if abs(self.fp.elevation - expected) > pass_threshold:
+            self.failures += 1
+        self.curr_floor = next_floor
+
+    def _drift_a_floor(self):
+        floor = self.random.randint(0, len(self.floor_elevations) - 1)
+        drift = self.random.choice((-1, 1)) * self.params.drift_increment
+        elevations = sorted(self.floor_elevations)
+        moved = self.floor_elevations[floor] + drift
+        # Keep the floors apart so a drifted floor can't be confused with its neighbour.
+        if all(
+            abs(moved - e) > constants.MIN_FLOOR_SEPARATION + 1
+            for e in elevations
+            if e != self.floor_elevations[floor]
+        ):
+            self.floor_elevations[floor] = moved
+
+    def result(self):
+        processed = self.trips + self.missed_trips
+        return {
+            "seed": self.params.seed,
+            "iterations": self.params.iterations,
+            "trips": self.trips,
+            "missed_trips": self.missed_trips,
+            "map_resets": self.map_resets,
+            "app_restarts": self.app_restarts,
+            "failures": self.failures,
+            "accuracy": round(1.0 - self.failures / processed, 5) if processed else 1.0,
+            "us_per_trip": round(self.processing_seconds * 1e6 / processed, 1)
+            if processed
+            else 0.0,
+        }
+
+
+def run_scenario(params):
+    return Simulation(params).run()
+
+
+def run_scenarios(param_list, processes=None):
+    """
+    Run every scenario, in parallel across cores unless processes is 1.
+    Results come back in the same order as param_list.
+    """
+    if processes == 1:
+        return [run_scenario(params) for params in param_list]
+    with multiprocessing.Pool(processes=processes) as pool:
+        return pool.map(run_scenario, param_list)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Floor detector Monte Carlo simulation")
+    parser.add_argument("-n", "--scenarios", type=int, default=DEFAULT_SCENARIOS)
+    parser.add_argument("-i", "--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--seed", type=int, default=15, help="seed of the first scenario")
+    parser.add_argument("-p", "--processes", type=int, default=None)
+    parser.add_argument("--noise", type=int, default=5)
+    parser.add_argument("--drift-probability", type=float, default=0.0)
+    parser.add_argument("--drift-increment", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # The processor logs every new floor and map, far too much for thousands of trips.
+    logging.basicConfig(level=logging.WARNING)
+
+    param_list = [
+        ScenarioParameters(
+            args.seed + i,
+            iterations=args.iterations,
+            elevation_noise=args.noise,
+            drift_probability=args.drift_probability,
+            drift_increment=args.drift_increment,
+        )
+        for i in range(args.scenarios)
+    ]
+    started = time.perf_counter()
+    results = run_scenarios(param_list, args.processes)
+    elapsed = time.perf_counter() - started
+
+    for r in results:
+        print(
+            "seed {seed}: {trips} trips, {missed_trips} missed, {map_resets} resets, "
+            "{app_restarts} restarts, {failures} failures, accuracy {accuracy}, "
+            "{us_per_trip} us/trip".format(**r)
+        )
+    total_trips = sum(r["trips"] + r["missed_trips"] for r in results)
+    total_failures = sum(r["failures"] for r in results)
+    print(
+        "{0} scenarios, {1} trips in {2:.1f} s, {3} failures".format(
+            len(results), total_trips, elapsed, total_failures
+        )
+    )
+    return 1 if total_failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@ from unittest.mock import Mock
 import dateutil.parser
 from freezegun import freeze_time
 
+from floor_detector import benchmark
 from floor_detector.floor_processor import FloorProcessor
 from utilities import common_constants
 from utilities.db_utilities import engine, session_scope, FloorMap
@@ -253,7 +254,7 @@ class TestFloorDetection(unittest.TestCase):
         with engine.connect() as con:
             map = con.execute(
                 "SELECT start_time, last_update, last_elevation, floors "
-                "FROM floor_maps ORDER BY id DESC LIMIT 1"
+                "FROM floor_maps_json ORDER BY id DESC LIMIT 1"
             ).fetchone()
         self.assertEqual(map["start_time"], new_map_time)
         self.assertEqual(map["last_update"], new_map_time)
@@ -337,6 +338,170 @@ class TestFloorDetection(unittest.TestCase):
         self.assertEqual(items2[0]["type"], ELEVATION_RESET)
         self.assertEqual(items2[0]["occurred_at"], t04)
 
+    def test_batch_with_map_reset(self):
+        self.set_floor_count(10)
+        fp = FloorProcessor()
+        first_map_id = fp.map_id
+        sleep(0.1)
+        t00 = datetime.now()
+        self.testutil.insert_trip(starts_at=t00, elevation_change=40)
+        self.testutil.insert_trip(
+            starts_at=t00 + timedelta(seconds=10), elevation_change=-40
+        )
+        t02 = t00 + timedelta(seconds=20)
+        self.testutil.create_event(
+            event_type=ELEVATION_EVENT, subtype=ELEVATION_RESET, occurred_at=t02
+        )
+        t03 = t00 + timedelta(seconds=30)
+        self.testutil.insert_trip(starts_at=t03, elevation_change=35)
+
+        fp._flush = Mock(wraps=fp._flush)
+        fp.process_trips()
+        self.assertEqual(fp._flush.call_count, 2, "one flush for the reset, one at the end")
+
+        with session_scope() as session:
+            maps = session.query(FloorMap).order_by(FloorMap.id).all()
+            self.assertEqual([m.id for m in maps][0], first_map_id)
+            self.assertEqual(len(maps), 2)
+            self.assertEqual(len(maps[0].floors), 2)
+            self.assertEqual(maps[0].last_elevation, 0)
+            self.assertEqual(maps[1].start_time.replace(tzinfo=None), t02)
+            self.assertEqual(maps[1].last_update.replace(tzinfo=None), t03)
+            self.assertEqual(maps[1].last_elevation, 35)
+            self.assertEqual(fp.map_id, maps[1].id)
+
+        with engine.connect() as con:
+            trips = con.execute(
+                "SELECT ending_floor, floor_map_id FROM trips ORDER BY start_time"
+            ).fetchall()
+        self.assertEqual(trips[0]["floor_map_id"], first_map_id)
+        self.assertEqual(trips[1]["floor_map_id"], first_map_id)
+        self.assertNotEqual(trips[0]["ending_floor"], trips[1]["ending_floor"])
+        self.assertEqual(trips[2]["floor_map_id"], fp.map_id)
+
+    def test_failed_batch_writes_nothing(self):
+        self.set_floor_count(10)
+        fp = FloorProcessor()
+        last_update = fp._get_last_update_timestamp()
+        sleep(0.1)
+        t00 = datetime.now()
+        self.testutil.insert_trip(starts_at=t00, elevation_change=40)
+        self.testutil.insert_trip(
+            starts_at=t00 + timedelta(seconds=10), elevation_change=-40
+        )
+        get_closest_floor = fp._get_closest_floor
+        fp._get_closest_floor = Mock(
+            side_effect=[get_closest_floor(40), Exception("boom")]
+        )
+        with self.assertRaises(Exception):
+            fp.process_trips()
+        self.assertIsNone(self.testutil.get_last_trip()["ending_floor"])
+        self.assertEqual(fp._get_floors(), {})
+        self.assertEqual(fp._get_last_update_timestamp(), last_update)
+        self.assertEqual(fp.last_update, last_update)
+
+        # The next batch starts over from what's in the database.
+        fp._get_closest_floor = get_closest_floor
+        fp.process_trips()
+        with engine.connect() as con:
+            labelled = con.execute(
+                "SELECT count(*) FROM trips WHERE ending_floor IS NOT NULL"
+            ).scalar()
+        self.assertEqual(labelled, 2)
+
+    def test_write_trip_floors_in_one_statement(self):
+        self.set_floor_count(10)
+        fp = FloorProcessor()
+        for _ in range(3):
+            self.testutil.insert_trip(elevation_change=40)
+        with engine.connect() as con:
+            trip_ids = [
+                row["id"] for row in con.execute("SELECT id FROM trips ORDER BY id")
+            ]
+        updates = [
+            (trip_ids[0], "1", fp.map_id, 0),
+            (trip_ids[1], "2", fp.map_id, -3),
+            (trip_ids[2], "1", None, 5),
+        ]
+        with fp.store.transaction():
+            con = Mock(wraps=fp.store.connection)
+            fp.store.connection = con
+            fp.store.save_trip_floors(updates)
+        self.assertEqual(con.execute.call_count, 1)
+        with engine.connect() as con:
+            trips = con.execute(
+                "SELECT id, ending_floor, floor_map_id, floor_estimated_error "
+                "FROM trips ORDER BY id"
+            ).fetchall()
+        self.assertEqual([tuple(t) for t in trips], updates)
+
+    def test_benchmark_labels_whole_backlog(self):
+        with engine.connect() as con:
+            trips_before = con.execute("SELECT count(*) FROM trips").scalar()
+        for store_class in (benchmark.PerTripFloorStore, benchmark.BenchmarkFloorStore):
+            result = benchmark.run(store_class, trips=50)
+            self.assertEqual(result["labelled"], 50)
+        with engine.connect() as con:
+            self.assertEqual(
+                con.execute("SELECT count(*) FROM trips").scalar(), trips_before
+            )
+
+    def _floor_row_versions(self):
+        with engine.connect() as con:
+            return dict(
+                con.execute("SELECT floor_id, CAST(xmin AS TEXT) FROM floors").fetchall()
+            )
+
+    def test_matched_trip_only_rewrites_its_floor(self):
+        self.set_floor_count(10)
+        fp = FloorProcessor()
+        sleep(0.1)
+        t00 = datetime.now()
+        for i, elevation_change in enumerate((40, 40, -40)):
+            self.testutil.insert_trip(
+                starts_at=t00 + timedelta(seconds=10 * i),
+                elevation_change=elevation_change,
+            )
+        fp.process_trips()
+        before = self._floor_row_versions()
+        self.assertEqual(len(before), 2)
+
+        self.testutil.insert_trip(
+            starts_at=t00 + timedelta(seconds=30), elevation_change=38
+        )
+        fp.process_trips()
+        after = self._floor_row_versions()
+        ending_floor = self.testutil.get_last_trip()["ending_floor"]
+        for floor_id in before:
+            if floor_id == ending_floor:
+                self.assertNotEqual(before[floor_id], after[floor_id])
+            else:
+                self.assertEqual(before[floor_id], after[floor_id])
+
+        with session_scope() as session:
+            floor_map = FloorMap.get_lastest_map(session)
+            self.assertEqual(floor_map.floors, fp._get_floors())
+            self.assertEqual(floor_map.floors[ending_floor][FLOOR_CUMULATIVE_ERR], -2)
+
+    def test_floors_moved_out_of_legacy_json(self):
+        self.set_floor_count(10)
+        self.delete_map()
+        self.testutil.create_floor_map(
+            start_time=datetime.now(), last_update=datetime.now(), last_elevation=0
+        )
+        fp = FloorProcessor()
+        legacy_floors = json.loads(json.dumps(fp._get_floors()))
+        self.testutil.insert_trip(starts_at=datetime.now(), elevation_change=31)
+        fp.process_trips()
+
+        self.assertEqual(len(self._floor_row_versions()), len(legacy_floors))
+        with engine.connect() as con:
+            floors = con.execute("SELECT floors FROM floor_maps_json").scalar()
+        self.assertEqual(floors["3"][FLOOR_CUMULATIVE_ERR], 1)
+        for floor_id, floor in legacy_floors.items():
+            self.assertEqual(floors[floor_id][FLOOR_ELEVATION], floor[FLOOR_ELEVATION])
+            self.assertEqual(floors[floor_id][FLOOR_LANDING], floor[FLOOR_LANDING])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+import unittest
+
+from floor_detector.floor_processor import FloorProcessor
+from floor_detector.floor_store import FloorStore, InMemoryFloorStore, PostgresFloorStore
+from floor_detector.simulation import ScenarioParameters, run_scenario, run_scenarios
+from utilities import common_constants
+from utilities.db_utilities import engine
+from utilities.test_utilities import TestUtilities
+
+ELEVATION_RESET = common_constants.EVENT_SUBTYPE_ELEVATION_RESET
+ELEVATION_EVENT = common_constants.EVENT_TYPE_ELEVATION
+
+
+class TestInMemoryFloorStore(unittest.TestCase):
+    testutil = TestUtilities()
+
+    def _delete_data(self):
+        with engine.connect() as con:
+            con.execute("DELETE FROM events;")
+            con.execute("DELETE FROM trips;")
+            con.execute("DELETE FROM floor_maps;")
+
+    def setUp(self):
+        self._delete_data()
+
+    def tearDown(self):
+        self._delete_data()
+
+    def test_same_floors_as_postgres(self):
+        config = {"type": "elevator", common_constants.CONFIG_FLOOR_COUNT: 10}
+        self.testutil.set_config(config)
+        store = InMemoryFloorStore(10)
+        pg_fp = FloorProcessor(PostgresFloorStore())
+        mem_fp = FloorProcessor(store)
+
+        t = datetime.now() + timedelta(seconds=1)
+        elevation_changes = [48, 50, -97, 2, 95, -48, None, 46, -3, 140, -190]
+        for i, elevation_change in enumerate(elevation_changes):
+            starts_at = t + timedelta(seconds=30 * i)
+            if elevation_change is None:
+                self.testutil.create_event(
+                    event_type=ELEVATION_EVENT,
+                    subtype=ELEVATION_RESET,
+                    occurred_at=starts_at,
+                )
+                store.add_event(ELEVATION_RESET, starts_at)
+            else:
+                self.testutil.insert_trip(
+                    starts_at=starts_at, elevation_change=elevation_change
+                )
+                store.add_trip(starts_at, elevation_change)
+        pg_fp.process_trips()
+        mem_fp.process_trips()
+
+        self.assertEqual(mem_fp.elevation, pg_fp.elevation)
+        self.assertEqual(mem_fp.last_update, pg_fp.last_update)
+        self.assertEqual(mem_fp._get_floors(), pg_fp._get_floors())
+        self.assertEqual(len(store.maps), 2)
+        self.assertEqual(store.created_map_reasons, ["initial", "elevation_reset"])
+        with engine.connect() as con:
+            pg_floors = [
+                (row["ending_floor"], row["floor_estimated_error"])
+                for row in con.execute(
+                    "SELECT ending_floor, floor_estimated_error "
+                    "FROM trips ORDER BY start_time"
+                )
+            ]
+        mem_floors = [
+            (trip["ending_floor"], trip["floor_estimated_error"])
+            for trip in sorted(store.trips.values(), key=lambda t: t["start_time"])
+        ]
+        self.assertEqual(mem_floors, pg_floors)
+
+
+class TestFloorStore(unittest.TestCase):
+    def test_incomplete_store_fails_when_created(self):
+        class NoTripFloorsStore(InMemoryFloorStore):
+            save_trip_floors = FloorStore.save_trip_floors
+
+        with self.assertRaises(TypeError):
+            NoTripFloorsStore(10)
+
+
+class TestFloorSimulation(unittest.TestCase):
+    def test_scenario_is_accurate_and_reproducible(self):
+        params = ScenarioParameters(15, iterations=1000, map_reset_probability=0.02)
+        first = run_scenario(params)
+        second = run_scenario(params)
+        self.assertEqual(first["failures"], 0)
+        self.assertGreater(first["map_resets"], 0)
+        for key in ("trips", "missed_trips", "map_resets", "app_restarts", "failures"):
+            self.assertEqual(first[key], second[key])
+
+    def test_parallel_results_in_order(self):
+        param_list = [ScenarioParameters(seed, iterations=200) for seed in (3, 1, 2)]
+        parallel = run_scenarios(param_list, processes=2)
+        serial = run_scenarios(param_list, processes=1)
+        self.assertEqual([r["seed"] for r in parallel], [3, 1, 2])
+        self.assertEqual([r["trips"] for r in parallel], [r["trips"] for r in serial])
+
+    def test_noisy_elevation_is_caught(self):
+        # With noise bigger than the floor error, trips start landing on new floors.
+        params = ScenarioParameters(15, iterations=500, elevation_noise=40)
+        self.assertGreater(run_scenario(params)["failures"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
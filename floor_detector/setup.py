@@ -13,6 +13,8 @@ setup(name='liftai-floordetector',
       entry_points={
           'console_scripts': [
               'floordetector = floor_detector.main:main',
+              'floordetectorbenchmark = floor_detector.benchmark:main',
+              'floordetectorsim = floor_detector.simulation:main',
           ]
       },
       install_requires=requirements,
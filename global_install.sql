@@ -31,6 +31,79 @@ ALTER TABLE altimeter_data OWNER TO usr;
 
 CREATE INDEX IF NOT EXISTS altimeter_data_timestamp_idx ON altimeter_data USING btree (timestamp);
 
+-- Per minute rollup of altimeter_data, kept long after the raw samples are truncated.
+CREATE TABLE IF NOT EXISTS altimeter_minutes
+(
+  minute timestamp without time zone NOT NULL,
+  samples integer NOT NULL DEFAULT 0,              -- Samples with an altitude
+  min_altitude integer,
+  max_altitude integer,
+  sum_altitude bigint NOT NULL DEFAULT 0,
+  first_timestamp timestamp without time zone NOT NULL,
+  first_altitude integer,
+  last_timestamp timestamp without time zone NOT NULL,
+  last_altitude integer,
+  min_temperature DOUBLE PRECISION,
+  max_temperature DOUBLE PRECISION,
+  sum_temperature DOUBLE PRECISION NOT NULL DEFAULT 0,
+  temperature_samples integer NOT NULL DEFAULT 0,
+  CONSTRAINT altimeter_minutes_pkey PRIMARY KEY (minute)
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE altimeter_minutes OWNER TO usr;
+
+-- Roll up the data written before the altimeter writer maintained the table.
+INSERT INTO altimeter_minutes
+SELECT
+  date_trunc('minute', timestamp),
+  COUNT(altitude_x16),
+  MIN(altitude_x16),
+  MAX(altitude_x16),
+  COALESCE(SUM(altitude_x16), 0),
+  MIN(timestamp),
+  (array_agg(altitude_x16 ORDER BY timestamp ASC))[1],
+  MAX(timestamp),
+  (array_agg(altitude_x16 ORDER BY timestamp DESC))[1],
+  MIN(temperature),
+  MAX(temperature),
+  COALESCE(SUM(temperature), 0),
+  COUNT(temperature)
+FROM altimeter_data
+GROUP BY 1
+ON CONFLICT (minute) DO NOTHING;
+
+
+/*********** Sensor heartbeats **************/
+-- First and last sample of each sensor table in every second, the gap detector reads this instead of the raw data.
+CREATE TABLE IF NOT EXISTS sensor_heartbeats
+(
+  sensor text NOT NULL,                                  -- accelerometer_data or altimeter_data
+  second timestamp without time zone NOT NULL,
+  first_sample timestamp without time zone NOT NULL,
+  last_sample timestamp without time zone NOT NULL,
+  CONSTRAINT sensor_heartbeats_pkey PRIMARY KEY (sensor, second)
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE sensor_heartbeats OWNER TO usr;
+
+-- Fill in the heartbeats of the data written before the sensor writers maintained them.
+INSERT INTO sensor_heartbeats (sensor, second, first_sample, last_sample)
+SELECT 'accelerometer_data', date_trunc('second', timestamp), MIN(timestamp), MAX(timestamp)
+FROM accelerometer_data GROUP BY 2
+ON CONFLICT (sensor, second) DO UPDATE SET
+  first_sample = LEAST(sensor_heartbeats.first_sample, EXCLUDED.first_sample),
+  last_sample = GREATEST(sensor_heartbeats.last_sample, EXCLUDED.last_sample);
+INSERT INTO sensor_heartbeats (sensor, second, first_sample, last_sample)
+SELECT 'altimeter_data', date_trunc('second', timestamp), MIN(timestamp), MAX(timestamp)
+FROM altimeter_data GROUP BY 2
+ON CONFLICT (sensor, second) DO UPDATE SET
+  first_sample = LEAST(sensor_heartbeats.first_sample, EXCLUDED.first_sample),
+  last_sample = GREATEST(sensor_heartbeats.last_sample, EXCLUDED.last_sample);
+
 
 /*********** Data Sender ************/
 CREATE SEQUENCE IF NOT EXISTS data_to_send_id_seq;
@@ -50,6 +123,15 @@ WITH (
 );
 
 ALTER TABLE data_to_send ADD COLUMN IF NOT EXISTS resend boolean DEFAULT FALSE;
+-- See DATA_PRIORITY_* in common_constants, 0 for notifications, 1 for reports and 2 for pings.
+ALTER TABLE data_to_send ADD COLUMN IF NOT EXISTS priority smallint NOT NULL DEFAULT 1;
+UPDATE data_to_send SET priority = 2 WHERE endpoint = 'devices/ping' AND flag = FALSE AND priority <> 2;
+-- Notifications went to devices/track like the hourly reports, before they had a priority.
+UPDATE data_to_send SET priority = 0
+WHERE flag = FALSE AND priority <> 0
+  AND (endpoint = 'devices/notification' OR (endpoint = 'devices/track' AND payload->>'type' <> 'hourly_report'));
+-- The data sender picks the oldest unsent messages of each priority.
+CREATE INDEX IF NOT EXISTS data_to_send_flag_priority_timestamp_idx ON data_to_send USING btree (flag, priority, "timestamp");
 ALTER TABLE data_to_send ADD COLUMN IF NOT EXISTS success boolean;
 
 ALTER SEQUENCE data_to_send_id_seq OWNER TO usr;
@@ -107,6 +189,23 @@ WITH (
 ALTER TABLE Events OWNER TO usr;
 ALTER SEQUENCE events_id_seq OWNER TO usr;
 
+DO $$
+BEGIN
+IF NOT EXISTS (SELECT constraint_name FROM information_schema.table_constraints where table_name = 'events' and constraint_type = 'PRIMARY KEY')
+THEN
+  ALTER TABLE Events ADD PRIMARY KEY (id);
+END IF;
+END $$;
+
+-- The latest event of a type and subtype (Elisha, low use stoppage).
+CREATE INDEX IF NOT EXISTS events_type_subtype_id_idx ON events USING btree (event_type, event_subtype, id DESC);
+-- Events of a type and subtype since some time (floor detector, elevation, anomalies, reports).
+CREATE INDEX IF NOT EXISTS events_type_subtype_occurred_at_idx ON events USING btree (event_type, event_subtype, occurred_at);
+-- The latest event from a source (elevation).
+CREATE INDEX IF NOT EXISTS events_source_id_idx ON events USING btree (source, id DESC);
+-- Recent events of several types (elevation gaps), the type and subtype index alone reads every gap event.
+CREATE INDEX IF NOT EXISTS events_occurred_at_idx ON events USING btree (occurred_at);
+
 -- Problems are outputs from Elisha
 CREATE SEQUENCE IF NOT EXISTS problems_id_seq;
 CREATE TABLE IF NOT EXISTS Problems
@@ -133,6 +232,21 @@ ALTER SEQUENCE problems_id_seq OWNER TO usr;
 ALTER TABLE Problems ADD COLUMN IF NOT EXISTS updated_at timestamp without time zone DEFAULT NOW();
 ALTER TABLE Problems ADD COLUMN IF NOT EXISTS created_at timestamp without time zone DEFAULT NOW();
 
+DO $$
+BEGIN
+IF NOT EXISTS (SELECT constraint_name FROM information_schema.table_constraints where table_name = 'problems' and constraint_type = 'PRIMARY KEY')
+THEN
+  ALTER TABLE Problems ADD PRIMARY KEY (id);
+END IF;
+END $$;
+
+-- Open problems are few, the car status LEDs, anomalies and reports look for them.
+CREATE INDEX IF NOT EXISTS problems_open_idx ON problems USING btree (problem_type, problem_subtype) WHERE ended_at IS NULL;
+-- Problems that ended since some time (reports).
+CREATE INDEX IF NOT EXISTS problems_ended_at_idx ON problems USING btree (ended_at);
+-- 99% stoppages (standalone stoppage weekly activity model).
+CREATE INDEX IF NOT EXISTS problems_stoppages_idx ON problems USING btree (started_at) WHERE confidence >= 99;
+
 /*********** Escalator Stoppage ************/
 CREATE TABLE IF NOT EXISTS escalator_vibration
 (
@@ -241,6 +355,156 @@ ALTER TABLE Trips ADD COLUMN IF NOT EXISTS speed float;
 CREATE INDEX IF NOT EXISTS trips_start_time_idx ON Trips USING btree (start_time);
 CREATE INDEX IF NOT EXISTS trips_end_time_idx ON Trips USING btree (end_time);
 
+-- Trips per hour of start_time, kept up to date by a trigger on trips.  Hours without trips have no row.
+-- The stoppage detectors count trips over weeks of history from here instead of from the trips table.
+CREATE TABLE IF NOT EXISTS trip_counts
+(
+    hour timestamp without time zone NOT NULL,
+    trips integer NOT NULL,
+    first_start_time timestamp without time zone NOT NULL,
+    last_start_time timestamp without time zone NOT NULL,
+    CONSTRAINT trip_counts_pkey PRIMARY KEY (hour)
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE trip_counts OWNER TO usr;
+
+CREATE OR REPLACE FUNCTION trip_counts_trigger() RETURNS trigger AS $$
+DECLARE
+BEGIN
+  IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.start_time IS NOT NULL THEN
+    UPDATE trip_counts SET trips = trips - 1 WHERE hour = date_trunc('hour', OLD.start_time);
+    DELETE FROM trip_counts WHERE hour = date_trunc('hour', OLD.start_time) AND trips <= 0;
+    -- Only go back to the trips when the first or last trip of the hour is gone.  Row triggers run after the
+    -- whole statement, so this already sees every trip the statement deleted.
+    UPDATE trip_counts c SET first_start_time = COALESCE(t.first_start_time, c.first_start_time),
+                             last_start_time = COALESCE(t.last_start_time, c.last_start_time)
+    FROM (SELECT MIN(start_time) AS first_start_time, MAX(start_time) AS last_start_time FROM trips
+          WHERE start_time >= date_trunc('hour', OLD.start_time)
+            AND start_time < date_trunc('hour', OLD.start_time) + INTERVAL '1 hour') t
+    WHERE c.hour = date_trunc('hour', OLD.start_time)
+      AND OLD.start_time IN (c.first_start_time, c.last_start_time);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.start_time IS NOT NULL THEN
+    INSERT INTO trip_counts (hour, trips, first_start_time, last_start_time)
+    VALUES (date_trunc('hour', NEW.start_time), 1, NEW.start_time, NEW.start_time)
+    ON CONFLICT (hour) DO UPDATE SET
+      trips = trip_counts.trips + 1,
+      first_start_time = LEAST(trip_counts.first_start_time, EXCLUDED.first_start_time),
+      last_start_time = GREATEST(trip_counts.last_start_time, EXCLUDED.last_start_time);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trip_counts_trigger ON trips;
+CREATE TRIGGER trip_counts_trigger AFTER INSERT OR DELETE OR UPDATE OF start_time ON trips
+FOR EACH ROW EXECUTE PROCEDURE trip_counts_trigger();
+
+CREATE OR REPLACE FUNCTION trip_counts_truncate_trigger() RETURNS trigger AS $$
+BEGIN
+  DELETE FROM trip_counts;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trip_counts_truncate_trigger ON trips;
+CREATE TRIGGER trip_counts_truncate_trigger AFTER TRUNCATE ON trips
+FOR EACH STATEMENT EXECUTE PROCEDURE trip_counts_truncate_trigger();
+
+-- Backfill, also run it by hand with SELECT rebuild_trip_counts(); if the counts are ever in doubt.
+CREATE OR REPLACE FUNCTION rebuild_trip_counts() RETURNS void AS $$
+BEGIN
+  LOCK TABLE trips IN SHARE MODE;
+  DELETE FROM trip_counts;
+  INSERT INTO trip_counts (hour, trips, first_start_time, last_start_time)
+  SELECT date_trunc('hour', start_time), COUNT(*), MIN(start_time), MAX(start_time)
+  FROM trips WHERE start_time IS NOT NULL
+  GROUP BY 1;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_trip_counts();
+
+-- Number of trips with from_time <= start_time < to_time.  Whole hours come from trip_counts, only the trips
+-- in the partial hours at either end are counted from the trips table.  Use -infinity/infinity for open ends.
+CREATE OR REPLACE FUNCTION count_trips(from_time timestamp, to_time timestamp) RETURNS bigint AS $$
+  WITH bounds AS (
+    SELECT
+      CASE WHEN date_trunc('hour', from_time) = from_time THEN from_time
+           ELSE date_trunc('hour', from_time) + INTERVAL '1 hour'
+      END AS first_hour,
+      date_trunc('hour', to_time) AS last_hour
+  )
+  SELECT
+    COALESCE((SELECT SUM(trips) FROM trip_counts, bounds
+              WHERE hour >= first_hour AND hour < last_hour), 0)
+    + (SELECT COUNT(*) FROM trips, bounds
+       WHERE start_time >= from_time AND start_time < LEAST(to_time, first_hour))
+    + (SELECT COUNT(*) FROM trips, bounds
+       WHERE start_time >= GREATEST(first_hour, last_hour) AND start_time < to_time)
+$$ LANGUAGE sql STABLE;
+
+-- Published by the trips app as soon as the altimeter sees the car move, long before the trip itself
+-- is processed, so live views don't have to wait for the trips table.
+CREATE TABLE IF NOT EXISTS trips_in_progress
+(
+    id SERIAL,
+    start_time timestamp without time zone,
+    end_time timestamp without time zone,
+    is_up boolean,
+    starting_elevation integer,
+    ending_elevation integer,
+    status text NOT NULL,       -- started, stopped, completed or cancelled
+    updated_at timestamp without time zone DEFAULT NOW(),
+    CONSTRAINT trips_in_progress_pkey PRIMARY KEY (id)
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE trips_in_progress OWNER TO usr;
+
+CREATE INDEX IF NOT EXISTS trips_in_progress_updated_at_idx ON trips_in_progress USING btree (updated_at);
+
+CREATE OR REPLACE FUNCTION trip_in_progress_notify_trigger() RETURNS trigger AS $$
+DECLARE
+BEGIN
+  PERFORM pg_notify('trips_in_progress', NEW.id || ',' || NEW.status);
+  RETURN new;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trips_in_progress_trigger ON trips_in_progress;
+CREATE TRIGGER trips_in_progress_trigger AFTER INSERT OR UPDATE ON trips_in_progress
+FOR EACH ROW EXECUTE PROCEDURE trip_in_progress_notify_trigger();
+
+
+/*********** Change notifications ************/
+-- Apps LISTEN on a channel named after the table instead of polling it.  The payload doesn't
+-- have the id so Postgres folds all the notifications of one transaction into one.
+CREATE OR REPLACE FUNCTION table_changed_notify_trigger() RETURNS trigger AS $$
+DECLARE
+BEGIN
+  PERFORM pg_notify(TG_TABLE_NAME, TG_OP);
+  RETURN new;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deletes and start time changes are there for the stoppage detectors' cached last trip.  A trip is
+-- ready for the floor detector once elevation_processed is set.
+DROP TRIGGER IF EXISTS trips_notify_trigger ON trips;
+CREATE TRIGGER trips_notify_trigger AFTER INSERT OR DELETE OR UPDATE OF start_time, elevation_processed ON trips
+FOR EACH ROW EXECUTE PROCEDURE table_changed_notify_trigger();
+
+DROP TRIGGER IF EXISTS events_notify_trigger ON events;
+CREATE TRIGGER events_notify_trigger AFTER INSERT ON events
+FOR EACH ROW EXECUTE PROCEDURE table_changed_notify_trigger();
+
+DROP TRIGGER IF EXISTS problems_notify_trigger ON problems;
+CREATE TRIGGER problems_notify_trigger AFTER INSERT OR UPDATE ON problems
+FOR EACH ROW EXECUTE PROCEDURE table_changed_notify_trigger();
+
 
 /*********** Floor Detector ************/
 CREATE TABLE IF NOT EXISTS floor_maps
@@ -270,6 +534,54 @@ ALTER TABLE Trips ADD CONSTRAINT fk_trips_floor_maps FOREIGN KEY (floor_map_id)
             REFERENCES floor_maps (id) ON DELETE RESTRICT;
 
 
+-- One row per floor, so matching a trip only rewrites that floor instead of the whole floors JSONB.
+CREATE TABLE IF NOT EXISTS floors
+(
+    floor_map_id integer NOT NULL REFERENCES floor_maps (id) ON DELETE CASCADE,
+    floor_id text NOT NULL,
+    schema_version integer,
+    elevation integer,
+    landing_num integer,
+    cumulative_err integer,
+    last_updated timestamp without time zone,
+    PRIMARY KEY (floor_map_id, floor_id)
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE floors OWNER TO usr;
+
+-- Move maps that still keep their floors in floor_maps.floors over to the floors table.
+INSERT INTO floors (floor_map_id, floor_id, schema_version, elevation, landing_num, cumulative_err, last_updated)
+SELECT m.id, f.key,
+    CAST(f.value->>'schema' AS integer),
+    CAST(f.value->>'elevation' AS integer),
+    CAST(f.value->>'landing' AS integer),
+    CAST(f.value->>'cumulative error' AS integer),
+    CAST(f.value->>'last updated' AS timestamp)
+FROM floor_maps m, jsonb_each(m.floors) f
+WHERE m.floors IS NOT NULL AND m.floors <> '{}'
+ON CONFLICT DO NOTHING;
+UPDATE floor_maps SET floors = NULL
+WHERE floors IS NOT NULL AND floors <> '{}' AND id IN (SELECT floor_map_id FROM floors);
+
+-- Floor maps with the floors rebuilt as JSON, in the same format floor_maps.floors used to have.
+CREATE OR REPLACE VIEW floor_maps_json AS
+SELECT m.id, m.start_time, m.last_update, m.last_elevation,
+    COALESCE(f.floors, m.floors, '{}') AS floors
+FROM floor_maps m
+LEFT JOIN LATERAL (
+    SELECT jsonb_object_agg(floor_id, jsonb_build_object(
+        'schema', schema_version,
+        'elevation', elevation,
+        'landing', landing_num,
+        'cumulative error', cumulative_err,
+        'last updated', to_char(last_updated, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+    )) AS floors
+    FROM floors WHERE floor_map_id = m.id
+) f ON TRUE;
+ALTER VIEW floor_maps_json OWNER TO usr;
+
 /********** Migrate trips without a floor_map_id **********/
 -- We don't go back before July 1, 2020 to limit the migration processing.
 WITH pairs AS (
@@ -13,20 +13,22 @@ WITH day_numbers AS (
   SELECT generate_series( '{0}'::DATE - INTERVAL '4 WEEKS', '{0}'::DATE - INTERVAL '1 WEEK', '1 WEEK') as d
 ),
 trip_data AS (
+  -- Virtual days start on the hour, so each one is made of whole hours of trip_counts.
   SELECT
     dn.d AS day,
-    t.start_time - INTERVAL '{1} HOURS' AS trip_time,
+    c.trips AS trips,
+    c.first_start_time - INTERVAL '{1} HOURS' AS first_trip_time,
     p.id AS problem
   FROM day_numbers dn
-  LEFT OUTER JOIN trips t on DATE(t.start_time - INTERVAL '{1} HOURS') = dn.d
+  LEFT OUTER JOIN trip_counts c on c.hour >= dn.d + INTERVAL '{1} HOURS' AND c.hour < dn.d + INTERVAL '1 DAY' + INTERVAL '{1} HOURS'
   LEFT OUTER JOIN problems p on DATE(p.started_at - INTERVAL '{1} HOURS') <= dn.d AND (DATE(p.ended_at - INTERVAL '{1} HOURS') >= dn.d OR p.ended_at IS NULL)
 ),
 single_days AS (
   SELECT
     day,
-    COUNT(trip_time) AS trips,
+    COALESCE(SUM(trips), 0) AS trips,
     CASE
-      WHEN COUNT(trip_time) = 0 THEN 1
+      WHEN COALESCE(SUM(trips), 0) = 0 THEN 1
       ELSE 0
     END AS no_trip_flag,
     CASE
@@ -36,7 +38,7 @@ single_days AS (
     CASE
       -- first trip of the day is only valid with no shutdowns during the day
       WHEN COUNT(problem) > 0 THEN NULL
-      ELSE MIN(trip_time::time)   -- Note that trip time is offset from virtual midnight
+      ELSE MIN(first_trip_time::time)   -- Note that trip time is offset from virtual midnight
     END AS first_trip
   FROM trip_data GROUP BY day ORDER BY day ASC
 )
@@ -59,10 +61,17 @@ WITH hours AS
 ),
 trip_count AS
 (
+  -- Whole hours come from trip_counts, only the trips in the partial hour 28 days ago are read one by one.
+  SELECT
+    extract( hour FROM hour) AS hour,
+    trips AS trip
+  FROM trip_counts WHERE hour > CAST(NOW() - INTERVAL '28 DAYS' AS TIMESTAMP)
+  UNION ALL
   SELECT
     extract( hour FROM start_time) AS hour,
     1 AS trip
-  FROM trips WHERE start_time > NOW() - INTERVAL '28 DAYS'
+  FROM trips WHERE start_time > CAST(NOW() - INTERVAL '28 DAYS' AS TIMESTAMP)
+    AND start_time < date_trunc('hour', CAST(NOW() - INTERVAL '28 DAYS' AS TIMESTAMP)) + INTERVAL '1 HOUR'
   UNION ALL
   SELECT
     hour,
@@ -77,15 +86,14 @@ GROUP BY hour
 ORDER BY hour ASC;
 """
 
+# count_trips() includes its start, timestamps have microsecond resolution so this is start_time > ...
 sql_trips_week_ago = """
-SELECT COUNT(*) FROM trips
-  WHERE start_time > '{0}'::DATE - INTERVAL '7 DAYS'
-  AND start_time < '{0}'::DATE - INTERVAL '6 DAYS';
+SELECT count_trips('{0}'::DATE - INTERVAL '7 DAYS' + INTERVAL '1 MICROSECOND', '{0}'::DATE - INTERVAL '6 DAYS');
 """
 
 sql_total_trips_today = """
 -- Use > and not >= so we can use this for trips after a shutdown.
-SELECT COUNT(*) FROM trips WHERE start_time > '{0}';
+SELECT count_trips('{0}'::TIMESTAMP + INTERVAL '1 MICROSECOND', 'infinity');
 """
 
 sql_get_low_use_shutdown_status = """
@@ -95,6 +103,13 @@ WHERE event_type = '{0}' AND event_subtype = '{1}'
 ORDER BY id DESC LIMIT 1;
 """
 
+sql_get_low_use_shutdown_status_before = """
+SELECT detected_at, confidence
+FROM events
+WHERE event_type = '{0}' AND event_subtype = '{1}' AND detected_at < '{2}'
+ORDER BY id DESC LIMIT 1;
+"""
+
 logger = logging.getLogger(__name__)
 
 
@@ -175,8 +190,8 @@ class LowUseStoppageProcessor(StoppageProcessor):
             virtual_midnight = virtual_midnight - timedelta(days=1)
         # Check if the most recent low use event (if any) from before today had a non-zero confidence.
         with self.engine.connect() as con:
-            result = con.execute("SELECT detected_at, confidence FROM events WHERE event_subtype='{0}' AND detected_at < '{1}' ORDER BY id DESC LIMIT 1"
-                            .format(common_constants.EVENT_SUBTYPE_LOW_USAGE_SHUTDOWN,str(virtual_midnight))).fetchone()
+            result = con.execute(sql_get_low_use_shutdown_status_before.format(common_constants.EVENT_TYPE_SHUTDOWN,
+                            common_constants.EVENT_SUBTYPE_LOW_USAGE_SHUTDOWN, str(virtual_midnight))).fetchone()
         if result and result[1] > 0:
             # This is a shutdown situation from before today, so don't do any processing other than looking for a trip.
             logger.debug("...pre-existing shutdown detected at {0} with confidence {1}".format(result['detected_at'], result['confidence']))
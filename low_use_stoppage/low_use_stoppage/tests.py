@@ -1,15 +1,79 @@
 import os
+import random
 import unittest
 from decimal import Decimal
 from datetime import datetime, timedelta, time
 from unittest.mock import Mock
 
+from sqlalchemy import text
+
 import low_use_stoppage.constants as constants
-from low_use_stoppage.processor import LowUseStoppageProcessor
+from low_use_stoppage.processor import (
+    LowUseStoppageProcessor,
+    sql_trips_dow,
+    sql_trips_per_hour,
+    sql_trips_week_ago,
+    sql_total_trips_today,
+)
 from utilities import common_constants
 from utilities.db_utilities import engine
 from utilities.test_utilities import TestUtilities
 
+# The queries as they were before trip_counts, to check that the rollup gives the same answers.
+raw_sql_trips_dow = """
+WITH day_numbers AS (
+  SELECT generate_series( '{0}'::DATE - INTERVAL '4 WEEKS', '{0}'::DATE - INTERVAL '1 WEEK', '1 WEEK') as d
+),
+trip_data AS (
+  SELECT
+    dn.d AS day,
+    t.start_time - INTERVAL '{1} HOURS' AS trip_time,
+    p.id AS problem
+  FROM day_numbers dn
+  LEFT OUTER JOIN trips t on DATE(t.start_time - INTERVAL '{1} HOURS') = dn.d
+  LEFT OUTER JOIN problems p on DATE(p.started_at - INTERVAL '{1} HOURS') <= dn.d AND (DATE(p.ended_at - INTERVAL '{1} HOURS') >= dn.d OR p.ended_at IS NULL)
+),
+single_days AS (
+  SELECT
+    day,
+    COUNT(trip_time) AS trips,
+    CASE WHEN COUNT(trip_time) = 0 THEN 1 ELSE 0 END AS no_trip_flag,
+    CASE WHEN COUNT(problem) > 0 THEN 1 ELSE 0 END AS problem_flag,
+    CASE WHEN COUNT(problem) > 0 THEN NULL ELSE MIN(trip_time::time) END AS first_trip
+  FROM trip_data GROUP BY day ORDER BY day ASC
+)
+SELECT
+  COUNT(*) AS weeks,
+  SUM(no_trip_flag) AS days_without_trips,
+  SUM(problem_flag) AS days_with_shutdowns,
+  ROUND(MAX(trips),2) AS max_trips,
+  ROUND(AVG(trips),2) AS avg_trips,
+  MAX(first_trip) AS latest_first_trip,
+  MIN(first_trip) AS earliest_first_trip
+FROM single_days;
+"""
+
+raw_sql_trips_per_hour = """
+WITH hours AS (SELECT generate_series(0,23) AS hour),
+trip_count AS
+(
+  SELECT extract( hour FROM start_time) AS hour, 1 AS trip FROM trips WHERE start_time > NOW() - INTERVAL '28 DAYS'
+  UNION ALL
+  SELECT hour, 0 AS trip FROM hours
+)
+SELECT hour, SUM(trip) as trips FROM trip_count GROUP BY hour ORDER BY hour ASC;
+"""
+
+raw_sql_trips_week_ago = """
+SELECT COUNT(*) FROM trips
+  WHERE start_time > '{0}'::DATE - INTERVAL '7 DAYS'
+  AND start_time < '{0}'::DATE - INTERVAL '6 DAYS';
+"""
+
+raw_sql_total_trips_today = """
+SELECT COUNT(*) FROM trips WHERE start_time > '{0}';
+"""
+
 
 class TestLowUsageStoppage(unittest.TestCase):
     testutil = TestUtilities()
@@ -466,6 +530,59 @@ class TestLowUsageStoppage(unittest.TestCase):
         self.assertEqual(p.last_state, 0)
         p.infrequent_run()
         self.assertEqual(p.last_state, 0, "Low use shutdown processor didn't stop detecting shutdowns when accelerometer stopped")
+    def test_trip_counts_match_counting_trips(self):
+        rnd = random.Random(35)
+        now = datetime.now()
+        real_midnight = self._get_real_midnight()
+        for _ in range(600):
+            self.testutil.insert_trip(
+                starts_at=now - timedelta(seconds=rnd.randint(60, 30 * 24 * 3600))
+            )
+        # Trips right on the hour and at midnight are where the rollup and the partial hours meet.
+        for days in range(1, 30, 3):
+            self.testutil.insert_trip(starts_at=real_midnight - timedelta(days=days))
+            self.testutil.insert_trip(starts_at=real_midnight - timedelta(days=days, hours=-5))
+        self.testutil.insert_trip(
+            starts_at=now.replace(minute=0, second=0, microsecond=0) - timedelta(days=28)
+        )
+        with engine.connect() as con:
+            # Overlapping problems, each one joins the trips of the day again.
+            con.execute(
+                text(
+                    "INSERT INTO problems (started_at, ended_at, problem_type, problem_subtype, confidence) "
+                    "VALUES (:started_at, :ended_at, 'shutdown', 'testing', 99)"
+                ),
+                [
+                    {
+                        "started_at": real_midnight - timedelta(days=13, hours=2),
+                        "ended_at": real_midnight - timedelta(days=12, hours=20),
+                    },
+                    {
+                        "started_at": real_midnight - timedelta(days=14),
+                        "ended_at": None,
+                    },
+                ],
+            )
+            self.assertEqual(
+                con.execute(sql_trips_per_hour).fetchall(),
+                con.execute(raw_sql_trips_per_hour).fetchall(),
+            )
+            for midnight in (0, 3, 8, 23):
+                for days_ago in range(0, 7):
+                    start_of_today = real_midnight + timedelta(hours=midnight) - timedelta(days=days_ago)
+                    self.assertEqual(
+                        con.execute(sql_trips_dow.format(start_of_today, midnight)).fetchone(),
+                        con.execute(raw_sql_trips_dow.format(start_of_today, midnight)).fetchone(),
+                    )
+                    self.assertEqual(
+                        con.execute(sql_trips_week_ago.format(start_of_today)).scalar(),
+                        con.execute(raw_sql_trips_week_ago.format(start_of_today)).scalar(),
+                    )
+                    self.assertEqual(
+                        con.execute(sql_total_trips_today.format(start_of_today)).scalar(),
+                        con.execute(raw_sql_total_trips_today.format(start_of_today)).scalar(),
+                    )
+
 
 if __name__ == "__main__":
     unittest.main()
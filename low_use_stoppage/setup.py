@@ -7,14 +7,9 @@ with open('requirements.txt') as f:
 
 setup(name='liftai-lowusestoppage',
       version='0.0.1',
-      description=("LiftAi low use stoppage application",
+      description=("LiftAi low use stoppage detector, run by stoppagerunner",
                    "do the processing for detecting if a low usage elevator has stopped working")[0],
       packages=find_packages(),
-      entry_points={
-          'console_scripts': [
-              'lowusestoppage = low_use_stoppage.main:main',
-          ]
-      },
       install_requires=requirements,
       classifiers=(
           'Intended Audience :: Other Audience',
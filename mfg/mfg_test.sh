@@ -9,16 +9,13 @@ declare -a services=(
 "accelerometer"
 "altimeter"
 "audiorecorder"
-"bankstoppage"
 "datasender"
 "elevation"
 "elisha"
-"escalatorstoppage"
-"lowusestoppage"
 "reportgenerator"
 "pingcloud"
 "roawatch"
-"standalonestoppage"
+"stoppagerunner"
 "trips"
 "vibration"
 )
@@ -81,6 +81,11 @@ pushd ../notifications/; python3 ./setup.py install; popd
 if [ $1 = "trips" ]; then
   pushd ../vibration/; python3 ./setup.py install; popd
 fi
+if [ $1 = "stoppagerunner" ]; then
+  for app in bank_stoppage escalator_stoppage low_use_stoppage standalone_stoppage; do
+    pushd ../$app/; pip3 install -r ./requirements.txt; python3 ./setup.py install; popd
+  done
+fi
 
 echo "installing requirements for $1"
 pip3 install -r ./requirements.txt
@@ -75,7 +75,7 @@ echo "stopping all services..."
 sudo systemctl stop accelerometer.service
 sudo systemctl stop altimeter.service
 sudo systemctl stop audiorecorder.service
-sudo systemctl stop bankstoppage.service
+sudo systemctl stop stoppagerunner.service
 sudo systemctl stop datasender.service
 sudo systemctl stop elevation.service
 sudo systemctl stop reportgenerator.service
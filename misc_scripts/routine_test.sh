@@ -8,18 +8,15 @@ declare -a services=(
 "altimeter"
 "anomalydetector"
 "audiorecorder"
-"bankstoppage"
 "datasender"
 "elevation"
 "elisha"
-"escalatorstoppage"
 "floordetector"
 "gpio"
-"lowusestoppage"
 "reportgenerator"
 "pingcloud"
 "roawatch"
-"standalonestoppage"
+"stoppagerunner"
 "trips"
 "vibration"
 )
@@ -60,6 +57,7 @@ declare -a logfiles=("accelerometer"
                 "report_generator"
                 "roawatch"
                 "standalone_stoppage"
+                "stoppage_runner"
                 "trips"
                 "vibration"
                 )
@@ -6,6 +6,7 @@ from enum import Enum, unique
 
 import pytz
 
+from utilities import common_constants
 from utilities.db_utilities import session_scope, DataToSend, Trip
 from utilities.serial_number import SerialNumber
 
@@ -54,7 +55,12 @@ class Notification:
         topic_enum,
         notif_data=None,
         include_last_trip=False,
+        session=None,
     ):
+        """
+        Add the notification to data_to_send.  With a session it goes in with the caller's changes and is
+        only sent if they're committed, otherwise it's committed right away.
+        """
         timestamp = datetime.utcnow().replace(microsecond=0)
         notification_type = NotificationTopic.topic_to_string(topic_enum)
 
@@ -65,23 +71,31 @@ class Notification:
             **(notif_data or {}),
         }
 
+        if session is not None:
+            Notification._add(session, timestamp, payload, include_last_trip)
+            return
         with session_scope() as session:
-            if include_last_trip:
-                last_trip_info = Notification._get_last_trip_info(session)
-                if last_trip_info:
-                    payload.update(last_trip_info)
-
-            try:
-                notification_data = DataToSend(
-                    timestamp=timestamp,
-                    payload=payload,
-                    flag=False,
-                    resend=True,
-                )
-                DataToSend.track_event(session, notification_data)
-            except Exception as e:
-                print(e)
-                raise e  # Note: Do NOT send system notifications just because an exception happened!
+            Notification._add(session, timestamp, payload, include_last_trip)
+
+    @staticmethod
+    def _add(session, timestamp, payload, include_last_trip):
+        if include_last_trip:
+            last_trip_info = Notification._get_last_trip_info(session)
+            if last_trip_info:
+                payload.update(last_trip_info)
+
+        try:
+            notification_data = DataToSend(
+                timestamp=timestamp,
+                payload=payload,
+                flag=False,
+                resend=True,
+                priority=common_constants.DATA_PRIORITY_NOTIFICATION,
+            )
+            DataToSend.track_event(session, notification_data)
+        except Exception as e:
+            print(e)
+            raise e  # Note: Do NOT send system notifications just because an exception happened!
 
     @staticmethod
     def _get_last_trip_info(session):
@@ -29,7 +29,8 @@ class PingCloud:
             ping = DataToSend(
                 endpoint=endpoint,
                 payload=payload,
-                flag=False
+                flag=False,
+                priority=common_constants.DATA_PRIORITY_PING,
             )
             DataToSend.track_event(session, ping)
 
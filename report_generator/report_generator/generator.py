@@ -52,6 +52,7 @@ class RGenerator:
             payload=report_payload,
             flag=False,
             resend=True,
+            priority=common_constants.DATA_PRIORITY_REPORT,
         )
         DataToSend.track_event(session, event)
 
@@ -1,7 +1,10 @@
 TRIP_CHECK_LOOKBACK_MINUTES = 3         # When starting up, go back this many minutes to start checking for trips.
-SECONDS_BETWEEN_TRIP_CHECKS = 5
+SECONDS_BETWEEN_TRIP_CHECKS = 5         # Fallback, we normally wake up on trips_in_progress notifications.
 MINUTES_BEFORE_AUTO_SHUTOFF = 120
 MINUTES_BETWEEN_HEARTBEATS = 15         # How often to send out "We're still watching notifications"
 
 ROA_SUBTYPE_TRIP = 'trip'
-ROA_SUBTYPE_HEARTBEAT = 'heartbeat'
\ No newline at end of file
+ROA_SUBTYPE_HEARTBEAT = 'heartbeat'
+ROA_SUBTYPE_TRIP_STARTED = 'trip started'
+ROA_SUBTYPE_TRIP_STOPPED = 'trip stopped'
+ROA_SUBTYPE_TRIP_CANCELLED = 'trip cancelled'
\ No newline at end of file
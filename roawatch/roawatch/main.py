@@ -1,10 +1,11 @@
-from time import sleep
 import logging
 
 from roawatch.watcher import Watcher
 import roawatch.constants as roa_constants
 
+from utilities import common_constants
 from utilities.logging import create_rotating_log
+from utilities.db_listener import DatabaseListener
 from utilities.db_utilities import session_scope
 
 
@@ -16,6 +17,10 @@ def main():
     try:
         watcher = Watcher()
         roa_was_off = True
+        # Trips in progress and finished trips are both reported.
+        listener = DatabaseListener(
+            common_constants.TRIPS_IN_PROGRESS_CHANNEL, common_constants.TRIPS_CHANNEL
+        )
 
         while True:
             with session_scope() as session:
@@ -30,11 +35,12 @@ def main():
                     if roa_was_off:
                         watcher.reset(session)
                         roa_was_off = False
+                    watcher.check_for_trip_progress(session)
                     watcher.check_for_trips(session)
                 else:
                     roa_was_off = True
 
-            sleep(roa_constants.SECONDS_BETWEEN_TRIP_CHECKS)
+            listener.wait(roa_constants.SECONDS_BETWEEN_TRIP_CHECKS)
 
     except Exception as ex:
         logger.error("Exception: %s" % str(ex))
@@ -6,7 +6,10 @@ from pytz import utc
 
 from notifications.notifications import NotificationTopic
 from roawatch.watcher import Watcher
+import roawatch.constants as roa_constants
 from utilities import common_constants
+from utilities.db_listener import DatabaseListener
+from utilities.db_utilities import engine, TripInProgress
 from utilities.test_utilities import SessionTestCase, TestUtilities
 
 
@@ -195,6 +198,93 @@ class RoaWatchTest(SessionTestCase):
             },
         )
 
+    def _add_trip_in_progress(self, status, is_up=True):
+        now = datetime.now()
+        trip_in_progress = TripInProgress(
+            start_time=now - timedelta(seconds=4),
+            end_time=now,
+            is_up=is_up,
+            starting_elevation=100,
+            status=status,
+        )
+        self.session.add(trip_in_progress)
+        self.session.flush()
+        return trip_in_progress
+
+    @patch("roawatch.watcher.can_use_floor_data", return_value=False)
+    def test_trip_started_is_sent_once(self, can_use_floor_data):
+        self._add_trip_in_progress(common_constants.TRIP_IN_PROGRESS_STARTED)
+
+        self.watcher.check_for_trip_progress(self.session)
+        self.watcher.check_for_trip_progress(self.session)
+
+        self.watcher.n.send.assert_called_once_with(
+            NotificationTopic.ROA_EVENT,
+            notif_data={
+                "subtype": roa_constants.ROA_SUBTYPE_TRIP_STARTED,
+                "direction": "up",
+                "start_floor": None,
+            },
+        )
+
+    @patch("roawatch.watcher.can_use_floor_data", return_value=False)
+    def test_trip_progress_updates_are_sent(self, can_use_floor_data):
+        trip_in_progress = self._add_trip_in_progress(
+            common_constants.TRIP_IN_PROGRESS_STARTED, is_up=False
+        )
+        self.watcher.check_for_trip_progress(self.session)
+
+        trip_in_progress.status = common_constants.TRIP_IN_PROGRESS_STOPPED
+        self.session.flush()
+        self.watcher.check_for_trip_progress(self.session)
+        self.watcher.n.send.assert_called_with(
+            NotificationTopic.ROA_EVENT,
+            notif_data={
+                "subtype": roa_constants.ROA_SUBTYPE_TRIP_STOPPED,
+                "direction": "down",
+                "duration": 4,
+            },
+        )
+
+        # The completed trip is reported by check_for_trips instead.
+        trip_in_progress.status = common_constants.TRIP_IN_PROGRESS_COMPLETED
+        self.session.flush()
+        self.watcher.check_for_trip_progress(self.session)
+        self.assertEqual(self.watcher.n.send.call_count, 2)
+
+    def test_trip_cancelled_is_sent(self):
+        self._add_trip_in_progress(common_constants.TRIP_IN_PROGRESS_CANCELLED)
+        self.watcher.check_for_trip_progress(self.session)
+        self.watcher.n.send.assert_called_once_with(
+            NotificationTopic.ROA_EVENT,
+            notif_data={"subtype": roa_constants.ROA_SUBTYPE_TRIP_CANCELLED},
+        )
+
+    def test_reset_skips_earlier_trip_progress(self):
+        self._add_trip_in_progress(common_constants.TRIP_IN_PROGRESS_STARTED)
+        self.watcher.reset(self.session)
+        self.watcher.check_for_trip_progress(self.session)
+        self.watcher.n.send.assert_not_called()
+
+    def test_trip_progress_notification_wakes_listener(self):
+        listener = DatabaseListener(common_constants.TRIPS_IN_PROGRESS_CHANNEL)
+        try:
+            with engine.begin() as con:
+                con.execute(
+                    "INSERT INTO trips_in_progress (start_time, is_up, status) "
+                    "VALUES (NOW(), TRUE, '{0}')".format(
+                        common_constants.TRIP_IN_PROGRESS_STARTED
+                    )
+                )
+            before = datetime.now()
+            notified = listener.wait(10)
+            self.assertLess(datetime.now() - before, timedelta(seconds=1))
+            self.assertEqual(notified, {common_constants.TRIPS_IN_PROGRESS_CHANNEL})
+        finally:
+            listener.close()
+            with engine.begin() as con:
+                con.execute("DELETE FROM trips_in_progress")
+
 
 if __name__ == "__main__":
     unittest.main()
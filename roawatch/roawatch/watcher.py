@@ -11,7 +11,8 @@ from sqlalchemy.orm import load_only
 import roawatch.constants as roa_constants
 
 from notifications.notifications import Notification, NotificationTopic
-from utilities.db_utilities import get_landing_floor_for_trip, Trip
+from utilities import common_constants
+from utilities.db_utilities import get_landing_floor_for_trip, Trip, TripInProgress
 from utilities.func_utilities import pairwise
 from utilities.floor_detection import can_use_floor_data
 
@@ -24,6 +25,9 @@ class Watcher:
 
     def __init__(self):
         self.last_trip_id = -1
+        # Last trips_in_progress row and status that we sent out
+        self.last_trip_in_progress_id = -1
+        self.last_trip_in_progress_status = None
         self.starting_time = datetime.now()
         self._advance_heartbeat_expiration_time()
 
@@ -36,6 +40,74 @@ class Watcher:
         if trip:
             self.last_trip_id = trip.id
 
+        # Don't announce movement that happened before we started watching.
+        trip_in_progress = (
+            session.query(TripInProgress).order_by(TripInProgress.id.desc()).first()
+        )
+        if trip_in_progress:
+            self.last_trip_in_progress_id = trip_in_progress.id
+            self.last_trip_in_progress_status = trip_in_progress.status
+
+    def check_for_trip_progress(self, session):
+        """
+        Send live movement notifications from the trips_in_progress table, the trips app
+        publishes these as soon as the altimeter sees the car start and stop moving.
+
+        Completed trips are left to check_for_trips, which has the floors and duration.
+        """
+        trips_in_progress = (
+            session.query(TripInProgress)
+            .filter(TripInProgress.id >= self.last_trip_in_progress_id)
+            .order_by(TripInProgress.id)
+            .all()
+        )
+
+        for trip_in_progress in trips_in_progress:
+            if (
+                trip_in_progress.id == self.last_trip_in_progress_id
+                and trip_in_progress.status == self.last_trip_in_progress_status
+            ):
+                continue
+
+            self.last_trip_in_progress_id = trip_in_progress.id
+            self.last_trip_in_progress_status = trip_in_progress.status
+            notif_data = self._get_trip_progress_notif_data(session, trip_in_progress)
+            if notif_data is None:
+                continue
+
+            self._advance_heartbeat_expiration_time()
+            self.n.send(NotificationTopic.ROA_EVENT, notif_data=notif_data)
+
+    @staticmethod
+    def _get_trip_progress_notif_data(session, trip_in_progress):
+        direction = "up" if trip_in_progress.is_up else "down"
+
+        if trip_in_progress.status == common_constants.TRIP_IN_PROGRESS_STARTED:
+            last_trip = session.query(Trip).order_by(Trip.id.desc()).first()
+            start_floor = (
+                get_landing_floor_for_trip(session, last_trip)
+                if last_trip and can_use_floor_data(session)
+                else None
+            )
+            return {
+                "subtype": roa_constants.ROA_SUBTYPE_TRIP_STARTED,
+                "direction": direction,
+                "start_floor": start_floor,
+            }
+
+        if trip_in_progress.status == common_constants.TRIP_IN_PROGRESS_STOPPED:
+            duration = trip_in_progress.end_time - trip_in_progress.start_time
+            return {
+                "subtype": roa_constants.ROA_SUBTYPE_TRIP_STOPPED,
+                "direction": direction,
+                "duration": duration.seconds,
+            }
+
+        if trip_in_progress.status == common_constants.TRIP_IN_PROGRESS_CANCELLED:
+            return {"subtype": roa_constants.ROA_SUBTYPE_TRIP_CANCELLED}
+
+        return None
+
     def check_for_trips(self, session):
         """
         Check for trips looks for trips that have happened since the watcher started
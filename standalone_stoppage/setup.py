@@ -7,15 +7,10 @@ with open('requirements.txt') as f:
 
 setup(name='liftai-standalonestoppage',
       version='0.0.1',
-      description=("LiftAi standalone stoppage application",
+      description=("LiftAi standalone stoppage detector, run by stoppagerunner",
                    "do the processing for detecting if a elevator has stopped"
                    "working")[0],
       packages=find_packages(),
-      entry_points={
-          'console_scripts': [
-              'standalonestoppage = standalone_stoppage.main:main',
-          ]
-      },
       install_requires=requirements,
       classifiers=(
           'Intended Audience :: Other Audience',
@@ -0,0 +1,130 @@
+import logging
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from sqlalchemy.sql import text
+
+from utilities.stoppage_processor import StoppageState
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+WEEK = timedelta(days=7)
+
+logger = logging.getLogger(__name__)
+
+
+def _to_micros(dt):
+    # Whole microseconds, like Postgres timestamps, so comparisons are exact.
+    return (dt.replace(tzinfo=None) - EPOCH) // ONE_MICROSECOND
+
+
+class WeeklyActivityModel:
+    """
+    Trip start times and 99% stoppages kept in memory, to compare the time since the last trip
+    with the same stretch of time in earlier weeks.
+
+    Trips are loaded once and then only the ones with a new id are read.  The whole history is
+    read again if trips were deleted other than by truncating the oldest ones.
+    """
+
+    def __init__(self):
+        self.trips = array("q")  # sorted start times in microseconds
+        self.max_trip_id = None
+        self.stoppages = []  # (started_at, ended_at) in microseconds
+
+    def update(self, con):
+        if self.max_trip_id is None:
+            self._load_trips(con)
+        else:
+            self._add_new_trips(con)
+        self.stoppages = [
+            (_to_micros(row["started_at"]), _to_micros(row["ended_at"]))
+            for row in con.execute(
+                "SELECT started_at, ended_at FROM problems "
+                "WHERE confidence >= {0} AND started_at IS NOT NULL AND ended_at IS NOT NULL".format(
+                    StoppageState.STOPPED_C99
+                )
+            )
+        ]
+
+    def _load_trips(self, con):
+        self.max_trip_id = con.execute("SELECT COALESCE(MAX(id), 0) FROM trips").scalar()
+        self.trips = array(
+            "q",
+            (
+                _to_micros(row[0])
+                for row in con.execute(
+                    text(
+                        "SELECT start_time FROM trips "
+                        "WHERE id <= :max_id AND start_time IS NOT NULL ORDER BY start_time"
+                    ),
+                    max_id=self.max_trip_id,
+                )
+            ),
+        )
+        logger.debug("Loaded {0} trips into the weekly activity model".format(len(self.trips)))
+
+    def _add_new_trips(self, con):
+        rows = con.execute(
+            text("SELECT id, start_time FROM trips WHERE id > :max_id ORDER BY id"),
+            max_id=self.max_trip_id,
+        ).fetchall()
+        for row in rows:
+            self.max_trip_id = row["id"]
+            if row["start_time"] is not None:
+                insort(self.trips, _to_micros(row["start_time"]))
+
+        # The truncator deletes the oldest trips, anything else means starting over.
+        first_trip = con.execute("SELECT MIN(start_time) FROM trips").scalar()
+        if first_trip is None:
+            del self.trips[:]
+        else:
+            del self.trips[: bisect_left(self.trips, _to_micros(first_trip))]
+        trip_count = con.execute("SELECT COALESCE(SUM(trips), 0) FROM trip_counts").scalar()
+        if trip_count != len(self.trips):
+            logger.debug(
+                "{0} trips in the database and {1} in the weekly activity model, reloading".format(
+                    trip_count, len(self.trips)
+                )
+            )
+            self._load_trips(con)
+
+    def _count_trips(self, start, end):
+        return bisect_left(self.trips, end) - bisect_left(self.trips, start)
+
+    def _during_stoppage(self, start, end):
+        return any(end > started_at and start < ended_at for started_at, ended_at in self.stoppages)
+
+    def evaluate(self, now, max_samples):
+        """
+        Go back a week at a time from now and count the trips in a stretch as long as the time since
+        the last trip.  Stretches can't overlap, when the last trip was over a week ago some weeks
+        are skipped.  Stretches during a 99% stoppage don't count.
+
+        Returns the number of stretches (at most max_samples) and the fewest trips in any of them.
+        """
+        if not self.trips:
+            return {"n": 0, "prev_trips": 0}
+        now = _to_micros(now)
+        first_trip = self.trips[0]
+        last_trip = self.trips[-1]
+        length = now - (last_trip + 1000000)
+        weeks_of_history = round(((now - first_trip) // 86400000000) / 7)
+        week = WEEK // ONE_MICROSECOND
+
+        trip_counts = []
+        previous_start = None
+        for weeks_ago in range(0, weeks_of_history + 1):
+            if len(trip_counts) >= max_samples:
+                break
+            end = now - weeks_ago * week
+            start = end - length
+            if start <= first_trip:
+                break
+            if previous_start is not None and end >= previous_start:
+                continue
+            previous_start = start
+            if start < last_trip and not self._during_stoppage(start, end):
+                trip_counts.append(self._count_trips(start, end))
+        return {"n": len(trip_counts), "prev_trips": min(trip_counts) if trip_counts else 0}
@@ -3,41 +3,9 @@ import logging
 from datetime import datetime
 
 import standalone_stoppage.constants as constants
+from standalone_stoppage.activity_model import WeeklyActivityModel
 from utilities.stoppage_processor import StoppageState, StoppageProcessor, common_constants
 
-sql_statement = """
-WITH RECURSIVE intervals_all AS -- Get the intervals (weeks) (could be overlapped)
-(
-SELECT e.end_time - (now() - (SELECT coalesce(max(start_time) + INTERVAL '1 second', to_timestamp(0)) FROM trips)) as start_time,
-       e.end_time
-FROM (
-SELECT generate_series(now() - INTERVAL '7 days' * (select (EXTRACT(days FROM now()-min(start_time))/7)::int from trips),
-                       now(), INTERVAL '7 days')::timestamp as end_time
-) as e
-WHERE e.end_time - (now() - (SELECT coalesce(max(start_time) + INTERVAL '1 second', to_timestamp(0)) FROM trips)) >
-      (SELECT coalesce(min(start_time), to_timestamp(0)) from trips)
-)
-, intervals(start_time, end_time) AS -- Remove overlapping intervals
-(
-    (SELECT * FROM intervals_all order by end_time desc limit 1)
-    UNION
-    (SELECT i.* FROM intervals_all i, intervals i2 WHERE i.end_time<i2.start_time ORDER BY i.end_time desc limit 1)
-)
-
-SELECT count(*) n, coalesce(min(trips), 0) prev_trips
-FROM (
-    SELECT i.start_time, i.end_time, count(t.start_time) trips -- Count the number of trips on each interval
-    FROM intervals i LEFT JOIN trips t ON (t.start_time>=i.start_time and t.start_time<i.end_time)
-    WHERE NOT EXISTS ( -- Remove intervals that overlapps with stoppages periods
-        SELECT 1 FROM problems p where i.end_time>p.started_at and i.start_time<p.ended_at AND p.confidence >= 99
-    )
-    AND i.start_time<(SELECT coalesce(max(start_time), to_timestamp(0)) FROM trips)
-    GROUP BY i.start_time, i.end_time
-    ORDER by i.start_time DESC LIMIT {0}
-) t;
-"""
-
-
 logger = logging.getLogger(__name__)
 
 
@@ -48,13 +16,19 @@ class StandaloneStoppageProcessor(StoppageProcessor):
 
     def __init__(self):
         super().__init__(logger)
+        self.activity_model = WeeklyActivityModel()
 
     def run(self):
         with self.engine.connect() as con:
             if self._is_accelerometer_working(con):
-                r = con.execute(sql_statement.format(constants.MAX_SAMPLES)).fetchone()
+                self.activity_model.update(con)
+                if self.snapshot is not None:
+                    now = self.snapshot.now
+                else:
+                    now = con.execute("SELECT LOCALTIMESTAMP").scalar()
+                r = self.activity_model.evaluate(now, constants.MAX_SAMPLES)
 
-                if r is None:
+                if r['n'] == 0:
                     logger.debug("No prior weeks' data, not detecting shutdowns.")
                     return
                 if r['n'] < constants.MIN_SAMPLES:
@@ -64,9 +38,13 @@ class StandaloneStoppageProcessor(StoppageProcessor):
 
                 # If we're leaving the OK state, save the last trip that happened.
                 if r['prev_trips'] >= self.confidence_values['90'] and self.last_state == StoppageState.OK:
-                    last_trip = con.execute("SELECT t.end_time FROM trips AS t ORDER BY t.end_time DESC LIMIT 1").fetchone()
-                    if last_trip is not None:
-                        self._set_last_trip(last_trip['end_time'])
+                    if self.snapshot is not None:
+                        last_trip_end = self.snapshot.last_trip_end
+                    else:
+                        last_trip = con.execute("SELECT t.end_time FROM trips AS t ORDER BY t.end_time DESC LIMIT 1").fetchone()
+                        last_trip_end = last_trip['end_time'] if last_trip is not None else None
+                    if last_trip_end is not None:
+                        self._set_last_trip(last_trip_end)
                     else:
                         logger.error("We detected a shutdown and there are no previous trips in the database")
                         self._set_last_trip(datetime.now())
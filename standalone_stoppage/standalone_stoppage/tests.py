@@ -3,16 +3,51 @@ from datetime import datetime, timedelta
 from unittest.mock import Mock
 import json
 import os
+import random
 import unittest
 
 from sqlalchemy import text
 
+from standalone_stoppage.activity_model import WeeklyActivityModel
 from standalone_stoppage.processor import StandaloneStoppageProcessor
 from utilities import common_constants
 from utilities.db_utilities import engine
 from utilities.stoppage_processor import StoppageState
 from utilities.test_utilities import TestUtilities
 
+# How the processor used to find the weekly intervals and count their trips, all in the database.
+sql_statement = """
+WITH RECURSIVE intervals_all AS -- Get the intervals (weeks) (could be overlapped)
+(
+SELECT e.end_time - (now() - (SELECT coalesce(max(start_time) + INTERVAL '1 second', to_timestamp(0)) FROM trips)) as start_time,
+       e.end_time
+FROM (
+SELECT generate_series(now() - INTERVAL '7 days' * (select (EXTRACT(days FROM now()-min(start_time))/7)::int from trips),
+                       now(), INTERVAL '7 days')::timestamp as end_time
+) as e
+WHERE e.end_time - (now() - (SELECT coalesce(max(start_time) + INTERVAL '1 second', to_timestamp(0)) FROM trips)) >
+      (SELECT coalesce(min(start_time), to_timestamp(0)) from trips)
+)
+, intervals(start_time, end_time) AS -- Remove overlapping intervals
+(
+    (SELECT * FROM intervals_all order by end_time desc limit 1)
+    UNION
+    (SELECT i.* FROM intervals_all i, intervals i2 WHERE i.end_time<i2.start_time ORDER BY i.end_time desc limit 1)
+)
+
+SELECT count(*) n, coalesce(min(trips), 0) prev_trips
+FROM (
+    SELECT i.start_time, i.end_time, count(t.start_time) trips -- Count the number of trips on each interval
+    FROM intervals i LEFT JOIN trips t ON (t.start_time>=i.start_time and t.start_time<i.end_time)
+    WHERE NOT EXISTS ( -- Remove intervals that overlapps with stoppages periods
+        SELECT 1 FROM problems p where i.end_time>p.started_at and i.start_time<p.ended_at AND p.confidence >= 99
+    )
+    AND i.start_time<(SELECT coalesce(max(start_time), to_timestamp(0)) FROM trips)
+    GROUP BY i.start_time, i.end_time
+    ORDER by i.start_time DESC LIMIT {0}
+) t;
+"""
+
 
 class TestStandaloneStoppage(unittest.TestCase):
     testutil = TestUtilities()
@@ -134,6 +169,66 @@ class TestStandaloneStoppage(unittest.TestCase):
         proc = self._get_instance(is_accel_running=False)
         proc.run()
         self.assertEqual(proc.last_state, 0, "standalone shutdown code didn't detect that accelerometer isn't working")
+    def _assert_model_matches_sql(self, model):
+        with engine.connect() as con:
+            # now() and LOCALTIMESTAMP stay the same for the whole transaction.
+            with con.begin():
+                model.update(con)
+                now = con.execute("SELECT LOCALTIMESTAMP").scalar()
+                for max_samples in (1, 5, 20):
+                    expected = con.execute(sql_statement.format(max_samples)).fetchone()
+                    self.assertEqual(
+                        model.evaluate(now, max_samples),
+                        {"n": expected["n"], "prev_trips": expected["prev_trips"]},
+                        "{0} samples".format(max_samples),
+                    )
+
+    def _delete_stoppages(self):
+        with engine.connect() as con:
+            con.execute("DELETE FROM problems WHERE problem_subtype = 'testing'")
+
+    def _insert_stoppage(self, started_at, ended_at, confidence=99):
+        # These are older than the problems _delete_data() cleans up.
+        self.addCleanup(self._delete_stoppages)
+        with engine.connect() as con:
+            con.execute(
+                text(
+                    "INSERT INTO problems (started_at, ended_at, problem_type, problem_subtype, confidence) "
+                    "VALUES (:started_at, :ended_at, 'shutdown', 'testing', :confidence)"
+                ),
+                started_at=started_at,
+                ended_at=ended_at,
+                confidence=confidence,
+            )
+
+    def test_activity_model_matches_the_sql(self):
+        rnd = random.Random(36)
+        model = WeeklyActivityModel()
+        self._assert_model_matches_sql(model)
+        self.testutil.insert_weekly_trips_and_last_trip(weeks=6, trips=60, include_last_trip=True)
+        self._assert_model_matches_sql(model)
+        for _ in range(200):
+            self.testutil.insert_trip(
+                starts_at=self.start_time - timedelta(seconds=rnd.randint(3 * 3600, 50 * 24 * 3600))
+            )
+        self._assert_model_matches_sql(model)
+        self._insert_stoppage(self.start_time - timedelta(days=15), self.start_time - timedelta(days=13))
+        self._insert_stoppage(self.start_time - timedelta(days=22), self.start_time - timedelta(days=21), 95)
+        self._insert_stoppage(self.start_time - timedelta(days=29), None)
+        self._assert_model_matches_sql(model)
+        # Deleted trips mean the model has to start over.
+        self._delete_trips_events_and_problems()
+        self.testutil.insert_weekly_trips_and_last_trip(weeks=3, trips=10, include_last_trip=False)
+        self._assert_model_matches_sql(model)
+
+    def test_activity_model_after_a_long_stoppage(self):
+        # More than a week without trips, so some of the weeks overlap and get skipped.
+        for weeks in range(2, 12):
+            for i in range(weeks * 3):
+                self.testutil.insert_trip(
+                    starts_at=self.start_time - timedelta(weeks=weeks, days=3, minutes=i)
+                )
+        self._assert_model_matches_sql(WeeklyActivityModel())
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,19 @@
+#!/usr/bin/env bash
+
+PATH=$PATH:/usr/local/bin
+parent_path=$( cd "$(dirname "${BASH_SOURCE[0]}")" ; pwd -P )
+cd "$parent_path"
+
+if ../misc_scripts/deploy_application.sh stoppagerunner liftai_stoppagerunner stoppage_runner; then
+  # The stoppage detectors used to be services of their own, they run inside stoppagerunner now.
+  for s in bankstoppage escalatorstoppage lowusestoppage standalonestoppage; do
+    sudo systemctl stop $s.service
+    sudo systemctl disable $s.service
+    sudo rm -f /etc/systemd/system/$s.service
+  done
+  sudo systemctl daemon-reload
+  sudo -u postgres psql -d liftaidb -a -f ../bank_stoppage/post_install.sql
+  sudo -u postgres psql -d liftaidb -a -f ../standalone_stoppage/post_install.sql
+else
+  echo "not running SQL post_install because deployment failed"
+fi
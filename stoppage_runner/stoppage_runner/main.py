@@ -0,0 +1,60 @@
+import logging
+
+from bank_stoppage import constants as bank_constants
+from bank_stoppage.processor import BankStoppageProcessor
+from escalator_stoppage import constants as escalator_constants
+from escalator_stoppage.processor import EscalatorStoppageProcessor
+from low_use_stoppage import constants as low_use_constants
+from low_use_stoppage.processor import LowUseStoppageProcessor
+from standalone_stoppage import constants as standalone_constants
+from standalone_stoppage.processor import StandaloneStoppageProcessor
+from utilities import common_constants, device_configuration
+from utilities.db_listener import DatabaseListener
+from utilities.logging import create_rotating_log
+from utilities.stoppage_processor import LastTripTracker, StoppageProcessor
+from utilities.stoppage_scheduler import StoppageScheduler
+
+
+def create_scheduler(logger, elevator, escalator):
+    scheduler = StoppageScheduler(logger)
+    if elevator:
+        bank = BankStoppageProcessor()
+        scheduler.add(bank, bank_constants.PROCESSING_SLEEP_INTERVAL)
+
+        low_use = LowUseStoppageProcessor()
+        scheduler.add(low_use, low_use_constants.PROCESSING_SLEEP_INTERVAL,
+                      run=low_use.frequent_run, name="low_use_stoppage frequent")
+        scheduler.add(low_use,
+                      low_use_constants.PROCESSING_SLEEP_INTERVAL * low_use_constants.INFREQUENT_RUN_COUNT,
+                      run=low_use.infrequent_run, name="low_use_stoppage infrequent")
+
+        standalone = StandaloneStoppageProcessor()
+        scheduler.add(standalone, standalone_constants.PROCESSING_SLEEP_INTERVAL)
+    if escalator:
+        scheduler.add(EscalatorStoppageProcessor(), escalator_constants.PROCESSING_SLEEP_SECONDS)
+    return scheduler
+
+
+def main():
+    logging.basicConfig(level=logging.DEBUG)
+    logger = create_rotating_log("stoppage_runner")
+    # Each detector keeps logging to the same file it did when it was a service of its own.
+    for name in ("bank_stoppage", "escalator_stoppage", "low_use_stoppage", "standalone_stoppage"):
+        create_rotating_log(name)
+    logger.debug("--- Starting stoppage runner app")
+
+    elevator = device_configuration.DeviceConfiguration.is_elevator(logger)
+    escalator = device_configuration.DeviceConfiguration.is_escalator(logger)
+
+    try:
+        # The last trip is only read again after the trips table changes.
+        StoppageProcessor.last_trip_tracker = LastTripTracker(DatabaseListener(common_constants.TRIPS_CHANNEL))
+        scheduler = create_scheduler(logger, elevator, escalator)
+        scheduler.run_forever()
+
+    except Exception as e:
+        logger.exception("Exception in stoppage runner: {0}".format(str(e)))
+
+
+if __name__ == "__main__":
+    main()
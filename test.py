@@ -29,6 +29,7 @@ from elisha.tests_anomaly import *
 from elisha.shutdown_tests import *
 from elisha.notif_tests import *
 from floor_detector.tests import *
+from floor_detector.tests_simulation import *
 from gpio.tests import *
 from low_use_stoppage.tests import *
 from ping_cloud.tests import *
@@ -37,6 +38,7 @@ from standalone_stoppage.tests import *
 from utilities.tests import *
 from roawatch.tests import *
 from trips.tests import *
+from trips.tests_benchmark import *
 
 
 logging.disable(logging.CRITICAL)
@@ -10,9 +10,11 @@ setup(name='liftai-trips',
       description=("LiftAi Trip Detection application",
                    "read accelerometer data and determine what trips were made")[0],
       packages=find_packages(),
+      package_data={'trips.benchmark': ['baselines.json']},
       entry_points={
           'console_scripts': [
               'trips = trips.main:main',
+              'tripsbenchmark = trips.benchmark.runner:main',
           ]
       },
       install_requires=requirements,
@@ -0,0 +1,7 @@
+"""
+Performance regression suite for trip detection.
+
+Synthetic elevator traces are fed straight into TripProcessor so that row intake, altimeter
+detection, acceleration boundary search, vibration analysis and persistence can be timed
+without needing a real sensor.  Run it with `python -m trips.benchmark` or `tripsbenchmark`.
+"""
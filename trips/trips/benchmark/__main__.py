@@ -0,0 +1,6 @@
+import sys
+
+from trips.benchmark.runner import main
+
+
+sys.exit(main())
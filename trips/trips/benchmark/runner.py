@@ -0,0 +1,350 @@
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+from sqlalchemy import text
+
+import trips.constants as constants
+from trips.trip_processor import TripProcessor
+from trips.benchmark.traces import SCENARIOS
+
+
+logger = logging.getLogger(__name__)
+
+BASELINES_FILE = os.path.join(os.path.dirname(__file__), "baselines.json")
+# Allowed slowdown (or memory growth) relative to the stored baseline before we flag it.
+DEFAULT_TOLERANCE = 0.25
+# Same as the LIMIT in trip_processor.sensor_fetch_sql
+ROWS_PER_BATCH = 2000
+
+# Tables written by the trip processor, cleaned up after a run against the database.
+PERSISTED_TABLES = ("trips", "accelerations", "events", "trips_in_progress")
+
+# Metric name -> True if bigger is better
+BASELINE_METRICS = {
+    "rows_per_sec": True,
+    "trip_latency_p95_ms": False,
+    "peak_rss_kb": False,
+}
+
+
+class BenchmarkTripProcessor(TripProcessor):
+    """
+    TripProcessor that reads its rows from a synthetic trace and times the hot paths.
+
+    With persist=False nothing touches the database, trips and accelerations are only counted.
+    """
+
+    def __init__(self, session, rows, work_dir, persist=False):
+        super().__init__(session)
+        self.rows = rows
+        self.row_position = 0
+        self.persist = persist
+        self.last_timestamp = rows[0].timestamp
+        # Never overwrite the real service's state or chart files.
+        self.last_timestamp_path = os.path.join(work_dir, "trips_last_timestamp.pkl")
+        self.chart_file_path = os.path.join(work_dir, constants.CSV_FILE_NAME)
+
+        self.timings = defaultdict(float)
+        self.trip_latencies = []
+        self.saved_trips = 0
+        self.missed_trips = 0
+        self._accel_id = 0
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def has_more_rows(self):
+        return self.row_position < len(self.rows)
+
+    def _get_next_batch_of_data(self):
+        batch = self.rows[self.row_position:self.row_position + ROWS_PER_BATCH]
+        self.row_position += len(batch)
+        return batch
+
+    def _process_altim_row(self, row):
+        with self._timed("altimeter_detection"):
+            return super()._process_altim_row(row)
+
+    def _process_accel_row(self, row):
+        with self._timed("accel_intake"):
+            return super()._process_accel_row(row)
+
+    def _process_accel_data(self):
+        with self._timed("trip_bracketing"):
+            return super()._process_accel_data()
+
+    def _find_acceleration_start_and_end(self, buffer, window_start, window_end, accel_total):
+        with self._timed("boundary_search"):
+            return TripProcessor._find_acceleration_start_and_end(
+                buffer, window_start, window_end, accel_total
+            )
+
+    def _get_vibration_for_sample_interval(self, lst, col, start_index, end_index):
+        with self._timed("psd"):
+            return TripProcessor._get_vibration_for_sample_interval(
+                lst, col, start_index, end_index
+            )
+
+    def _get_peak2peak_vibration(self, start_index, end_index):
+        with self._timed("p2p"):
+            return super()._get_peak2peak_vibration(start_index, end_index)
+
+    def _get_jerk(self, start_index, end_index):
+        with self._timed("jerk"):
+            return super()._get_jerk(start_index, end_index)
+
+    def _process_and_save_trip_data(self, trip_data):
+        start = time.perf_counter()
+        super()._process_and_save_trip_data(trip_data)
+        self.trip_latencies.append(time.perf_counter() - start)
+
+    def _save_acceleration(self, start_time, end_time, is_start, is_positive, vibration):
+        with self._timed("persistence"):
+            if self.persist:
+                return super()._save_acceleration(
+                    start_time, end_time, is_start, is_positive, vibration
+                )
+            self._accel_id += 1
+            return self._accel_id
+
+    def _save_trip(self, *args):
+        with self._timed("persistence"):
+            if self.persist:
+                super()._save_trip(*args)
+            self.saved_trips += 1
+
+    def _record_missed_trip(self, elevation_change, trip_start):
+        with self._timed("persistence"):
+            if self.persist:
+                super()._record_missed_trip(elevation_change, trip_start)
+            if abs(elevation_change) >= constants.MIN_TRIP_ELEVATION:
+                self.missed_trips += 1
+
+    def _publish_trip_in_progress(self, action):
+        with self._timed("persistence"):
+            if self.persist:
+                super()._publish_trip_in_progress(action)
+
+    def _update_trip_in_progress(self, status, **kwargs):
+        with self._timed("persistence"):
+            if self.persist:
+                super()._update_trip_in_progress(status, **kwargs)
+
+    def _save_last_timestamp(self):
+        with self._timed("persistence"):
+            super()._save_last_timestamp()
+
+    def _write_out_chart_data(self, chart_data):
+        with self._timed("persistence"):
+            with open(self.chart_file_path, "w", newline="") as f:
+                writer = csv.writer(f, quoting=csv.QUOTE_NONE)
+                for result_row in chart_data:
+                    writer.writerow(result_row)
+
+
+def _get_max_ids(session):
+    return {
+        table: session.execute(
+            text("SELECT COALESCE(MAX(id), 0) FROM {0}".format(table))
+        ).scalar()
+        for table in PERSISTED_TABLES
+    }
+
+
+def _delete_rows_after(session, max_ids):
+    for table, max_id in max_ids.items():
+        session.execute(
+            text("DELETE FROM {0} WHERE id > :max_id".format(table)), {"max_id": max_id}
+        )
+    session.commit()
+
+
+def _drive(tp):
+    start = time.perf_counter()
+    while tp.has_more_rows():
+        tp.look_for_trips()
+    return time.perf_counter() - start
+
+
+def run_scenario(name, seed=1000, persist=False):
+    """
+    Run one scenario and return its metrics as a plain dict.
+    """
+    builder = SCENARIOS[name](seed)
+    rows = builder.rows
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if persist:
+            from utilities.db_utilities import session_scope
+
+            with session_scope() as session:
+                max_ids = _get_max_ids(session)
+                tp = BenchmarkTripProcessor(session, rows, work_dir, persist=True)
+                try:
+                    elapsed = _drive(tp)
+                finally:
+                    session.rollback()
+                    _delete_rows_after(session, max_ids)
+        else:
+            tp = BenchmarkTripProcessor(None, rows, work_dir)
+            elapsed = _drive(tp)
+
+    latencies_ms = [t * 1000.0 for t in tp.trip_latencies] or [0.0]
+    return {
+        "scenario": name,
+        "rows": len(rows),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(len(rows) / elapsed, 1),
+        "expected_trips": builder.expected_trips,
+        "detected_trips": tp.saved_trips,
+        "missed_trips": tp.missed_trips,
+        "dropped_accel_samples": builder.dropped_accel_samples,
+        "trip_latency_mean_ms": round(float(np.mean(latencies_ms)), 2),
+        "trip_latency_p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "trip_latency_max_ms": round(max(latencies_ms), 2),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "hot_paths_ms": {k: round(v * 1000.0, 1) for k, v in sorted(tp.timings.items())},
+    }
+
+
+def run_scenario_isolated(name, seed=1000, persist=False):
+    """
+    Run the scenario in a fresh child process so peak RSS isn't polluted by earlier scenarios.
+    """
+    with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+        return pool.apply(run_scenario, (name, seed, persist))
+
+
+def compare_to_baseline(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns a list of human readable regressions, empty if the result is within tolerance.
+    """
+    regressions = []
+    if result["detected_trips"] < result["expected_trips"]:
+        regressions.append(
+            "{0}: detected {1} of {2} trips".format(
+                result["scenario"], result["detected_trips"], result["expected_trips"]
+            )
+        )
+
+    for metric, bigger_is_better in BASELINE_METRICS.items():
+        if metric not in baseline or not baseline[metric]:
+            continue
+        expected = baseline[metric]
+        actual = result[metric]
+        if bigger_is_better:
+            regressed = actual < expected * (1 - tolerance)
+        else:
+            regressed = actual > expected * (1 + tolerance)
+        if regressed:
+            regressions.append(
+                "{0}: {1} is {2}, baseline is {3}".format(
+                    result["scenario"], metric, actual, expected
+                )
+            )
+    return regressions
+
+
+def load_baselines(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_baselines(path, results):
+    baselines = load_baselines(path)
+    for result in results:
+        baselines[result["scenario"]] = {
+            metric: result[metric] for metric in BASELINE_METRICS
+        }
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def print_result(result):
+    print(
+        "{scenario:>14}: {rows} rows in {seconds} s = {rows_per_sec} rows/s, "
+        "trips {detected_trips}/{expected_trips} (missed {missed_trips}), "
+        "trip latency mean {trip_latency_mean_ms} ms p95 {trip_latency_p95_ms} ms "
+        "max {trip_latency_max_ms} ms, peak RSS {peak_rss_kb} kB".format(**result)
+    )
+    print(
+        "{0:>14}  {1}".format(
+            "",
+            ", ".join(
+                "{0} {1} ms".format(k, v) for k, v in result["hot_paths_ms"].items()
+            ),
+        )
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trip detection performance benchmark")
+    parser.add_argument(
+        "-s",
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS.keys()),
+        help="scenario to run, can be repeated (default: all)",
+    )
+    parser.add_argument("--seed", type=int, default=1000)
+    parser.add_argument(
+        "--db",
+        action="store_true",
+        help="persist trips to the configured database (rows are deleted afterwards)",
+    )
+    parser.add_argument("--baselines", default=BASELINES_FILE)
+    parser.add_argument(
+        "--update-baselines",
+        action="store_true",
+        help="store this run as the new baseline instead of comparing against it",
+    )
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    # Debug logging inside the hot paths would dominate the measurements.
+    logging.basicConfig(level=logging.WARNING)
+
+    results = []
+    for name in args.scenario or SCENARIOS.keys():
+        result = run_scenario_isolated(name, seed=args.seed, persist=args.db)
+        print_result(result)
+        results.append(result)
+
+    if args.update_baselines:
+        save_baselines(args.baselines, results)
+        print("Baselines written to {0}".format(args.baselines))
+        return 0
+
+    baselines = load_baselines(args.baselines)
+    regressions = []
+    for result in results:
+        regressions.extend(
+            compare_to_baseline(result, baselines.get(result["scenario"], {}), args.tolerance)
+        )
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
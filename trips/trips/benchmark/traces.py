@@ -0,0 +1,199 @@
+import random
+from collections import namedtuple, OrderedDict
+from datetime import datetime, timedelta
+
+import trips.constants as constants
+from trips.trip_processor import TripProcessor
+
+
+# Same columns as the rows returned by trip_processor.sensor_fetch_sql
+SensorData = namedtuple(
+    "SensorData", ["timestamp", "x_data", "y_data", "z_data", "altitude_x16"]
+)
+
+ACCEL_SAMPLES_PER_ALTIM_SAMPLE = int(
+    constants.ALTIM_SAMPLE_PERIOD / constants.ACCEL_SAMPLE_PERIOD
+)
+ACCEL_SAMPLES_PER_SEC = int(constants.MILLISEC_PER_SEC / constants.ACCEL_SAMPLE_PERIOD)
+
+# The altimeter reports altitude in 1/16 meter units.
+ALTIM_COUNTS_PER_FOOT = 16 * 0.3048
+
+DEFAULT_ACCEL_NOISE = 20.0  # Raw accelerometer units, uniform noise
+DEFAULT_ALTIM_NOISE = 0.35  # Altimeter counts, gaussian noise before rounding
+
+
+class TraceBuilder:
+    """
+    Builds an interleaved accelerometer/altimeter trace one segment at a time.
+
+    Everything runs on the accelerometer clock; an altimeter sample is emitted every
+    ACCEL_SAMPLES_PER_ALTIM_SAMPLE accelerometer samples, ahead of the accel sample with
+    the same timestamp.  The random generator is seeded so traces are reproducible.
+    """
+
+    def __init__(
+        self,
+        seed=1000,
+        start_time=None,
+        starting_altitude=4000.0,
+        accel_noise=DEFAULT_ACCEL_NOISE,
+        altim_noise=DEFAULT_ALTIM_NOISE,
+    ):
+        self.random = random.Random(seed)
+        self.timestamp = start_time or (datetime.now() - timedelta(hours=1))
+        self.altitude = starting_altitude
+        self.accel_noise = accel_noise
+        self.altim_noise = altim_noise
+        self.rows = []
+        self.expected_trips = 0
+        self.dropped_accel_samples = 0
+        self._sample_counter = 0
+        self._accel_samples_to_drop = 0
+
+    def _accel_noise(self):
+        return (self.random.random() - 0.5) * 2.0 * self.accel_noise
+
+    def _add_sample(self, z_accel, altitude_change):
+        if self._sample_counter % ACCEL_SAMPLES_PER_ALTIM_SAMPLE == 0:
+            altitude = self.altitude + self.random.gauss(0.0, self.altim_noise)
+            self.rows.append(
+                SensorData(self.timestamp, None, None, None, int(round(altitude)))
+            )
+
+        if self._accel_samples_to_drop > 0:
+            # The accelerometer FIFO overflowed, so these samples never make it to the database.
+            self._accel_samples_to_drop -= 1
+            self.dropped_accel_samples += 1
+        else:
+            self.rows.append(
+                SensorData(
+                    self.timestamp,
+                    float(self._accel_noise()),
+                    float(self._accel_noise()),
+                    float(z_accel + self._accel_noise()),
+                    None,
+                )
+            )
+
+        self.altitude += altitude_change
+        self._sample_counter += 1
+        self.timestamp += timedelta(milliseconds=constants.ACCEL_SAMPLE_PERIOD)
+
+    @staticmethod
+    def _trapezoid(ramp_samples, hold_samples):
+        """
+        Unit height acceleration profile: linear jerk up, constant acceleration, linear jerk down.
+        """
+        ramp = [(i + 1) / (ramp_samples + 1) for i in range(ramp_samples)]
+        return ramp + [1.0] * hold_samples + list(reversed(ramp))
+
+    def idle(self, seconds):
+        for _ in range(int(seconds * ACCEL_SAMPLES_PER_SEC)):
+            self._add_sample(0.0, 0.0)
+        return self
+
+    def fifo_gap(self, seconds):
+        """
+        Drop the next `seconds` worth of accelerometer samples, the altimeter keeps running.
+        """
+        self._accel_samples_to_drop += int(seconds * ACCEL_SAMPLES_PER_SEC)
+        return self
+
+    def move(self, direction, speed_fpm, coast_seconds, ramp_seconds=0.3, hold_seconds=0.4):
+        """
+        Move the car with a trapezoidal starting acceleration, a coast at contract speed
+        and a mirrored trapezoidal deceleration.  The altimeter follows the integrated velocity.
+        """
+        profile = self._trapezoid(
+            int(ramp_seconds * ACCEL_SAMPLES_PER_SEC),
+            int(hold_seconds * ACCEL_SAMPLES_PER_SEC),
+        )
+        profile_area = sum(profile)
+        peak_accel = TripProcessor._convert_to_sum_of_raw_accel(speed_fpm) / profile_area
+        altim_counts_per_sample = (
+            speed_fpm * ALTIM_COUNTS_PER_FOOT / 60.0 / ACCEL_SAMPLES_PER_SEC
+        )
+        coast = [0.0] * int(coast_seconds * ACCEL_SAMPLES_PER_SEC)
+        unit_accel = profile + coast + [-a for a in profile]
+
+        velocity = 0.0
+        for a in unit_accel:
+            velocity += a / profile_area
+            self._add_sample(
+                direction * peak_accel * a,
+                direction * altim_counts_per_sample * velocity,
+            )
+        return self
+
+    def trip(self, direction, speed_fpm, coast_seconds, **kwargs):
+        self.expected_trips += 1
+        return self.move(direction, speed_fpm, coast_seconds, **kwargs)
+
+    def relevel(self, direction):
+        """
+        A short, slow correction after the car stopped slightly off the landing, never a trip.
+        """
+        return self.move(direction, 15, 0.2, ramp_seconds=0.1, hold_seconds=0.1)
+
+
+def single_trips(seed):
+    builder = TraceBuilder(seed=seed).idle(10)
+    for i in range(20):
+        builder.trip(
+            1 if i % 2 == 0 else -1,
+            builder.random.choice((150, 200, 300, 400)),
+            builder.random.uniform(2.0, 8.0),
+        )
+        builder.idle(10)
+    return builder
+
+
+def back_to_back(seed):
+    # The dwell has to stay above TRIP_END_COUNT_THRESH samples, see trips/constants.py
+    builder = TraceBuilder(seed=seed).idle(5)
+    for i in range(30):
+        builder.trip(
+            builder.random.choice((1, -1)),
+            builder.random.choice((200, 350, 500)),
+            builder.random.uniform(1.5, 4.0),
+        )
+        builder.idle(4)
+    return builder
+
+
+def releveling(seed):
+    builder = TraceBuilder(seed=seed).idle(10)
+    for i in range(15):
+        direction = 1 if i % 2 == 0 else -1
+        builder.trip(direction, 200, builder.random.uniform(2.0, 6.0))
+        builder.idle(1.5)
+        builder.relevel(-direction)
+        builder.idle(8)
+    return builder
+
+
+def fifo_gaps(seed):
+    builder = TraceBuilder(seed=seed).idle(10)
+    for i in range(15):
+        builder.trip(1 if i % 2 == 0 else -1, 250, 3.0)
+        builder.idle(4)
+        builder.fifo_gap(builder.random.uniform(0.2, 1.5))
+        builder.idle(6)
+    return builder
+
+
+def idle_day(seed):
+    # Ten minutes of a parked car, this is the row intake cost when nothing happens.
+    return TraceBuilder(seed=seed).idle(600)
+
+
+SCENARIOS = OrderedDict(
+    [
+        ("single_trips", single_trips),
+        ("back_to_back", back_to_back),
+        ("releveling", releveling),
+        ("fifo_gaps", fifo_gaps),
+        ("idle", idle_day),
+    ]
+)
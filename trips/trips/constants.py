@@ -1,6 +1,9 @@
 # Constants used by the trips and floors module.
 
-BATCH_PROCESSING_SLEEP_INTERVAL = 2
+# Between batches of sensor data.  A trip in progress is published by the batch that sees it start or stop,
+# so these bound how late live views hear about it.
+BATCH_PROCESSING_SLEEP_INTERVAL = 1
+TRIP_IN_PROGRESS_SLEEP_INTERVAL = 0.25   # One altimeter sample, while the altimeter sees the car moving
 
 MPS_TO_FPM_CONVERSION = 196.85
 GRAVITY_MPS2 = 9.81
@@ -1,6 +1,5 @@
 import logging
 import time
-import trips.constants as constants
 import trips.trip_processor as trip_processor
 
 from utilities.logging import create_rotating_log
@@ -22,7 +21,7 @@ def main():
                 if elevator:
                     tp.look_for_trips()
                     session.commit()
-                time.sleep(constants.BATCH_PROCESSING_SLEEP_INTERVAL)
+                time.sleep(tp.seconds_to_next_batch())
     except Exception as e:
         logger.exception("General exception in trips main()" + str(e))
 
@@ -10,7 +10,13 @@ from sqlalchemy.sql import text
 
 from utilities import common_constants
 from utilities import test_utilities
-from utilities.db_utilities import session_scope, engine, Trip, Acceleration
+from utilities.db_utilities import (
+    session_scope,
+    engine,
+    Trip,
+    Acceleration,
+    TripInProgress,
+)
 from trips.trip_processor import (
     AccelSample,
     AltimDetectedEnd,
@@ -47,6 +53,7 @@ class TripsTests(unittest.TestCase):
             "DELETE FROM accelerometer_data; "
             "DELETE FROM altimeter_data;"
             "DELETE FROM events;"
+            "DELETE FROM trips_in_progress;"
         )
 
     def setUp(self):
@@ -661,6 +668,77 @@ class TripsTests(unittest.TestCase):
         max_noise_level = max_noise_level or 20.0
         return (random.random() - 0.5) * 2.0 * max_noise_level
 
+    @patch("utilities.db_utilities.Audio.get_noise_for_time_period")
+    def test_trip_in_progress_published_and_completed(self, get_noise_for_time_period):
+        get_noise_for_time_period.return_value = 1.0
+        with session_scope() as session:
+            tp = TripProcessor(session)
+            start_time = datetime.now() - timedelta(seconds=10)
+            tp.process_action(
+                AltimDetectedStart(
+                    direction=1, start_timestamp=start_time, starting_elevation=100
+                )
+            )
+            trip_in_progress = session.query(TripInProgress).one()
+            self.assertEqual(
+                trip_in_progress.status, common_constants.TRIP_IN_PROGRESS_STARTED
+            )
+            self.assertTrue(trip_in_progress.is_up)
+            self.assertEqual(trip_in_progress.starting_elevation, 100)
+
+            tp.process_action(
+                AltimDetectedEnd(end_timestamp=datetime.now(), ending_elevation=150)
+            )
+            session.refresh(trip_in_progress)
+            self.assertEqual(
+                trip_in_progress.status, common_constants.TRIP_IN_PROGRESS_STOPPED
+            )
+            self.assertEqual(trip_in_progress.ending_elevation, 150)
+
+            with patch.object(TripProcessor, "_process_and_save_trip_data"):
+                tp.process_action(TripData(ANY, ANY, ANY, ANY, ANY))
+            session.refresh(trip_in_progress)
+            self.assertEqual(
+                trip_in_progress.status, common_constants.TRIP_IN_PROGRESS_COMPLETED
+            )
+            self.assertIsNone(tp.trip_in_progress_id)
+
+    def test_trip_in_progress_cancelled_on_altimeter_reset(self):
+        with session_scope() as session:
+            tp = TripProcessor(session)
+            tp.process_action(
+                AltimDetectedStart(
+                    direction=-1,
+                    start_timestamp=datetime.now(),
+                    starting_elevation=100,
+                )
+            )
+            tp.process_action(AltimeterReset())
+            trip_in_progress = session.query(TripInProgress).one()
+            self.assertFalse(trip_in_progress.is_up)
+            self.assertEqual(
+                trip_in_progress.status, common_constants.TRIP_IN_PROGRESS_CANCELLED
+            )
+
+    def test_next_batch_is_sooner_during_a_trip(self):
+        with session_scope() as session:
+            tp = TripProcessor(session)
+            self.assertEqual(
+                tp.seconds_to_next_batch(), constants.BATCH_PROCESSING_SLEEP_INTERVAL
+            )
+            tp.process_action(
+                AltimDetectedStart(
+                    direction=1, start_timestamp=datetime.now(), starting_elevation=100
+                )
+            )
+            self.assertEqual(
+                tp.seconds_to_next_batch(), constants.TRIP_IN_PROGRESS_SLEEP_INTERVAL
+            )
+            tp.process_action(AltimeterReset())
+            self.assertEqual(
+                tp.seconds_to_next_batch(), constants.BATCH_PROCESSING_SLEEP_INTERVAL
+            )
+
     def test_speed_conversion(self):
         raw_accel = TripProcessor._convert_to_sum_of_raw_accel(300.0)
         self.assertGreater(raw_accel, 2000)
@@ -0,0 +1,68 @@
+import unittest
+
+import trips.constants as constants
+from trips.benchmark.traces import SCENARIOS, TraceBuilder
+from trips.benchmark.runner import compare_to_baseline, run_scenario
+
+
+class TripBenchmarkTests(unittest.TestCase):
+    def test_traces_are_reproducible(self):
+        # Timestamps are relative to now, only the sensor values have to match.
+        first = [row[1:] for row in SCENARIOS["back_to_back"](42).rows]
+        second = [row[1:] for row in SCENARIOS["back_to_back"](42).rows]
+        self.assertTrue(first == second)
+
+    def test_trace_timestamps_never_go_backwards(self):
+        rows = SCENARIOS["fifo_gaps"](1000).rows
+        for previous, current in zip(rows, rows[1:]):
+            self.assertLessEqual(previous.timestamp, current.timestamp)
+
+    def test_fifo_gap_drops_accel_but_not_altimeter_samples(self):
+        builder = TraceBuilder().idle(1).fifo_gap(0.5).idle(1)
+        accel_rows = [r for r in builder.rows if r.altitude_x16 is None]
+        altim_rows = [r for r in builder.rows if r.altitude_x16 is not None]
+        self.assertEqual(builder.dropped_accel_samples, 50)
+        self.assertEqual(len(accel_rows), 150)
+        self.assertEqual(
+            len(altim_rows),
+            int(2 * constants.MILLISEC_PER_SEC / constants.ALTIM_SAMPLE_PERIOD),
+        )
+
+    def test_trip_elevation_change_follows_direction(self):
+        builder = TraceBuilder(altim_noise=0.0).idle(1).trip(-1, 300, 3.0).idle(1)
+        altitudes = [r.altitude_x16 for r in builder.rows if r.altitude_x16 is not None]
+        self.assertLess(altitudes[-1] - altitudes[0], -constants.MIN_TRIP_ELEVATION)
+
+    def test_all_trips_detected_without_database(self):
+        result = run_scenario("releveling")
+        self.assertEqual(result["detected_trips"], result["expected_trips"])
+        self.assertEqual(result["missed_trips"], 0)
+        self.assertGreater(result["rows_per_sec"], 0)
+        self.assertIn("boundary_search", result["hot_paths_ms"])
+        self.assertIn("psd", result["hot_paths_ms"])
+
+    def test_compare_to_baseline(self):
+        result = {
+            "scenario": "single_trips",
+            "expected_trips": 20,
+            "detected_trips": 20,
+            "rows_per_sec": 1000.0,
+            "trip_latency_p95_ms": 100.0,
+            "peak_rss_kb": 100000,
+        }
+        baseline = {
+            "rows_per_sec": 1100.0,
+            "trip_latency_p95_ms": 95.0,
+            "peak_rss_kb": 100000,
+        }
+        self.assertEqual(compare_to_baseline(result, baseline, tolerance=0.25), [])
+
+        result["rows_per_sec"] = 500.0
+        result["trip_latency_p95_ms"] = 200.0
+        result["detected_trips"] = 19
+        regressions = compare_to_baseline(result, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
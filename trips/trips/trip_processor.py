@@ -14,10 +14,11 @@ from scipy import stats
 import numpy as np
 from scipy.signal import welch
 from sqlalchemy import text
+from sqlalchemy.sql import func
 
 import trips.constants as constants
 import utilities.common_constants as common_constants
-from utilities.db_utilities import Acceleration, Trip
+from utilities.db_utilities import Acceleration, Trip, TripInProgress
 
 
 # We need X values for the linear regression, so we just use 1, 2, 3, 4...
@@ -115,6 +116,8 @@ class TripProcessor:
     altim_trip_start_timestamp = None
     altim_trip_end_timestamp = None
     save_point_counter = None
+    # Row in trips_in_progress for the trip currently being detected, if any.
+    trip_in_progress_id = None
     # END MARK: State Variables
 
     last_timestamp_path = None
@@ -138,6 +141,7 @@ class TripProcessor:
         self.altim_trip_start_timestamp = None
         self.altim_trip_end_timestamp = None
         self.save_point_counter = 0
+        self.trip_in_progress_id = None
         self.last_timestamp = self._get_last_timestamp_processed(
             self.last_timestamp_path
         )
@@ -303,6 +307,12 @@ class TripProcessor:
         self.session.execute(text(query), params)
         self.session.commit()
 
+    def seconds_to_next_batch(self):
+        if self.altim_detected_trip_in_progress:
+            # Catch the end of the trip as soon as the altimeter does.
+            return constants.TRIP_IN_PROGRESS_SLEEP_INTERVAL
+        return constants.BATCH_PROCESSING_SLEEP_INTERVAL
+
     def look_for_trips(self):
         batch_of_data = self._get_next_batch_of_data()
 
@@ -318,6 +328,9 @@ class TripProcessor:
                 self.process_action(self._process_row(row))
             except TripBoundsNotFoundException as e:
                 logger.error(e)
+                self._update_trip_in_progress(
+                    common_constants.TRIP_IN_PROGRESS_CANCELLED
+                )
                 # This seems confusing but all it means is we want to retry the row if the exception occurs
                 # It will not except again on a second call because of resetting of state of the trip_end_detected
                 self.process_action(self._process_row(row))
@@ -352,6 +365,7 @@ class TripProcessor:
                 self.trip_direction = action.direction
                 self.altim_trip_start_timestamp = action.start_timestamp
                 self.trip_starting_elevation = action.starting_elevation
+                self._publish_trip_in_progress(action)
 
             elif isinstance(action, AltimDetectedEnd):
                 self.altim_detected_trip_in_progress = False
@@ -380,9 +394,18 @@ class TripProcessor:
                 # ...and wait roughtly this many samples beyond the trip.
                 self.extra_accel_samples_needed_count = constants.TRIP_END_COUNT_THRESH
                 self.trip_ending_elevation = action.ending_elevation
+                self._update_trip_in_progress(
+                    common_constants.TRIP_IN_PROGRESS_STOPPED,
+                    end_time=action.end_timestamp,
+                    ending_elevation=action.ending_elevation,
+                    is_up=bool(self.trip_direction == 1),
+                )
 
             elif isinstance(action, AltimeterReset):
                 self.altim_detected_trip_in_progress = False
+                self._update_trip_in_progress(
+                    common_constants.TRIP_IN_PROGRESS_CANCELLED
+                )
 
             elif isinstance(action, InsufficientAccelSamples):
                 if self.extra_accel_samples_needed_count > 0:
@@ -397,6 +420,9 @@ class TripProcessor:
 
             elif isinstance(action, TripData):
                 self._process_and_save_trip_data(action)
+                self._update_trip_in_progress(
+                    common_constants.TRIP_IN_PROGRESS_COMPLETED
+                )
 
                 # Remove the old trip and start capturing the next one.
                 self.result_data = []
@@ -406,6 +432,53 @@ class TripProcessor:
 
             elif isinstance(action, RecordMissedTrip):
                 self._record_missed_trip(action.elevation_change, action.trip_start)
+                self._update_trip_in_progress(
+                    common_constants.TRIP_IN_PROGRESS_CANCELLED
+                )
+
+    def _publish_trip_in_progress(self, action):
+        """
+        Let live views know the car is moving as soon as the altimeter sees it, the trip itself
+        can't be saved until the accelerometer data after the end of the trip has arrived.
+        """
+        # Anything still open was left behind by a restart in the middle of a trip.
+        self.session.query(TripInProgress).filter(
+            TripInProgress.status.in_(
+                (
+                    common_constants.TRIP_IN_PROGRESS_STARTED,
+                    common_constants.TRIP_IN_PROGRESS_STOPPED,
+                )
+            )
+        ).update(
+            {
+                TripInProgress.status: common_constants.TRIP_IN_PROGRESS_CANCELLED,
+                TripInProgress.updated_at: func.now(),
+            },
+            synchronize_session=False,
+        )
+        trip_in_progress = TripInProgress(
+            start_time=action.start_timestamp,
+            is_up=bool(action.direction == 1),
+            starting_elevation=action.starting_elevation,
+            status=common_constants.TRIP_IN_PROGRESS_STARTED,
+        )
+        self.session.add(trip_in_progress)
+        self.session.commit()
+        self.trip_in_progress_id = trip_in_progress.id
+
+    def _update_trip_in_progress(self, status, **kwargs):
+        if self.trip_in_progress_id is None:
+            return
+
+        values = {"status": status, "updated_at": func.now()}
+        values.update(kwargs)
+        self.session.query(TripInProgress).filter(
+            TripInProgress.id == self.trip_in_progress_id
+        ).update(values, synchronize_session=False)
+        self.session.commit()
+
+        if status != common_constants.TRIP_IN_PROGRESS_STOPPED:
+            self.trip_in_progress_id = None
 
     def _get_next_batch_of_data(self):
         return self.session.execute(
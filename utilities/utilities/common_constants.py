@@ -11,6 +11,10 @@ DSN = 'dbname=liftaidb user=usr password=pass host=127.0.0.1'
 REPORT_ENDPOINT = 'devices/track'
 PING_ENDPOINT = 'devices/ping'
 NOTIFICATION_ENDPOINT = 'devices/notification'
+# data_to_send priorities, lower goes first.  Reports are the default for rows that don't say.
+DATA_PRIORITY_NOTIFICATION = 0
+DATA_PRIORITY_REPORT = 1
+DATA_PRIORITY_PING = 2
 STORAGE_FOLDER = os.environ.get("LIFTAI_STORAGE_FOLDER", "/home/pi/liftai_storage")
 CRON_FILE = "/var/spool/cron/crontabs/pi"
 
@@ -133,4 +137,24 @@ AUDIO_FFT = "fft"
 TRIP_VIBRATION_SCHEMA = 2
 ACCEL_VIBRATION_SCHEMA = 2
 
+# Lifecycle of a trips_in_progress row.  Stopped means the altimeter saw the end of the trip but the
+# accelerometer data hasn't been processed yet.  Completed rows have a matching row in the trips table.
+TRIP_IN_PROGRESS_STARTED = 'started'
+TRIP_IN_PROGRESS_STOPPED = 'stopped'
+TRIP_IN_PROGRESS_COMPLETED = 'completed'
+TRIP_IN_PROGRESS_CANCELLED = 'cancelled'
+# Postgres NOTIFY channel used by the trips_in_progress trigger
+TRIPS_IN_PROGRESS_CHANNEL = 'trips_in_progress'
+# Postgres NOTIFY channels for changes to trips, new events and new or changed problems
+TRIPS_CHANNEL = 'trips'
+EVENTS_CHANNEL = 'events'
+PROBLEMS_CHANNEL = 'problems'
+# Postgres NOTIFY channel for new rows in data_to_send
+DATA_TO_SEND_CHANNEL = 'watchers'
+
+# Sensor data tables, their names are also the sensor names in the sensor_heartbeats table
+ACCELEROMETER_DATA_TABLE = 'accelerometer_data'
+ALTIMETER_DATA_TABLE = 'altimeter_data'
+SENSOR_DATA_TABLES = (ACCELEROMETER_DATA_TABLE, ALTIMETER_DATA_TABLE)
+
 ACCELEROMETER_SAMPLING_PERIOD = 10      # Units of milliseconds
\ No newline at end of file
@@ -0,0 +1,65 @@
+import logging
+import select
+
+import psycopg2
+import psycopg2.extensions
+
+from utilities.db_utilities import engine
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseListener:
+    """
+    A connection that LISTENs on Postgres NOTIFY channels, so an app can sleep until a trigger
+    announces new rows instead of waking up on a fixed interval to look for them.
+
+    The notifications only wake us up, the tables have the details.  The timeout is still
+    there as a fallback in case a notification is missed.
+    """
+
+    def __init__(self, *channels):
+        self.channels = channels
+        self.connection = None
+        self._connect()
+
+    def _connect(self):
+        pooled_connection = engine.raw_connection()
+        # This connection stays in LISTEN mode for good, so it can't go back into the pool.
+        pooled_connection.detach()
+        self.connection = pooled_connection.connection
+        self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.connection.cursor() as cursor:
+            for channel in self.channels:
+                cursor.execute("LISTEN {0};".format(channel))
+
+    def _take_notifications(self):
+        notified = set(n.channel for n in self.connection.notifies)
+        del self.connection.notifies[:]
+        return notified
+
+    def wait(self, timeout):
+        """
+        Block until one of the channels is notified or the timeout expires.
+        Returns the channels that were notified, an empty set on a timeout.
+        """
+        try:
+            # Notifications that arrived while the caller was busy don't need a wait.
+            self.connection.poll()
+            notified = self._take_notifications()
+            if not notified and select.select([self.connection], [], [], timeout) != ([], [], []):
+                self.connection.poll()
+                notified = self._take_notifications()
+            return notified
+        except psycopg2.Error as ex:
+            logger.error("Lost the connection listening on {0}, reconnecting: {1}".format(self.channels, ex))
+            self.close()
+            self._connect()
+            # We can't tell what we missed, so act like everything changed.
+            return set(self.channels)
+
+    def close(self):
+        try:
+            self.connection.close()
+        except psycopg2.Error:
+            pass
@@ -4,23 +4,30 @@ from datetime import datetime, timedelta
 import pytz
 from sqlalchemy import (
     ARRAY,
+    BigInteger,
     Boolean,
+    cast,
     create_engine,
     Column,
+    DateTime,
     Integer,
     Numeric,
     Float,
     String,
+    literal_column,
+    select,
+    SmallInteger,
     types,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
 from sqlalchemy.dialects.postgresql.json import JSON, JSONB
-from sqlalchemy.orm import sessionmaker, load_only
+from sqlalchemy.orm import column_property, sessionmaker, load_only
 from sqlalchemy.sql import func
 
 from utilities import common_constants
+from utilities.floor_index import FloorIndex
 
 
 engine = create_engine(common_constants.DB_CONNECTION)
@@ -230,6 +237,35 @@ class Trip(Base):
         )
 
 
+class TripInProgress(Base):
+    __tablename__ = "trips_in_progress"
+
+    id = Column(Integer, primary_key=True)
+    start_time = Column(UTCDateTime)
+    end_time = Column(UTCDateTime)
+    is_up = Column(Boolean)
+    starting_elevation = Column(Integer)
+    ending_elevation = Column(Integer)
+    status = Column(String)
+    updated_at = Column(UTCDateTime, server_default=func.now())
+
+
+class Floor(Base):
+    __tablename__ = "floors"
+
+    floor_map_id = Column(Integer, primary_key=True)
+    floor_id = Column(String, primary_key=True)
+    schema_version = Column(Integer)
+    elevation = Column(Integer)
+    landing_num = Column(Integer)
+    cumulative_err = Column(Integer)
+    last_updated = Column(DateTime)
+
+
+def _json_key(key):
+    return literal_column("'{0}'".format(key))
+
+
 class FloorMap(Base):
     __tablename__ = "floor_maps"
 
@@ -237,7 +273,51 @@ class FloorMap(Base):
     start_time = Column(UTCDateTime)
     last_update = Column(UTCDateTime)
     last_elevation = Column(Integer)
-    floors = Column(JSONB)
+    # Floors used to live in this column, maps that still do are read from it.
+    legacy_floors = Column("floors", JSONB)
+    # The rows of the floors table in the same JSON format, see floor_maps_json.
+    floor_rows = column_property(
+        select(
+            [
+                func.jsonb_object_agg(
+                    Floor.floor_id,
+                    func.jsonb_build_object(
+                        _json_key(common_constants.FLOORS_JSON_SCHEMA),
+                        Floor.schema_version,
+                        _json_key(common_constants.FLOORS_JSON_ELEVATION),
+                        Floor.elevation,
+                        _json_key(common_constants.FLOORS_JSON_LANDING_NUM),
+                        Floor.landing_num,
+                        _json_key(common_constants.FLOORS_JSON_CUMULATIVE_ERR),
+                        Floor.cumulative_err,
+                        _json_key(common_constants.FLOORS_JSON_LAST_UPDATED),
+                        func.to_char(
+                            Floor.last_updated, 'YYYY-MM-DD"T"HH24:MI:SS.US'
+                        ),
+                    ),
+                )
+            ]
+        )
+        .where(Floor.floor_map_id == id)
+        .correlate_except(Floor)
+        .as_scalar()
+    )
+
+    @hybrid_property
+    def floors(self):
+        if self.floor_rows is not None:
+            return self.floor_rows
+        return self.legacy_floors if self.legacy_floors is not None else {}
+
+    @floors.setter
+    def floors(self, value):
+        self.legacy_floors = value
+
+    @floors.expression
+    def floors(cls):
+        return func.coalesce(
+            cls.floor_rows, cls.legacy_floors, cast("{}", JSONB)
+        ).label("floors")
 
     @classmethod
     def get_lastest_map(cls, session, columns=None):
@@ -271,12 +351,12 @@ def get_landing_floor_for_trip(session, trip):
     if floor_map is None:
         return None
 
-    floor_data = floor_map.floors.get(trip.ending_floor, None)
+    landing_number = FloorIndex(floor_map.floors).landing_number(trip.ending_floor)
 
     return (
-        floor_data[common_constants.FLOORS_JSON_LANDING_NUM]
+        landing_number
         + common_constants.FLOORS_USER_TRANSLATION  # convert from 0 to 1 based numbering
-        if floor_data
+        if landing_number is not None
         else None
     )
 
@@ -291,6 +371,7 @@ class DataToSend(Base):
     flag = Column(Boolean)
     resend = Column(Boolean)
     success = Column(Boolean)
+    priority = Column(SmallInteger, default=common_constants.DATA_PRIORITY_REPORT)
 
     @classmethod
     def track_event(cls, session, event):
@@ -326,3 +407,291 @@ class AltimeterData(Base):
     altitude_x16 = Column(Integer)
     temperature = Column(DOUBLE_PRECISION)
     average_alt = Column(DOUBLE_PRECISION)
+
+
+altimeter_minutes_from_altimeter_data = """
+SELECT
+  date_trunc('minute', timestamp),
+  COUNT(altitude_x16),
+  MIN(altitude_x16),
+  MAX(altitude_x16),
+  COALESCE(SUM(altitude_x16), 0),
+  MIN(timestamp),
+  (array_agg(altitude_x16 ORDER BY timestamp ASC))[1],
+  MAX(timestamp),
+  (array_agg(altitude_x16 ORDER BY timestamp DESC))[1],
+  MIN(temperature),
+  MAX(temperature),
+  COALESCE(SUM(temperature), 0),
+  COUNT(temperature)
+FROM altimeter_data
+"""
+
+
+def _least(a, b):
+    # Like LEAST() in SQL, None is ignored.
+    return b if a is None else min(a, b)
+
+
+def _greatest(a, b):
+    return b if a is None else max(a, b)
+
+
+class AltimeterMinute(Base):
+    """
+    Per minute rollup of altimeter_data.  The altimeter writer updates it with every
+    sample and it's kept for weeks, long after the raw samples are truncated.
+    """
+
+    __tablename__ = "altimeter_minutes"
+
+    minute = Column(DateTime, primary_key=True)
+    samples = Column(Integer)  # Samples with an altitude
+    min_altitude = Column(Integer)
+    max_altitude = Column(Integer)
+    sum_altitude = Column(BigInteger)
+    first_timestamp = Column(DateTime)
+    first_altitude = Column(Integer)
+    last_timestamp = Column(DateTime)
+    last_altitude = Column(Integer)
+    min_temperature = Column(DOUBLE_PRECISION)
+    max_temperature = Column(DOUBLE_PRECISION)
+    sum_temperature = Column(DOUBLE_PRECISION)
+    temperature_samples = Column(Integer)
+
+    @property
+    def mean_altitude(self):
+        return self.sum_altitude / self.samples if self.samples else None
+
+    @property
+    def mean_temperature(self):
+        return (
+            self.sum_temperature / self.temperature_samples
+            if self.temperature_samples
+            else None
+        )
+
+    @classmethod
+    def record(cls, session, records):
+        """
+        Add altimeter_data records to the rollup of the minutes they fall in.
+        """
+        minutes = {}
+        for record in records:
+            timestamp = record.timestamp.replace(tzinfo=None)
+            altitude = record.altitude_x16
+            temperature = record.temperature
+            minute = minutes.setdefault(
+                timestamp.replace(second=0, microsecond=0),
+                {
+                    "samples": 0,
+                    "min_altitude": None,
+                    "max_altitude": None,
+                    "sum_altitude": 0,
+                    "first_timestamp": timestamp,
+                    "first_altitude": altitude,
+                    "last_timestamp": timestamp,
+                    "last_altitude": altitude,
+                    "min_temperature": None,
+                    "max_temperature": None,
+                    "sum_temperature": 0.0,
+                    "temperature_samples": 0,
+                },
+            )
+            if timestamp < minute["first_timestamp"]:
+                minute["first_timestamp"] = timestamp
+                minute["first_altitude"] = altitude
+            if timestamp >= minute["last_timestamp"]:
+                minute["last_timestamp"] = timestamp
+                minute["last_altitude"] = altitude
+            if altitude is not None:
+                minute["samples"] += 1
+                minute["sum_altitude"] += altitude
+                minute["min_altitude"] = _least(minute["min_altitude"], altitude)
+                minute["max_altitude"] = _greatest(minute["max_altitude"], altitude)
+            if temperature is not None:
+                minute["temperature_samples"] += 1
+                minute["sum_temperature"] += temperature
+                minute["min_temperature"] = _least(minute["min_temperature"], temperature)
+                minute["max_temperature"] = _greatest(minute["max_temperature"], temperature)
+        if not minutes:
+            return
+        # Every expression on the right hand side sees the row as it was before the update.
+        session.execute(
+            "INSERT INTO altimeter_minutes (minute, samples, min_altitude, max_altitude, "
+            "sum_altitude, first_timestamp, first_altitude, last_timestamp, last_altitude, "
+            "min_temperature, max_temperature, sum_temperature, temperature_samples) "
+            "VALUES (:minute, :samples, :min_altitude, :max_altitude, :sum_altitude, "
+            ":first_timestamp, :first_altitude, :last_timestamp, :last_altitude, "
+            ":min_temperature, :max_temperature, :sum_temperature, :temperature_samples) "
+            "ON CONFLICT (minute) DO UPDATE SET "
+            "samples = altimeter_minutes.samples + EXCLUDED.samples, "
+            "min_altitude = LEAST(altimeter_minutes.min_altitude, EXCLUDED.min_altitude), "
+            "max_altitude = GREATEST(altimeter_minutes.max_altitude, EXCLUDED.max_altitude), "
+            "sum_altitude = altimeter_minutes.sum_altitude + EXCLUDED.sum_altitude, "
+            "first_timestamp = LEAST(altimeter_minutes.first_timestamp, EXCLUDED.first_timestamp), "
+            "first_altitude = CASE WHEN EXCLUDED.first_timestamp < altimeter_minutes.first_timestamp "
+            "THEN EXCLUDED.first_altitude ELSE altimeter_minutes.first_altitude END, "
+            "last_timestamp = GREATEST(altimeter_minutes.last_timestamp, EXCLUDED.last_timestamp), "
+            "last_altitude = CASE WHEN EXCLUDED.last_timestamp >= altimeter_minutes.last_timestamp "
+            "THEN EXCLUDED.last_altitude ELSE altimeter_minutes.last_altitude END, "
+            "min_temperature = LEAST(altimeter_minutes.min_temperature, EXCLUDED.min_temperature), "
+            "max_temperature = GREATEST(altimeter_minutes.max_temperature, EXCLUDED.max_temperature), "
+            "sum_temperature = altimeter_minutes.sum_temperature + EXCLUDED.sum_temperature, "
+            "temperature_samples = altimeter_minutes.temperature_samples + EXCLUDED.temperature_samples",
+            [dict(values, minute=minute) for minute, values in minutes.items()],
+        )
+
+    @classmethod
+    def rebuild(cls, session):
+        """
+        Recompute the minutes that altimeter_data still has samples for.  Older minutes are kept.
+        """
+        session.execute(
+            "DELETE FROM altimeter_minutes "
+            "WHERE minute >= (SELECT date_trunc('minute', MIN(timestamp)) FROM altimeter_data)"
+        )
+        session.execute(
+            "INSERT INTO altimeter_minutes " + altimeter_minutes_from_altimeter_data + "GROUP BY 1"
+        )
+
+    @classmethod
+    def altitude_before(cls, session, timestamp):
+        """
+        Altitude of the last sample before the timestamp, None if there isn't one.
+        """
+        minute = (
+            session.query(cls)
+            .filter(cls.minute <= timestamp, cls.first_timestamp < timestamp)
+            .order_by(cls.minute.desc())
+            .first()
+        )
+        if minute is None:
+            return None
+        if minute.last_timestamp < timestamp:
+            return minute.last_altitude
+        # The timestamp is in the middle of this minute, look at its samples if we still have them.
+        altitude = session.execute(
+            "SELECT altitude_x16 FROM altimeter_data "
+            "WHERE timestamp >= :minute AND timestamp < :timestamp "
+            "ORDER BY timestamp DESC LIMIT 1",
+            {"minute": minute.minute, "timestamp": timestamp},
+        ).scalar()
+        return minute.first_altitude if altitude is None else altitude
+
+    @classmethod
+    def altitude_after(cls, session, timestamp):
+        """
+        Altitude of the first sample after the timestamp, None if there isn't one.
+        """
+        minute = (
+            session.query(cls)
+            .filter(
+                cls.minute >= func.date_trunc("minute", cast(timestamp, DateTime)),
+                cls.last_timestamp > timestamp,
+            )
+            .order_by(cls.minute.asc())
+            .first()
+        )
+        if minute is None:
+            return None
+        if minute.first_timestamp > timestamp:
+            return minute.first_altitude
+        altitude = session.execute(
+            "SELECT altitude_x16 FROM altimeter_data "
+            "WHERE timestamp > :timestamp AND timestamp < :minute + INTERVAL '1 minute' "
+            "ORDER BY timestamp ASC LIMIT 1",
+            {"minute": minute.minute, "timestamp": timestamp},
+        ).scalar()
+        return minute.last_altitude if altitude is None else altitude
+
+    @classmethod
+    def get_summary(cls, session, start_time, end_time):
+        """
+        Altitude and temperature statistics of the minutes from start_time up to end_time.
+        """
+        return (
+            session.query(
+                func.sum(cls.samples).label("samples"),
+                func.min(cls.min_altitude).label("min_altitude"),
+                func.max(cls.max_altitude).label("max_altitude"),
+                (
+                    cast(func.sum(cls.sum_altitude), Float)
+                    / func.nullif(func.sum(cls.samples), 0)
+                ).label("mean_altitude"),
+                func.min(cls.min_temperature).label("min_temperature"),
+                func.max(cls.max_temperature).label("max_temperature"),
+                (
+                    func.sum(cls.sum_temperature)
+                    / func.nullif(func.sum(cls.temperature_samples), 0)
+                ).label("mean_temperature"),
+            )
+            .filter(
+                cls.minute >= func.date_trunc("minute", cast(start_time, DateTime)),
+                cls.minute < end_time,
+            )
+            .first()
+        )
+
+
+class SensorHeartbeat(Base):
+    """
+    First and last sample a sensor table got in each second, so gaps in the data can be
+    found without reading every sample.  The sensor writers keep it up to date.
+    """
+
+    __tablename__ = "sensor_heartbeats"
+
+    sensor = Column(String, primary_key=True)  # Name of the sensor data table
+    second = Column(DateTime, primary_key=True)
+    first_sample = Column(DateTime)
+    last_sample = Column(DateTime)
+
+    @classmethod
+    def record(cls, session, sensor, timestamps):
+        """
+        Widen the heartbeats of the seconds these samples fall in.
+        """
+        seconds = {}
+        for timestamp in timestamps:
+            timestamp = timestamp.replace(tzinfo=None)
+            second = timestamp.replace(microsecond=0)
+            first, last = seconds.get(second, (timestamp, timestamp))
+            seconds[second] = (min(first, timestamp), max(last, timestamp))
+        if not seconds:
+            return
+        session.execute(
+            "INSERT INTO sensor_heartbeats (sensor, second, first_sample, last_sample) "
+            "VALUES (:sensor, :second, :first_sample, :last_sample) "
+            "ON CONFLICT (sensor, second) DO UPDATE SET "
+            "first_sample = LEAST(sensor_heartbeats.first_sample, EXCLUDED.first_sample), "
+            "last_sample = GREATEST(sensor_heartbeats.last_sample, EXCLUDED.last_sample)",
+            [
+                {
+                    "sensor": sensor,
+                    "second": second,
+                    "first_sample": first,
+                    "last_sample": last,
+                }
+                for second, (first, last) in seconds.items()
+            ],
+        )
+
+    @classmethod
+    def rebuild(cls, session, sensor):
+        """
+        Recompute all the heartbeats of a sensor from its data table, after samples were
+        deleted or written without going through record().
+        """
+        if sensor not in common_constants.SENSOR_DATA_TABLES:
+            raise ValueError("Unknown sensor table {0}".format(sensor))
+        session.execute(
+            "DELETE FROM sensor_heartbeats WHERE sensor = :sensor", {"sensor": sensor}
+        )
+        # Can't use the table name as a parameter.
+        session.execute(
+            "INSERT INTO sensor_heartbeats (sensor, second, first_sample, last_sample) "
+            "SELECT :sensor, date_trunc('second', timestamp), MIN(timestamp), MAX(timestamp) "
+            "FROM {0} GROUP BY 2".format(sensor),
+            {"sensor": sensor},
+        )
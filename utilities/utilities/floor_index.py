@@ -0,0 +1,78 @@
+from bisect import bisect_left, bisect_right
+
+from utilities import common_constants
+
+FLOOR_LANDING = common_constants.FLOORS_JSON_LANDING_NUM
+FLOOR_ELEVATION = common_constants.FLOORS_JSON_ELEVATION
+
+
+class FloorIndex:
+    """
+    Floors of one floor map kept sorted by elevation.
+
+    Wraps the floors JSON (floor id -> floor) of a map and changes it in place.
+    Finding the closest floor is a binary search and adding a floor only renumbers
+    the landings above it.  The sorted arrays are built the first time they're needed,
+    looking up a landing by floor id doesn't need them.
+    """
+
+    def __init__(self, floors):
+        self.floors = floors
+        self._keys = None  # sorted (elevation, floor id)
+        self._elevations = None  # just the elevations, for bisect
+        self._order = None  # floor id -> position in the JSON, to break ties like min() does
+
+    def _build(self):
+        self._keys = sorted(
+            (floor[FLOOR_ELEVATION], floor_id) for floor_id, floor in self.floors.items()
+        )
+        self._elevations = [key[0] for key in self._keys]
+        self._order = {floor_id: i for i, floor_id in enumerate(self.floors)}
+
+    def closest_floor(self, elevation):
+        """
+        Returns the id of the floor closest to the elevation, None if there are no floors.
+        """
+        if self._keys is None:
+            self._build()
+        if not self._keys:
+            return None
+        i = bisect_left(self._elevations, elevation)
+        # The closest floor is the nearest one below or the nearest one at or above,
+        # take every floor at those two elevations in case some share an elevation.
+        candidates = []
+        if i > 0:
+            below = bisect_left(self._elevations, self._elevations[i - 1])
+            candidates.extend(self._keys[below:i])
+        if i < len(self._keys):
+            above = bisect_right(self._elevations, self._elevations[i])
+            candidates.extend(self._keys[i:above])
+        return min(
+            candidates, key=lambda k: (abs(k[0] - elevation), self._order[k[1]])
+        )[1]
+
+    def add_floor(self, floor_id, floor):
+        """
+        Insert the floor and give it and every floor above it their new landing numbers.
+        """
+        if self._keys is None:
+            self._build()
+            # The landings of a map we didn't number ourselves can't be trusted.
+            start = 0
+        else:
+            start = None
+        key = (floor[FLOOR_ELEVATION], floor_id)
+        position = bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._elevations.insert(position, key[0])
+        self._order[floor_id] = len(self._order)
+        self.floors[floor_id] = floor
+        for landing in range(position if start is None else start, len(self._keys)):
+            self.floors[self._keys[landing][1]][FLOOR_LANDING] = landing
+
+    def landing_number(self, floor_id):
+        """
+        Returns the 0 based landing number of the floor, None if the map doesn't have it.
+        """
+        floor = self.floors.get(floor_id)
+        return floor[FLOOR_LANDING] if floor else None
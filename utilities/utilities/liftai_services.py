@@ -7,18 +7,15 @@ class LiftAIServices:
         "altimeter",
         "anomalydetector",
         "audiorecorder",
-        "bankstoppage",
         "datasender",
         "elevation",
         "elisha",
-        "escalatorstoppage",
         "floordetector",
         "gpio",
-        "lowusestoppage",
         "pingcloud",
         "reportgenerator",
         "roawatch",
-        "standalonestoppage",
+        "stoppagerunner",
         "trips",
         "vibration",
     ]
@@ -3,11 +3,17 @@ from sqlalchemy import text
 import utilities.common_constants as common_constants
 
 latest_of_each_type_query = """
--- Select the most recent event of each gap type.
-SELECT event_type, event_subtype, occurred_at
-FROM ( SELECT ROW_NUMBER() OVER (PARTITION BY event_type ORDER BY id DESC) AS r,
-       e.* FROM events e WHERE e.event_type IN (:altimeter_data_gap, :accelerometer_data_gap) )
-grouped_events WHERE grouped_events.r < 2;
+-- Select the most recent event of each gap type.  The latest start and end of each type come from
+-- events_type_subtype_id_idx, then the later of the two wins.
+SELECT DISTINCT ON (latest.event_type) latest.event_type, latest.event_subtype, latest.occurred_at
+FROM unnest(ARRAY[:altimeter_data_gap, :accelerometer_data_gap]) AS gap_type(event_type)
+CROSS JOIN unnest(ARRAY[:gap_start, :gap_end]) AS gap_subtype(event_subtype),
+LATERAL (
+    SELECT e.id, e.event_type, e.event_subtype, e.occurred_at FROM events e
+    WHERE e.event_type = gap_type.event_type AND e.event_subtype = gap_subtype.event_subtype
+    ORDER BY e.id DESC LIMIT 1
+) latest
+ORDER BY latest.event_type, latest.id DESC;
 """
 
 
@@ -27,6 +33,8 @@ class MiscUtilities:
                 text(latest_of_each_type_query),
                 altimeter_data_gap=common_constants.EVENT_TYPE_ALTIMETER_DATA_GAP,
                 accelerometer_data_gap=common_constants.EVENT_TYPE_ACCELEROMETER_DATA_GAP,
+                gap_start=common_constants.EVENT_SUBTYPE_GAP_START,
+                gap_end=common_constants.EVENT_SUBTYPE_GAP_END,
             )
         for row in rows:
             if row["event_subtype"] == common_constants.EVENT_SUBTYPE_GAP_START:
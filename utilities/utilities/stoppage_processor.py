@@ -8,6 +8,20 @@ from utilities import common_constants
 from utilities.device_configuration import DeviceConfiguration
 from utilities.db_utilities import engine, Session
 
+# Set the threshold fairly high to avoid cases where the accel app is merely restarting.
+ACCELEROMETER_TIMEOUT_SECONDS = 180
+
+# Postgres reads MAX() of an indexed column off the end of the index.
+sql_last_trip_start = "SELECT MAX(start_time) FROM trips"
+
+sql_snapshot = """
+SELECT
+  LOCALTIMESTAMP AS now,
+  (SELECT MAX(end_time) FROM trips) AS last_trip_end,
+  (SELECT EXTRACT(EPOCH FROM NOW() - timestamp)
+     FROM accelerometer_data ORDER BY id DESC LIMIT 1) AS seconds_since_accelerometer_data
+"""
+
 
 class StoppageState:
     OK = 0
@@ -16,16 +30,80 @@ class StoppageState:
     STOPPED_C99 = 99
 
 
+def _started_after(last_trip_start, time):
+    if not isinstance(time, datetime):
+        time = datetime.fromtimestamp(time)
+    # Same as comparing with to_timestamp() of the time in whole seconds.
+    return last_trip_start is not None and last_trip_start > time.replace(microsecond=0)
+
+
+class LastTripTracker:
+    """
+    Start time of the latest trip, to tell whether any trip started after some time.
+
+    Without a listener the start time is read on every check.  With a DatabaseListener on the
+    trips channel it's only read again after a trip notification.
+    """
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self.last_trip_start = None
+        self.stale = True
+
+    def get_last_trip_start(self, con):
+        if self.listener is None or self.listener.wait(0):
+            self.stale = True
+        if self.stale:
+            self.last_trip_start = con.execute(sql_last_trip_start).scalar()
+            self.stale = False
+        return self.last_trip_start
+
+    def has_trip_started_after_time(self, con, time):
+        return _started_after(self.get_last_trip_start(con), time)
+
+
+class StoppageSnapshot:
+    """
+    Trip and accelerometer facts every stoppage detector checks, read once and shared by all the
+    detectors that run at the same time.
+    """
+
+    def __init__(self, now, last_trip_start, last_trip_end, seconds_since_accelerometer_data):
+        self.now = now
+        self.last_trip_start = last_trip_start
+        self.last_trip_end = last_trip_end
+        self.seconds_since_accelerometer_data = seconds_since_accelerometer_data
+
+    @classmethod
+    def take(cls, con, last_trip_tracker):
+        r = con.execute(sql_snapshot).fetchone()
+        return cls(r['now'], last_trip_tracker.get_last_trip_start(con), r['last_trip_end'],
+                   r['seconds_since_accelerometer_data'])
+
+    @property
+    def accelerometer_working(self):
+        return self.seconds_since_accelerometer_data is not None and \
+            self.seconds_since_accelerometer_data < ACCELEROMETER_TIMEOUT_SECONDS
+
+    def has_trip_started_after_time(self, time):
+        return _started_after(self.last_trip_start, time)
+
+
 class StoppageProcessor(ABC):
     name = 'stoppage_processor'
     parms_table_name = None
     engine = engine
+    # Shared by every processor in the process.
+    last_trip_tracker = LastTripTracker()
 
     def __init__(self, logger):
         self.logger = logger
 
         self.session = Session()
 
+        # Set by the stoppage scheduler while it runs this processor, None when it runs on its own.
+        self.snapshot = None
+
         self.storage_last_state = self._get_last_state_fname()
         self.storage_last_trip = self._get_last_trip_fname()
         self.storage_current_stopped_time = self._get_current_stopped_time_fname()
@@ -102,25 +180,17 @@ class StoppageProcessor(ABC):
         return self._has_trip_started_after_time(time)
 
     def _has_trip_started_after_time(self, time):
-        new_time = time
-        if isinstance(time, datetime):
-            new_time = int(time.strftime("%s"))
+        if self.snapshot is not None:
+            return self.snapshot.has_trip_started_after_time(time)
 
         with engine.connect() as con:
             try:
-                query_str = text("SELECT count(*) AS trip_count "
-                                 "FROM trips "
-                                 "WHERE start_time > to_timestamp(:time)")
-                rs = con.execute(query_str, time=new_time)
-                r = rs.fetchone()
-
-                return r['trip_count'] > 0 if r is not None else False
+                return self.last_trip_tracker.has_trip_started_after_time(con, time)
 
             except Exception as ex:
                 msg = "{}: Exception happened in _is_trip_started_after_time: {}".format(self.name, ex)
                 self.logger.error(msg)
                 raise Exception(msg)
-        return False
 
     def _set_last_trip(self, last_trip):
         self.last_trip = last_trip
@@ -132,10 +202,11 @@ class StoppageProcessor(ABC):
             self.logger.error("{}: Exception writing last_trip to permanent storage: {}".format(self.name, ex))
 
     def _is_accelerometer_working(self, con):
+        if self.snapshot is not None:
+            return self.snapshot.accelerometer_working
         seconds_since_last_accel_value = con.execute("SELECT EXTRACT(EPOCH FROM NOW() - timestamp) "
                     "FROM accelerometer_data ORDER BY id DESC LIMIT 1;").fetchone()[0]
-        # Set the threshold fairly high to avoid cases where the accel app is merely restarting.
-        return seconds_since_last_accel_value < 180
+        return seconds_since_last_accel_value < ACCELEROMETER_TIMEOUT_SECONDS
 
     def _get_last_state_fname(self):
         return os.path.join(common_constants.STORAGE_FOLDER,
@@ -0,0 +1,78 @@
+import time
+
+from utilities.db_utilities import engine
+from utilities.stoppage_processor import StoppageProcessor, StoppageSnapshot
+
+# How long to sleep when there is nothing to run, e.g. on a device that is neither an elevator nor an escalator.
+IDLE_SLEEP_SECONDS = 60
+
+
+class ScheduledRun:
+    def __init__(self, name, processor, run, interval):
+        self.name = name
+        self.processor = processor
+        self.run = run
+        self.interval = interval
+        self.next_run = None    # None means run on the first tick
+
+
+class StoppageScheduler:
+    """
+    Runs several stoppage processors in one process, each at its own interval.
+
+    The runs that are due together share one StoppageSnapshot, so the last trip and the
+    accelerometer are only read once for all of them.  An exception in one run is logged and
+    doesn't stop the others.
+    """
+
+    def __init__(self, logger, clock=time.monotonic, sleep=time.sleep):
+        self.logger = logger
+        self.clock = clock
+        self.sleep = sleep
+        self.runs = []
+
+    def add(self, processor, interval, run=None, name=None):
+        """
+        Run processor.run(), or the given method of it, every interval seconds.
+        Runs that are due at the same time go in the order they were added.
+        """
+        self.runs.append(ScheduledRun(name or processor.name, processor, run or processor.run, interval))
+
+    def _due(self, now):
+        return [r for r in self.runs if r.next_run is None or r.next_run <= now]
+
+    def tick(self):
+        """
+        Do every run that is due and return their names.
+        """
+        now = self.clock()
+        due = self._due(now)
+        if not due:
+            return []
+
+        with engine.connect() as con:
+            snapshot = StoppageSnapshot.take(con, StoppageProcessor.last_trip_tracker)
+        for r in due:
+            r.processor.snapshot = snapshot
+        try:
+            for r in due:
+                r.next_run = now + r.interval
+                try:
+                    r.run()
+                except Exception as ex:
+                    self.logger.exception("Exception in {0}: {1}".format(r.name, ex))
+        finally:
+            for r in due:
+                r.processor.snapshot = None
+        return [r.name for r in due]
+
+    def seconds_until_next_run(self):
+        if not self.runs:
+            return IDLE_SLEEP_SECONDS
+        now = self.clock()
+        return max(0, min((r.next_run or now) - now for r in self.runs))
+
+    def run_forever(self):
+        while True:
+            self.tick()
+            self.sleep(self.seconds_until_next_run())
@@ -1,8 +1,14 @@
 import unittest
 
+from .test_altimeter_minutes import *
 from .test_configuration_methods import *
+from .test_db_listener import *
 from .test_floor_detection import *
+from .test_floor_index import *
 from .test_floor_model import *
+from .test_query_plans import *
+from .test_stoppage_scheduler import *
+from .test_trip_counts import *
 from .test_trip_model import *
 
 
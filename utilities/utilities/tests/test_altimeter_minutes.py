@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+from utilities.db_utilities import AltimeterData, AltimeterMinute
+from utilities.test_utilities import SessionTestCase
+
+
+class TestAltimeterMinute(SessionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session.execute("DELETE FROM altimeter_data")
+        self.session.execute("DELETE FROM altimeter_minutes")
+        self.start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=10)
+
+    def _samples(self, count, start=None, altitude=100):
+        start = start or self.start
+        return [
+            AltimeterData(
+                timestamp=start + timedelta(seconds=0.25 * i),
+                altitude_x16=altitude + i % 7,
+                temperature=20 + (i % 3) * 0.5,
+            )
+            for i in range(count)
+        ]
+
+    def _minutes(self):
+        return [
+            (
+                m.minute,
+                m.samples,
+                m.min_altitude,
+                m.max_altitude,
+                m.sum_altitude,
+                m.first_timestamp,
+                m.first_altitude,
+                m.last_timestamp,
+                m.last_altitude,
+                m.min_temperature,
+                m.max_temperature,
+                round(m.sum_temperature, 6),
+                m.temperature_samples,
+            )
+            for m in self.session.query(AltimeterMinute).order_by(AltimeterMinute.minute)
+        ]
+
+    def test_incremental_rollup_matches_the_raw_data(self):
+        samples = self._samples(600)  # two and a half minutes
+        # The writer rolls up one sample at a time, in whatever order they arrive.
+        for sample in samples[300:] + samples[:300]:
+            AltimeterMinute.record(self.session, [sample])
+        incremental = self._minutes()
+
+        self.session.add_all(samples)
+        self.session.flush()
+        AltimeterMinute.rebuild(self.session)
+        self.assertEqual(len(incremental), 3)
+        self.assertEqual(incremental, self._minutes())
+
+        first = self.session.query(AltimeterMinute).order_by(AltimeterMinute.minute).first()
+        self.assertEqual(first.samples, 240)
+        self.assertEqual(first.first_timestamp, self.start)
+        self.assertEqual(first.last_timestamp, self.start + timedelta(seconds=59.75))
+        self.assertAlmostEqual(
+            first.mean_altitude, sum(s.altitude_x16 for s in samples[:240]) / 240
+        )
+
+    def test_rebuild_keeps_minutes_without_raw_data(self):
+        old = self._samples(10, start=self.start - timedelta(days=3))
+        AltimeterMinute.record(self.session, old)
+        self.session.add_all(self._samples(10))
+        self.session.flush()
+        AltimeterMinute.rebuild(self.session)
+        self.assertEqual(len(self._minutes()), 2)
+
+    def test_altitudes_around_a_gap(self):
+        before = self._samples(100, altitude=100)
+        after = self._samples(100, start=self.start + timedelta(minutes=2, seconds=30), altitude=500)
+        AltimeterMinute.record(self.session, before + after)
+        self.session.add_all(before + after)
+        self.session.flush()
+
+        gap_start = before[-1].timestamp + timedelta(seconds=0.1)
+        gap_end = after[0].timestamp - timedelta(seconds=0.1)
+        self.assertEqual(
+            AltimeterMinute.altitude_before(self.session, gap_start), before[-1].altitude_x16
+        )
+        self.assertEqual(
+            AltimeterMinute.altitude_after(self.session, gap_end), after[0].altitude_x16
+        )
+        # Both ends fall in the middle of a minute, the raw samples pin down the exact ones.
+        middle = before[50].timestamp
+        self.assertEqual(
+            AltimeterMinute.altitude_before(self.session, middle), before[49].altitude_x16
+        )
+        self.assertEqual(
+            AltimeterMinute.altitude_after(self.session, middle), before[51].altitude_x16
+        )
+        self.assertIsNone(AltimeterMinute.altitude_before(self.session, self.start))
+        self.assertIsNone(
+            AltimeterMinute.altitude_after(self.session, after[-1].timestamp)
+        )
+
+    def test_altitudes_after_the_raw_data_is_truncated(self):
+        before = self._samples(100, altitude=100)
+        after = self._samples(100, start=self.start + timedelta(minutes=3), altitude=500)
+        AltimeterMinute.record(self.session, before + after)
+
+        self.assertEqual(
+            AltimeterMinute.altitude_before(self.session, self.start + timedelta(minutes=2)),
+            before[-1].altitude_x16,
+        )
+        self.assertEqual(
+            AltimeterMinute.altitude_after(self.session, self.start + timedelta(minutes=2)),
+            after[0].altitude_x16,
+        )
+
+    def test_summary(self):
+        samples = self._samples(480)
+        AltimeterMinute.record(self.session, samples)
+        summary = AltimeterMinute.get_summary(
+            self.session, self.start, self.start + timedelta(minutes=1)
+        )
+        self.assertEqual(summary.samples, 240)
+        self.assertEqual(summary.min_altitude, 100)
+        self.assertEqual(summary.max_altitude, 106)
+        self.assertAlmostEqual(
+            summary.mean_altitude, sum(s.altitude_x16 for s in samples[:240]) / 240
+        )
+        self.assertEqual(summary.min_temperature, 20)
+        self.assertEqual(summary.max_temperature, 21)
+        self.assertIsNone(
+            AltimeterMinute.get_summary(
+                self.session, self.start - timedelta(days=1), self.start
+            ).samples
+        )
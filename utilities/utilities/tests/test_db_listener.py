@@ -0,0 +1,97 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from utilities import common_constants
+from utilities.db_listener import DatabaseListener
+from utilities.db_utilities import engine
+
+TRIPS = common_constants.TRIPS_CHANNEL
+EVENTS = common_constants.EVENTS_CHANNEL
+PROBLEMS = common_constants.PROBLEMS_CHANNEL
+
+
+class TestDatabaseListener(unittest.TestCase):
+    def setUp(self):
+        self.listener = DatabaseListener(TRIPS, EVENTS, PROBLEMS)
+        self.addCleanup(self.listener.close)
+
+    def _execute(self, sql):
+        with engine.begin() as con:
+            result = con.execute(sql)
+            return result.scalar() if result.returns_rows else None
+
+    def _insert_trips(self, count):
+        ids = [
+            self._execute(
+                "INSERT INTO trips (start_accel, end_accel, start_time, end_time, is_up) "
+                "VALUES (-1, -1, NOW(), NOW(), TRUE) RETURNING id"
+            )
+            for _ in range(count)
+        ]
+        self.addCleanup(
+            self._execute, "DELETE FROM trips WHERE id IN ({0})".format(", ".join(str(i) for i in ids))
+        )
+
+    def _timed_wait(self, timeout):
+        before = datetime.now()
+        notified = self.listener.wait(timeout)
+        return notified, datetime.now() - before
+
+    def test_timeout_without_notifications(self):
+        notified, waited = self._timed_wait(0.2)
+        self.assertEqual(notified, set())
+        self.assertGreaterEqual(waited, timedelta(seconds=0.2))
+
+    def test_new_trip_wakes_listener(self):
+        self._insert_trips(1)
+        notified, waited = self._timed_wait(10)
+        self.assertEqual(notified, {TRIPS})
+        self.assertLess(waited, timedelta(seconds=1))
+        # Everything was taken by the first wait.
+        self.assertEqual(self.listener.wait(0.1), set())
+
+    def test_trip_deletes_wake_listener(self):
+        self._insert_trips(2)
+        self.listener.wait(10)
+        self._execute("DELETE FROM trips WHERE id = (SELECT MAX(id) FROM trips)")
+        self.assertEqual(self.listener.wait(10), {TRIPS})
+
+    def test_elevation_processed_wakes_floor_detector(self):
+        listener = DatabaseListener(TRIPS, EVENTS)
+        self.addCleanup(listener.close)
+        self._insert_trips(1)
+        listener.wait(10)
+        self._execute("UPDATE trips SET elevation_processed = TRUE WHERE id = (SELECT MAX(id) FROM trips)")
+        before = datetime.now()
+        self.assertEqual(listener.wait(10), {TRIPS})
+        self.assertLess(datetime.now() - before, timedelta(seconds=1))
+
+    def test_notifications_that_arrived_while_busy(self):
+        self._insert_trips(3)
+        event_id = self._execute(
+            "INSERT INTO events (occurred_at, detected_at, source, event_type, event_subtype, confidence) "
+            "VALUES (NOW(), NOW(), 'test', 'test', 'test', 0) RETURNING id"
+        )
+        self.addCleanup(self._execute, "DELETE FROM events WHERE id = {0}".format(event_id))
+        # Busy with something else while the notifications come in.
+        time.sleep(0.2)
+        notified, waited = self._timed_wait(10)
+        self.assertEqual(notified, {TRIPS, EVENTS})
+        self.assertLess(waited, timedelta(seconds=1))
+
+    def test_problem_changes_wake_listener(self):
+        problem_id = self._execute(
+            "INSERT INTO problems (created_at, started_at, problem_type, confidence) "
+            "VALUES (NOW(), NOW(), 'test', 0) RETURNING id"
+        )
+        self.addCleanup(self._execute, "DELETE FROM problems WHERE id = {0}".format(problem_id))
+        self.assertEqual(self.listener.wait(10), {PROBLEMS})
+        self._execute("UPDATE problems SET ended_at = NOW() WHERE id = {0}".format(problem_id))
+        self.assertEqual(self.listener.wait(10), {PROBLEMS})
+
+    def test_reconnects_after_losing_the_connection(self):
+        self.listener.connection.close()
+        self.assertEqual(self.listener.wait(0.1), {TRIPS, EVENTS, PROBLEMS})
+        self._insert_trips(1)
+        self.assertEqual(self.listener.wait(10), {TRIPS})
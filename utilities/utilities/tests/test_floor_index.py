@@ -0,0 +1,62 @@
+import random
+import unittest
+
+from utilities import common_constants
+from utilities.floor_index import FloorIndex
+
+FLOOR_LANDING = common_constants.FLOORS_JSON_LANDING_NUM
+FLOOR_ELEVATION = common_constants.FLOORS_JSON_ELEVATION
+
+
+def _floor(elevation, landing=-1):
+    return {FLOOR_ELEVATION: elevation, FLOOR_LANDING: landing}
+
+
+class TestFloorIndex(unittest.TestCase):
+    def test_closest_floor_matches_linear_search(self):
+        rnd = random.Random(7)
+        floors = {}
+        for floor_id in range(1, 61):
+            floors[str(floor_id)] = _floor(rnd.randint(-500, 3000))
+        # A couple of floors sharing an elevation, ties have to go to the first one.
+        floors["61"] = _floor(floors["10"][FLOOR_ELEVATION])
+        floors["62"] = _floor(floors["20"][FLOOR_ELEVATION] + 10)
+        index = FloorIndex(floors)
+        for elevation in list(range(-600, 3100, 7)) + [
+            floors["20"][FLOOR_ELEVATION] + 5
+        ]:
+            expected = min(
+                floors, key=lambda k: abs(floors[k][FLOOR_ELEVATION] - elevation)
+            )
+            self.assertEqual(index.closest_floor(elevation), expected, elevation)
+
+    def test_closest_floor_without_floors(self):
+        self.assertIsNone(FloorIndex({}).closest_floor(100))
+
+    def test_add_floor_renumbers_landings(self):
+        floors = {}
+        index = FloorIndex(floors)
+        for floor_id, elevation in enumerate([100, -50, 300, 0, 200, 150], start=1):
+            index.add_floor(str(floor_id), _floor(elevation))
+            expected = sorted(
+                (f[FLOOR_ELEVATION], fid) for fid, f in floors.items()
+            )
+            for landing, (_, fid) in enumerate(expected):
+                self.assertEqual(floors[fid][FLOOR_LANDING], landing)
+        self.assertEqual(index.closest_floor(-20), "4")
+
+    def test_add_floor_fixes_untrusted_landings(self):
+        floors = {"1": _floor(100, landing=5), "2": _floor(0, landing=5)}
+        FloorIndex(floors).add_floor("3", _floor(200))
+        self.assertEqual(floors["2"][FLOOR_LANDING], 0)
+        self.assertEqual(floors["1"][FLOOR_LANDING], 1)
+        self.assertEqual(floors["3"][FLOOR_LANDING], 2)
+
+    def test_landing_number(self):
+        index = FloorIndex({"1": _floor(100, landing=3)})
+        self.assertEqual(index.landing_number("1"), 3)
+        self.assertIsNone(index.landing_number("2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
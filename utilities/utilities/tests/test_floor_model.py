@@ -2,7 +2,8 @@ from datetime import datetime, timedelta
 
 from pytz import utc
 
-from utilities.db_utilities import FloorMap
+from utilities import common_constants
+from utilities.db_utilities import Floor, FloorMap
 from utilities.test_utilities import SessionTestCase
 
 
@@ -34,3 +35,45 @@ class TestFloor(SessionTestCase):
         self.session.add(second_floor_map)
         latest_floor_map = FloorMap.get_lastest_map(self.session)
         self.assertEqual(second_floor_map, latest_floor_map)
+
+    def test_floors_come_from_floor_rows(self):
+        floor_map = FloorMap(start_time=datetime.now(utc), floors={"1": {}})
+        self.session.add(floor_map)
+        self.session.flush()
+        self.assertEqual(floor_map.floors, {"1": {}})
+
+        self.session.add(
+            Floor(
+                floor_map_id=floor_map.id,
+                floor_id="7",
+                schema_version=1,
+                elevation=120,
+                landing_num=3,
+                cumulative_err=-4,
+                last_updated=datetime(2020, 7, 1, 12, 30),
+            )
+        )
+        self.session.flush()
+        self.session.expire(floor_map)
+        expected = {
+            "7": {
+                common_constants.FLOORS_JSON_SCHEMA: 1,
+                common_constants.FLOORS_JSON_ELEVATION: 120,
+                common_constants.FLOORS_JSON_LANDING_NUM: 3,
+                common_constants.FLOORS_JSON_CUMULATIVE_ERR: -4,
+                common_constants.FLOORS_JSON_LAST_UPDATED: "2020-07-01T12:30:00.000000",
+            }
+        }
+        self.assertEqual(floor_map.floors, expected)
+        self.assertEqual(
+            self.session.query(FloorMap.floors)
+            .filter(FloorMap.id == floor_map.id)
+            .scalar(),
+            expected,
+        )
+        self.assertEqual(
+            self.session.execute(
+                "SELECT floors FROM floor_maps_json WHERE id = :id", {"id": floor_map.id}
+            ).scalar(),
+            expected,
+        )
@@ -0,0 +1,264 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from elevation.processor import sql_get_unprocessed_gap_events
+from elisha.constants import PROCESS_BATCH_SIZE, RELEVELING_LOOKBACK_HOURS
+from elisha.shutdown import sql_latest_of_each_subtype
+from floor_detector.floor_store import sql_process_trips_and_events, MISSING_TRIP, ELEVATION_RESET
+from gpio.car_status import sql_query as sql_car_status
+from low_use_stoppage.processor import sql_get_low_use_shutdown_status, sql_get_low_use_shutdown_status_before
+from report_generator.status_data import select_relevelings
+from utilities import common_constants
+from utilities.db_utilities import Event, Problem, engine
+from utilities.misc_utilities import latest_of_each_type_query
+from utilities.stoppage_processor import StoppageState
+from utilities.test_utilities import SessionTestCase
+
+EVENTS_PER_DAY = 600
+PROBLEMS_PER_DAY = 10
+DAYS = 365
+
+# (source, event_type, event_subtype), repeated to get roughly the mix a busy elevator sees.
+EVENT_KINDS = (
+    [
+        (common_constants.EVENT_SOURCE_BANK_SHUTDOWN, common_constants.EVENT_TYPE_SHUTDOWN,
+         common_constants.EVENT_SUBTYPE_BANK),
+        (common_constants.EVENT_SOURCE_STANDALONE_SHUTDOWN, common_constants.EVENT_TYPE_SHUTDOWN,
+         common_constants.EVENT_SUBTYPE_STANDALONE),
+        (common_constants.EVENT_SOURCE_ANOMALY_DETECTOR, common_constants.EVENT_TYPE_ANOMALY,
+         common_constants.EVENT_SUBTYPE_RELEVELING),
+    ] * 6
+    + [
+        (common_constants.EVENT_SOURCE_PATTERN_SHUTDOWN, common_constants.EVENT_TYPE_SHUTDOWN,
+         common_constants.EVENT_SUBTYPE_LOW_USAGE_SHUTDOWN),
+        (common_constants.EVENT_SOURCE_VIBRATION, common_constants.EVENT_TYPE_VIBRATION,
+         common_constants.EVENT_SUBTYPE_LOW_FREQ_VERTICAL),
+        (common_constants.EVENT_SOURCE_TRIP_PROCESSOR, common_constants.EVENT_TYPE_ELEVATION,
+         common_constants.EVENT_SUBTYPE_MISSING_TRIP),
+        (common_constants.EVENT_SOURCE_ELEVATION_PROCESSOR, common_constants.EVENT_TYPE_ELEVATION,
+         common_constants.EVENT_SUBTYPE_PROCESSED_GAP),
+        (common_constants.EVENT_SOURCE_ELEVATION_PROCESSOR, common_constants.EVENT_TYPE_ELEVATION,
+         common_constants.EVENT_SUBTYPE_ELEVATION_RESET),
+        ("gap detector", common_constants.EVENT_TYPE_ACCELEROMETER_DATA_GAP, common_constants.EVENT_SUBTYPE_GAP_START),
+        ("gap detector", common_constants.EVENT_TYPE_ACCELEROMETER_DATA_GAP, common_constants.EVENT_SUBTYPE_GAP_END),
+        ("gap detector", common_constants.EVENT_TYPE_ALTIMETER_DATA_GAP, common_constants.EVENT_SUBTYPE_GAP_START),
+        ("gap detector", common_constants.EVENT_TYPE_ALTIMETER_DATA_GAP, common_constants.EVENT_SUBTYPE_GAP_END),
+    ]
+)
+
+sql_insert_events = """
+WITH kinds AS (
+    SELECT * FROM unnest(:sources, :event_types, :event_subtypes) WITH ORDINALITY AS k(source, event_type, event_subtype, n)
+)
+INSERT INTO events (occurred_at, detected_at, source, event_type, event_subtype, confidence)
+SELECT
+    NOW() - :days * INTERVAL '1 day' + i * :step * INTERVAL '1 second',
+    NOW() - :days * INTERVAL '1 day' + i * :step * INTERVAL '1 second',
+    kinds.source, kinds.event_type, kinds.event_subtype, i % 100
+FROM generate_series(1, :count) i
+JOIN kinds ON kinds.n = i % :kind_count + 1
+"""
+
+# Every 20th problem is a 99% stoppage and only the last few are still open.
+sql_insert_problems = """
+INSERT INTO problems (created_at, updated_at, started_at, ended_at, problem_type, problem_subtype, confidence)
+SELECT
+    t, t, t,
+    CASE WHEN i > :count - 3 THEN NULL ELSE t + INTERVAL '10 minutes' END,
+    CASE WHEN i % 10 = 0 THEN :anomaly ELSE :shutdown END,
+    CASE WHEN i % 10 = 0 THEN :releveling ELSE NULL END,
+    CASE WHEN i % 20 = 0 THEN 99.5 ELSE 60 END
+FROM generate_series(1, :count) i,
+LATERAL (SELECT NOW() - :days * INTERVAL '1 day' + i * :step * INTERVAL '1 second' AS t) times
+"""
+
+# Queries that are built inline in the apps, written out here.
+sql_open_releveling_problems = """
+SELECT COUNT(*) FROM problems
+WHERE problem_type = :problem_type AND problem_subtype = :problem_subtype AND ended_at IS NULL
+"""
+
+sql_uptime_one_hour = """
+SELECT started_at, ended_at, confidence FROM problems
+WHERE problem_type = :prob_type AND (ended_at >= :date OR ended_at is NULL) AND confidence >= 98.00
+"""
+
+sql_weekly_activity_stoppages = """
+SELECT started_at, ended_at FROM problems
+WHERE confidence >= {0} AND started_at IS NOT NULL AND ended_at IS NOT NULL
+""".format(StoppageState.STOPPED_C99)
+
+
+class TestQueryPlans(SessionTestCase):
+    """
+    EXPLAIN the queries the apps run on events and problems against a year of data and make
+    sure none of them reads the whole table.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.session.execute(
+            text(sql_insert_events),
+            {
+                "sources": [k[0] for k in EVENT_KINDS],
+                "event_types": [k[1] for k in EVENT_KINDS],
+                "event_subtypes": [k[2] for k in EVENT_KINDS],
+                "kind_count": len(EVENT_KINDS),
+                "days": DAYS,
+                "count": DAYS * EVENTS_PER_DAY,
+                "step": 86400 / EVENTS_PER_DAY,
+            },
+        )
+        self.session.execute(
+            text(sql_insert_problems),
+            {
+                "anomaly": common_constants.PROB_TYPE_ANOMALY,
+                "shutdown": common_constants.PROB_TYPE_SHUTDOWN,
+                "releveling": common_constants.PROB_SUBTYPE_RELEVELING,
+                "days": DAYS,
+                "count": DAYS * PROBLEMS_PER_DAY,
+                "step": 86400 / PROBLEMS_PER_DAY,
+            },
+        )
+        self.session.execute("ANALYZE events")
+        self.session.execute("ANALYZE problems")
+        # The row counts ANALYZE writes aren't rolled back, put back the real ones.
+        self.addCleanup(self._analyze)
+
+    def _analyze(self):
+        with engine.connect() as con:
+            con.execute("ANALYZE events")
+            con.execute("ANALYZE problems")
+
+    def _plan(self, sql, params):
+        return "\n".join(row[0] for row in self.session.execute(text("EXPLAIN " + sql), params))
+
+    def _orm_plan(self, query):
+        compiled = query.statement.compile(dialect=postgresql.dialect())
+        return "\n".join(
+            row[0] for row in self.session.connection().execute("EXPLAIN " + str(compiled), compiled.params)
+        )
+
+    def assertNoSeqScan(self, name, plan):
+        for table in ("events", "problems"):
+            self.assertNotIn("Seq Scan on {0}".format(table), plan, "{0}:\n{1}".format(name, plan))
+
+    def test_events_queries(self):
+        now = datetime.now()
+        queries = {
+            "elisha shutdown subtypes": (
+                sql_latest_of_each_subtype, {"event_type": common_constants.EVENT_TYPE_SHUTDOWN}
+            ),
+            "floor detector": (
+                sql_process_trips_and_events,
+                {
+                    "event_type": common_constants.EVENT_TYPE_ELEVATION,
+                    "missing_trip_subtype": MISSING_TRIP,
+                    "elevation_reset_subtype": ELEVATION_RESET,
+                    "starting_time": now - timedelta(hours=1),
+                },
+            ),
+            "elevation gaps": (
+                sql_get_unprocessed_gap_events,
+                {
+                    "altimeter_gap": common_constants.EVENT_TYPE_ALTIMETER_DATA_GAP,
+                    "accelerometer_gap": common_constants.EVENT_TYPE_ACCELEROMETER_DATA_GAP,
+                    "source": common_constants.EVENT_SOURCE_ELEVATION_PROCESSOR,
+                    "oldest_altimeter_data": "60 minutes",
+                },
+            ),
+            "sensor gap status": (
+                latest_of_each_type_query,
+                {
+                    "altimeter_data_gap": common_constants.EVENT_TYPE_ALTIMETER_DATA_GAP,
+                    "accelerometer_data_gap": common_constants.EVENT_TYPE_ACCELEROMETER_DATA_GAP,
+                    "gap_start": common_constants.EVENT_SUBTYPE_GAP_START,
+                    "gap_end": common_constants.EVENT_SUBTYPE_GAP_END,
+                },
+            ),
+            "low use confidence": (
+                sql_get_low_use_shutdown_status.format(
+                    common_constants.EVENT_TYPE_SHUTDOWN, common_constants.EVENT_SUBTYPE_LOW_USAGE_SHUTDOWN
+                ),
+                {},
+            ),
+            "low use before midnight": (
+                sql_get_low_use_shutdown_status_before.format(
+                    common_constants.EVENT_TYPE_SHUTDOWN,
+                    common_constants.EVENT_SUBTYPE_LOW_USAGE_SHUTDOWN,
+                    now.replace(hour=0, minute=0, second=0),
+                ),
+                {},
+            ),
+        }
+        for name, (sql, params) in queries.items():
+            self.assertNoSeqScan(name, self._plan(sql, params))
+
+        last_event_id = self.session.execute("SELECT MAX(id) FROM events").scalar() - 100
+        orm_queries = {
+            "elisha batch": self.session.query(Event)
+            .filter(Event.id > last_event_id, Event.id.notin_([last_event_id + 1]))
+            .order_by(Event.id.asc())
+            .limit(PROCESS_BATCH_SIZE),
+            "elisha last event": self.session.query(Event.id).order_by(Event.id.desc()).limit(1),
+            "elisha relevelings": self.session.query(Event.id, Event.occurred_at, Event.confidence)
+            .filter(
+                Event.event_type == common_constants.EVENT_TYPE_ANOMALY,
+                Event.event_subtype == common_constants.EVENT_SUBTYPE_RELEVELING,
+                Event.occurred_at > now - timedelta(hours=RELEVELING_LOOKBACK_HOURS),
+            )
+            .order_by(Event.occurred_at.desc()),
+            "report relevelings": self.session.query(Event).filter(
+                Event.event_type == common_constants.EVENT_TYPE_ANOMALY,
+                Event.event_subtype == common_constants.EVENT_SUBTYPE_RELEVELING,
+                Event.occurred_at >= now - timedelta(hours=1),
+                Event.occurred_at < now,
+            ),
+        }
+        for name, query in orm_queries.items():
+            self.assertNoSeqScan(name, self._orm_plan(query))
+
+    def test_problems_queries(self):
+        now = datetime.now()
+        queries = {
+            "car status": (sql_car_status, {}),
+            "open relevelings": (
+                sql_open_releveling_problems,
+                {
+                    "problem_type": common_constants.PROB_TYPE_ANOMALY,
+                    "problem_subtype": common_constants.PROB_SUBTYPE_RELEVELING,
+                },
+            ),
+            "uptime": (
+                sql_uptime_one_hour,
+                {"prob_type": common_constants.PROB_TYPE_SHUTDOWN, "date": now - timedelta(hours=1)},
+            ),
+            "weekly activity stoppages": (sql_weekly_activity_stoppages, {}),
+        }
+        for name, (sql, params) in queries.items():
+            self.assertNoSeqScan(name, self._plan(sql, params))
+
+        orm_queries = {
+            "elisha open releveling": self.session.query(Problem.id, Problem.confidence, Problem.updated_at)
+            .filter(
+                Problem.problem_type == common_constants.PROB_TYPE_ANOMALY,
+                Problem.problem_subtype == common_constants.PROB_SUBTYPE_RELEVELING,
+                Problem.ended_at == None,
+            )
+            .order_by(Problem.id.desc()),
+            "elisha problem update": self.session.query(Problem).filter(Problem.id == 42),
+            "report open releveling": select_relevelings(
+                self.session.query(Problem.created_at).filter(Problem.ended_at == None).order_by(
+                    Problem.created_at.desc()
+                )
+            ).limit(1),
+            "report closed releveling": select_relevelings(
+                self.session.query(Problem).filter(Problem.ended_at >= now - timedelta(hours=1)).order_by(
+                    Problem.ended_at.desc()
+                )
+            ).limit(1),
+        }
+        for name, query in orm_queries.items():
+            self.assertNoSeqScan(name, self._orm_plan(query))
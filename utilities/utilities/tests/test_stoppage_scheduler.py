@@ -0,0 +1,201 @@
+import logging
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import text
+
+from utilities import common_constants
+from utilities.stoppage_processor import LastTripTracker, StoppageProcessor, StoppageSnapshot
+from utilities.stoppage_scheduler import StoppageScheduler
+from utilities.test_utilities import SessionTestCase
+
+
+class FakeStoppageProcessor(StoppageProcessor):
+    def __init__(self, name, calls, fail=False):
+        self.name = name
+        super().__init__(logging.getLogger(__name__))
+        self.calls = calls
+        self.fail = fail
+
+    def _restore_value(self, storage_location, default):
+        return default
+
+    def run(self):
+        self.calls.append((self.name, self.snapshot))
+        if self.fail:
+            raise Exception("{0} failed".format(self.name))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TripsTestCase(SessionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session.execute("DELETE FROM trips")
+        self.session.execute("DELETE FROM accelerometer_data")
+        self.last_trip = datetime.now().replace(microsecond=250000) - timedelta(hours=1)
+        self.session.execute(
+            text(
+                "INSERT INTO trips (start_accel, end_accel, start_time, end_time, is_up) "
+                "VALUES (-1, -1, :start_time, :start_time + INTERVAL '10 seconds', TRUE)"
+            ),
+            [{"start_time": self.last_trip - timedelta(minutes=m)} for m in (0, 5, 30)],
+        )
+
+    def _insert_accelerometer_data(self, seconds_ago):
+        self.session.execute(
+            text(
+                "INSERT INTO accelerometer_data (timestamp, x_data, y_data, z_data) "
+                "VALUES (NOW() - :seconds_ago * INTERVAL '1 second', 0, 0, 0)"
+            ),
+            {"seconds_ago": seconds_ago},
+        )
+
+    def _has_trip_started_after_time(self, time):
+        # How StoppageProcessor used to check, counting the trips in the database.
+        return self.session.execute(
+            text("SELECT count(*) FROM trips WHERE start_time > to_timestamp(:time)"),
+            {"time": int(time.strftime("%s"))},
+        ).scalar() > 0
+
+
+class TestStoppageSnapshot(TripsTestCase):
+    def test_snapshot_of_trips(self):
+        snapshot = StoppageSnapshot.take(self.session, LastTripTracker())
+        self.assertEqual(snapshot.last_trip_start, self.last_trip)
+        self.assertEqual(snapshot.last_trip_end, self.last_trip + timedelta(seconds=10))
+        for time in (
+            self.last_trip - timedelta(minutes=10),
+            self.last_trip - timedelta(seconds=1),
+            self.last_trip.replace(microsecond=0),
+            self.last_trip,
+            self.last_trip + timedelta(seconds=1),
+            datetime(2000, 1, 1),
+        ):
+            self.assertEqual(
+                snapshot.has_trip_started_after_time(time), self._has_trip_started_after_time(time), time
+            )
+
+    def test_snapshot_without_data(self):
+        self.session.execute("DELETE FROM trips")
+        snapshot = StoppageSnapshot.take(self.session, LastTripTracker())
+        self.assertIsNone(snapshot.last_trip_start)
+        self.assertFalse(snapshot.has_trip_started_after_time(datetime(2000, 1, 1)))
+        self.assertFalse(snapshot.accelerometer_working)
+
+    def test_accelerometer_working(self):
+        self._insert_accelerometer_data(300)
+        self.assertFalse(StoppageSnapshot.take(self.session, LastTripTracker()).accelerometer_working)
+        self._insert_accelerometer_data(10)
+        self.assertTrue(StoppageSnapshot.take(self.session, LastTripTracker()).accelerometer_working)
+
+
+class FakeListener:
+    def __init__(self):
+        self.notified = set()
+
+    def wait(self, timeout):
+        notified, self.notified = self.notified, set()
+        return notified
+
+
+class TestLastTripTracker(TripsTestCase):
+    def _add_trip(self, start_time):
+        self.session.execute(
+            text(
+                "INSERT INTO trips (start_accel, end_accel, start_time, end_time, is_up) "
+                "VALUES (-1, -1, :start_time, :start_time, TRUE)"
+            ),
+            {"start_time": start_time},
+        )
+
+    def test_trip_started_after_time(self):
+        tracker = LastTripTracker()
+        for time in (
+            self.last_trip - timedelta(seconds=1),
+            self.last_trip,
+            self.last_trip + timedelta(seconds=1),
+            datetime(2000, 1, 1),
+        ):
+            self.assertEqual(
+                tracker.has_trip_started_after_time(self.session, time), self._has_trip_started_after_time(time), time
+            )
+        later = self.last_trip + timedelta(minutes=1)
+        self.assertFalse(tracker.has_trip_started_after_time(self.session, later))
+        self._add_trip(later + timedelta(seconds=5))
+        self.assertTrue(tracker.has_trip_started_after_time(self.session, later))
+
+    def test_reads_again_only_after_a_notification(self):
+        listener = FakeListener()
+        tracker = LastTripTracker(listener)
+        self.assertEqual(tracker.get_last_trip_start(self.session), self.last_trip)
+
+        later = self.last_trip + timedelta(minutes=1)
+        self._add_trip(later)
+        self.assertEqual(tracker.get_last_trip_start(self.session), self.last_trip)
+        listener.notified = {common_constants.TRIPS_CHANNEL}
+        self.assertEqual(tracker.get_last_trip_start(self.session), later)
+
+        self.session.execute("DELETE FROM trips")
+        listener.notified = {common_constants.TRIPS_CHANNEL}
+        self.assertIsNone(tracker.get_last_trip_start(self.session))
+
+
+class TestStoppageScheduler(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.clock = FakeClock()
+        self.scheduler = StoppageScheduler(logging.getLogger(__name__), clock=self.clock)
+
+    def _tick_at(self, now):
+        self.clock.now = now
+        del self.calls[:]
+        return self.scheduler.tick()
+
+    def test_each_processor_runs_at_its_own_interval(self):
+        fast = FakeStoppageProcessor("fast", self.calls)
+        slow = FakeStoppageProcessor("slow", self.calls)
+        self.scheduler.add(fast, 10)
+        self.scheduler.add(slow, 25)
+
+        self.assertEqual(self._tick_at(0), ["fast", "slow"])
+        self.assertEqual(self.scheduler.seconds_until_next_run(), 10)
+        self.assertEqual(self._tick_at(5), [])
+        self.assertEqual(self._tick_at(10), ["fast"])
+        self.assertEqual(self._tick_at(20), ["fast"])
+        self.assertEqual(self.scheduler.seconds_until_next_run(), 5)
+        self.assertEqual(self._tick_at(26), ["slow"])
+        self.assertEqual(self._tick_at(31), ["fast"])
+
+    def test_runs_due_together_share_one_snapshot(self):
+        processor = FakeStoppageProcessor("low_use", self.calls)
+        other = FakeStoppageProcessor("bank", self.calls)
+        self.scheduler.add(processor, 10, name="frequent")
+        self.scheduler.add(processor, 60, run=processor.run, name="infrequent")
+        self.scheduler.add(other, 10)
+
+        with patch.object(StoppageSnapshot, "take", wraps=StoppageSnapshot.take) as take:
+            self.assertEqual(self._tick_at(0), ["frequent", "infrequent", "bank"])
+            self.assertEqual(take.call_count, 1)
+        snapshots = [snapshot for _, snapshot in self.calls]
+        self.assertIsInstance(snapshots[0], StoppageSnapshot)
+        self.assertTrue(all(snapshot is snapshots[0] for snapshot in snapshots))
+        self.assertIsNone(processor.snapshot)
+        self.assertIsNone(other.snapshot)
+
+        self._tick_at(10)
+        self.assertIsNot(self.calls[0][1], snapshots[0])
+
+    def test_a_failing_processor_does_not_stop_the_others(self):
+        self.scheduler.add(FakeStoppageProcessor("broken", self.calls, fail=True), 10)
+        self.scheduler.add(FakeStoppageProcessor("working", self.calls), 10)
+        self.assertEqual(self._tick_at(0), ["broken", "working"])
+        self.assertEqual([name for name, _ in self.calls], ["broken", "working"])
+        self.assertEqual(self._tick_at(10), ["broken", "working"])
@@ -0,0 +1,81 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from utilities.test_utilities import SessionTestCase
+
+
+class TestTripCounts(SessionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session.execute("DELETE FROM trips")
+        self.start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=10)
+        rnd = random.Random(35)
+        starts = [self.start + timedelta(seconds=rnd.randint(0, 10 * 24 * 3600)) for _ in range(500)]
+        # Trips right on the hour are where the rollup and the partial hours meet.
+        starts += [self.start + timedelta(hours=h) for h in range(0, 240, 7)]
+        self._insert_trips(starts)
+
+    def _insert_trips(self, starts):
+        self.session.execute(
+            text(
+                "INSERT INTO trips (start_accel, end_accel, start_time, end_time, is_up) "
+                "VALUES (-1, -1, :start_time, :start_time + INTERVAL '10 seconds', TRUE)"
+            ),
+            [{"start_time": start} for start in starts],
+        )
+
+    def _assert_counts_match_trips(self):
+        mismatches = self.session.execute(
+            "SELECT COUNT(*) FROM "
+            "(SELECT date_trunc('hour', start_time) AS hour, COUNT(*) AS trips, "
+            "        MIN(start_time) AS first_start_time, MAX(start_time) AS last_start_time "
+            " FROM trips GROUP BY 1) t "
+            "FULL OUTER JOIN trip_counts c ON c.hour = t.hour "
+            "WHERE c.trips IS DISTINCT FROM t.trips "
+            "OR c.first_start_time IS DISTINCT FROM t.first_start_time "
+            "OR c.last_start_time IS DISTINCT FROM t.last_start_time"
+        ).scalar()
+        self.assertEqual(mismatches, 0)
+
+    def test_counts_follow_the_trips_table(self):
+        self._assert_counts_match_trips()
+        self.session.execute(
+            "DELETE FROM trips WHERE id IN (SELECT id FROM trips ORDER BY start_time LIMIT 100 OFFSET 50)"
+        )
+        self._assert_counts_match_trips()
+        self.session.execute(
+            "UPDATE trips SET start_time = start_time + INTERVAL '25 minutes' WHERE id % 3 = 0"
+        )
+        self._assert_counts_match_trips()
+        self.session.execute("DELETE FROM trips")
+        self.assertEqual(self.session.execute("SELECT COUNT(*) FROM trip_counts").scalar(), 0)
+
+    def test_rebuild(self):
+        self.session.execute("DELETE FROM trip_counts")
+        self.session.execute("SELECT rebuild_trip_counts()")
+        self._assert_counts_match_trips()
+
+    def test_count_trips_matches_counting_trips(self):
+        rnd = random.Random(36)
+        windows = [
+            (self.start + timedelta(hours=7), self.start + timedelta(hours=14)),
+            (self.start - timedelta(days=1), self.start + timedelta(days=20)),
+        ]
+        for _ in range(50):
+            from_time = self.start + timedelta(seconds=rnd.randint(-3600, 10 * 24 * 3600))
+            windows.append((from_time, from_time + timedelta(seconds=rnd.randint(0, 4 * 24 * 3600))))
+        for from_time, to_time in windows:
+            row = self.session.execute(
+                text(
+                    "SELECT count_trips(:from_time, :to_time), "
+                    "(SELECT COUNT(*) FROM trips WHERE start_time >= :from_time AND start_time < :to_time)"
+                ),
+                {"from_time": from_time, "to_time": to_time},
+            ).fetchone()
+            self.assertEqual(row[0], row[1], "{0} - {1}".format(from_time, to_time))
+        self.assertEqual(
+            self.session.execute("SELECT count_trips('-infinity', 'infinity')").scalar(),
+            self.session.execute("SELECT COUNT(*) FROM trips").scalar(),
+        )